@@ -1,10 +1,89 @@
 # 要运行 API 服务器，可以使用以下命令：python api/main.py
 
 
-from fastapi import FastAPI, HTTPException
-from modules import inventory_management, financial_management, project_management, user_management
+import asyncio
+import os
+import anyio
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from modules import auth, cloud_storage, communication, file_previews, inventory_management, financial_management, project_management, user_management, free_busy, calendar_export, replenishment_planning
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # 补货计划每晚在后台增量重算，请求中只读取计算结果；无引用的文件 blob 定期在后台回收，存储用量每天对账一次
+    tasks = [asyncio.create_task(replenishment_planning.run_nightly()), asyncio.create_task(cloud_storage.run_garbage_collector()),
+             asyncio.create_task(cloud_storage.run_storage_reconciliation())]
+    yield
+    for task in tasks:
+        task.cancel()
+    file_previews.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+class UsageLine(BaseModel):
+    item_id: Optional[int] = None
+    barcode: Optional[str] = None
+    quantity: int = 1
+
+class UsageBatch(BaseModel):
+    lines: List[UsageLine] = Field(..., max_length=1000)
+
+class FileRangeResponse(FileResponse):
+    # 只发送文件中 [start, end] 范围内的字节，状态码为 206
+    def __init__(self, path, start, end, stat_result, **kwargs):
+        super().__init__(path, status_code=206, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class UploadSessionCreate(BaseModel):
+    name: str
+    total_size: Optional[int] = Field(None, ge=0)
+
+def current_user(authorization: Optional[str] = Header(None)):
+    """从 Authorization: Bearer <API令牌> 请求头识别调用者，不接受客户端自报的用户ID"""
+    scheme, _, token = (authorization or "").partition(" ")
+    user_id = auth.get_token_user(token.strip()) if scheme.lower() == "bearer" and token.strip() else None
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or missing API token", headers={"WWW-Authenticate": "Bearer"})
+    return user_id
+
+def admin_user(user_id: int = Depends(current_user)):
+    """只允许拥有 manage_users 权限的用户访问管理报表，与页面上的权限检查一致"""
+    if not user_management.has_permission(user_id, 'manage_users'):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return user_id
+
+def file_user(file_id: int, user_id: Optional[int] = None, expires: Optional[int] = None, signature: Optional[str] = None,
+              authorization: Optional[str] = Header(None)):
+    """下载和预览既接受 API 令牌，也接受页面生成的签名链接（浏览器直接打开时无法携带请求头）"""
+    if signature is None:
+        return current_user(authorization)
+    if user_id is None or expires is None or not cloud_storage.verify_file_url(file_id, user_id, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    return user_id
 
 @app.get("/")
 async def root():
@@ -14,10 +93,49 @@ async def root():
 async def get_inventory():
     return inventory_management.get_all_items()
 
+@app.post("/inventory/usage/batch")
+async def record_usage_batch(batch: UsageBatch, user_id: int = Depends(current_user)):
+    # 扫码工作站一次提交整批扫码结果，任一行失败则整批不生效，返回 409 及逐行结果；
+    # 领用人取自工作站登录用户的 API 令牌，请求体中不带用户ID
+    result = inventory_management.add_usage_records_batch(user_id, [line.model_dump() for line in batch.lines])
+    if not result['success']:
+        return JSONResponse(status_code=409, content=result)
+    return result
+
+@app.get("/inventory/purchase-suggestions")
+async def get_purchase_suggestions():
+    return replenishment_planning.get_purchase_suggestions()
+
 @app.get("/financial-summary")
 async def get_financial_summary():
     return financial_management.get_financial_summary()
 
+@app.get("/chat/rooms/{room_id}/messages")
+async def get_chat_messages(room_id: int, limit: int = Query(communication.CHAT_PAGE_SIZE, ge=1, le=500),
+                            before_timestamp: Optional[str] = None, before_id: Optional[int] = None,
+                            user_id: int = Depends(current_user)):
+    # 只有聊天室成员可以读取消息，非成员与聊天室不存在时同样返回 404
+    if not communication.is_room_member(room_id, user_id):
+        raise HTTPException(status_code=404, detail="Chat room not found")
+    # 不带游标时返回最新的一页；带 (before_timestamp, before_id) 时加载更早的一页
+    return communication.get_older_messages(room_id, before_timestamp, before_id, limit=limit)
+
+@app.get("/chat/search")
+async def search_chat_messages(q: str, room_id: Optional[int] = None, start_date: Optional[date] = None,
+                               end_date: Optional[date] = None, limit: int = Query(communication.CHAT_PAGE_SIZE, ge=1, le=200),
+                               offset: int = Query(0, ge=0), user_id: int = Depends(current_user)):
+    """
+    全文搜索调用者所在聊天室的消息，返回 results、has_more 和 truncated。
+
+    结果按相关度排序，但只有最近的 communication.SEARCH_RANK_WINDOW 条匹配参与排序和分页；
+    匹配超过这个数量时 truncated 为 true，更早的匹配不会出现在任何一页中，应增加关键词或限定聊天室、日期范围。
+    """
+    # 日期范围包含结束日期当天
+    return communication.search_messages(q, room_id=room_id,
+                                         start=datetime.combine(start_date, time.min) if start_date else None,
+                                         end=datetime.combine(end_date, time.min) + timedelta(days=1) if end_date else None,
+                                         limit=limit, offset=offset, user_id=user_id)
+
 @app.get("/projects")
 async def get_projects():
     return project_management.get_all_projects()
@@ -26,6 +144,147 @@ async def get_projects():
 async def get_user_activity():
     return user_management.get_user_activity()
 
+@app.get("/schedule/free-busy")
+async def get_free_busy(start_date: date, end_date: date, participants: List[str] = Query(...)):
+    return free_busy.get_free_busy(participants, datetime.combine(start_date, time.min), datetime.combine(end_date, time.min) + timedelta(days=1))
+
+@app.get("/schedule/meeting-slots")
+async def get_meeting_slots(start_date: date, end_date: date, participants: List[str] = Query(...), duration: int = 60, limit: int = 10):
+    if end_date < start_date or duration <= 0:
+        raise HTTPException(status_code=400, detail="Invalid date range or duration")
+    return free_busy.find_meeting_slots(participants, start_date, end_date, duration_minutes=duration, limit=limit)
+
+@app.get("/schedule/feeds/{token}/{scope}.ics")
+async def get_calendar_feed(token: str, scope: str, request: Request):
+    user_id = calendar_export.get_feed_user(token)
+    if user_id is None or scope not in ("user", "team"):
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+    if scope == "team":
+        if not user_management.has_permission(user_id, 'view_team_schedule'):
+            raise HTTPException(status_code=403, detail="Permission denied")
+        user_id = None
+
+    etag, last_modified = calendar_export.get_feed_validators(user_id)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if last_modified:
+        headers["Last-Modified"] = calendar_export.format_http_date(last_modified)
+    if calendar_export.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(calendar_export.iter_ics(user_id), media_type="text/calendar; charset=utf-8", headers=headers)
+
+@app.post("/files/uploads")
+async def create_upload_session(session: UploadSessionCreate, user_id: int = Depends(current_user)):
+    session_id = cloud_storage.create_upload_session(user_id, session.name, session.total_size)
+    if session_id is None:
+        # 配额不足时在接收任何数据之前拒绝
+        return JSONResponse(status_code=413, content={"detail": "Storage quota exceeded",
+                                                      **cloud_storage.get_storage_usage(user_id)})
+    return {"session_id": session_id}
+
+@app.get("/files/uploads/{session_id}")
+async def get_upload_session(session_id: str, user_id: int = Depends(current_user)):
+    session = cloud_storage.get_upload_session(session_id, user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@app.put("/files/uploads/{session_id}")
+async def upload_chunk(session_id: str, offset: int, request: Request, user_id: int = Depends(current_user)):
+    # 请求体边读边累积，超过单块上限立即拒绝，每个请求占用的内存不超过 MAX_CHUNK_SIZE
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > cloud_storage.MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+    result = cloud_storage.append_chunk(session_id, user_id, offset, bytes(data))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if result.get('quota_exceeded'):
+        return JSONResponse(status_code=413, content=result)
+    if not result['success']:
+        return JSONResponse(status_code=409, content=result)
+    return result
+
+@app.post("/files/uploads/{session_id}/complete")
+async def complete_upload(session_id: str, user_id: int = Depends(current_user)):
+    file_id = cloud_storage.complete_upload(session_id, user_id)
+    if file_id is None:
+        raise HTTPException(status_code=409, detail="Upload incomplete or session not found")
+    return {"file_id": file_id}
+
+@app.delete("/files/uploads/{session_id}")
+async def abort_upload(session_id: str, user_id: int = Depends(current_user)):
+    if not cloud_storage.abort_upload(session_id, user_id):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return {"success": True}
+
+@app.api_route("/files/{file_id}/download", methods=["GET", "HEAD"])
+async def download_file(file_id: int, request: Request, user_id: int = Depends(file_user)):
+    file = cloud_storage.get_accessible_file(file_id, user_id)
+    try:
+        stat_result = os.stat(file['path']) if file else None
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # blob 按内容哈希存放，哈希本身就是强 ETag；旧文件没有哈希时使用 FileResponse 根据文件状态生成的 ETag
+    etag = f'"{file["blob_hash"]}"' if file['blob_hash'] else None
+    if file['uploaded_at']:
+        last_modified = datetime.fromisoformat(str(file['uploaded_at'])).astimezone(timezone.utc).replace(microsecond=0)
+    else:
+        last_modified = datetime.fromtimestamp(stat_result.st_mtime, timezone.utc).replace(microsecond=0)
+    headers = {"Accept-Ranges": "bytes", "Last-Modified": calendar_export.format_http_date(last_modified)}
+    if etag:
+        headers["ETag"] = etag
+    if calendar_export.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        # 客户端持有的版本已过期，返回完整文件
+        range_header = None
+    try:
+        byte_range = cloud_storage.parse_range(range_header, stat_result.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{stat_result.st_size}"})
+    if byte_range is None:
+        return FileResponse(file['path'], filename=file['name'], headers=headers, stat_result=stat_result)
+    return FileRangeResponse(file['path'], *byte_range, stat_result, filename=file['name'], headers=headers)
+
+@app.get("/files/{file_id}/preview")
+async def get_file_preview(file_id: int, user_id: int = Depends(file_user)):
+    file = cloud_storage.get_accessible_file(file_id, user_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    preview = file_previews.get_preview(file['blob_hash'], file['path'], file['name'])
+    if preview['status'] == 'unsupported':
+        raise HTTPException(status_code=404, detail="Preview not available")
+    if preview['status'] != 'ready':
+        # 预览尚在后台生成时返回 202，客户端稍后重试
+        return JSONResponse(status_code=202 if preview['status'] == 'pending' else 422, content=preview)
+    if 'path' in preview:
+        return FileResponse(preview['path'], media_type="image/png", headers={"ETag": f'"{file["blob_hash"]}-preview"', "Cache-Control": "private, max-age=86400"})
+    return preview
+
+@app.get("/files/shared-with-me")
+async def list_shared_with_me(limit: int = Query(cloud_storage.SHARED_PAGE_SIZE, ge=1, le=500), before_id: Optional[int] = None,
+                              user_id: int = Depends(current_user)):
+    return cloud_storage.list_shared_with_me(user_id, limit=limit, before_id=before_id)
+
+@app.get("/files/dedup-report")
+async def get_dedup_report(user_id: int = Depends(admin_user)):
+    return cloud_storage.get_dedup_report()
+
+@app.get("/files/storage-usage")
+async def get_storage_usage(user_id: int = Depends(current_user)):
+    return cloud_storage.get_storage_usage(user_id)
+
+@app.get("/files/storage-report")
+async def get_storage_report(user_id: int = Depends(admin_user)):
+    return cloud_storage.get_storage_report()
+
 # 可以根据需要添加更多的 API 端点
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+# benchmarks/bench_broadcast.py
+"""
+WebSocket 广播延迟性能测试
+
+用 2000 个模拟客户端比较逐个 await 发送（旧的 broadcast 实现）与按连接队列并发发送的消息延迟。
+其中一小部分客户端是慢客户端（每次发送耗时 SLOW_SEND_SECONDS），用于观察慢客户端对其他客户端的影响。
+延迟从调用广播开始计算，到该客户端的 send 完成为止，只统计正常客户端。
+
+运行方式：python benchmarks/bench_broadcast.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import real_time_collaboration
+
+CLIENTS = 2000
+SLOW_CLIENTS = 20
+MESSAGES = 20
+FAST_SEND_SECONDS = 0.0005
+SLOW_SEND_SECONDS = 0.05
+
+
+class SimulatedWebSocket:
+    """模拟的 WebSocket 连接，send 的耗时代表网络写入，记录每条消息的送达时间"""
+
+    def __init__(self, send_seconds):
+        self.send_seconds = send_seconds
+        self.received = {}
+
+    async def send(self, message):
+        await asyncio.sleep(self.send_seconds)
+        self.received[message] = time.perf_counter()
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def make_sockets():
+    return [SimulatedWebSocket(SLOW_SEND_SECONDS if i < SLOW_CLIENTS else FAST_SEND_SECONDS) for i in range(CLIENTS)]
+
+
+def latencies(sockets, sent_at):
+    return [socket.received[message] - start for socket in sockets[SLOW_CLIENTS:]
+            for message, start in sent_at.items() if message in socket.received]
+
+
+async def bench_sequential():
+    sockets = make_sockets()
+    sent_at = {}
+    for i in range(MESSAGES):
+        message = f"message {i}"
+        sent_at[message] = time.perf_counter()
+        for socket in sockets:
+            await socket.send(message)
+    return latencies(sockets, sent_at), 0
+
+
+async def bench_queued():
+    sockets = make_sockets()
+    clients = [real_time_collaboration.register(socket) for socket in sockets]
+    sent_at = {}
+    for i in range(MESSAGES):
+        message = f"message {i}"
+        sent_at[message] = time.perf_counter()
+        await real_time_collaboration.broadcast(message)
+        await asyncio.sleep(0.01)
+    # 等待正常客户端收完所有消息
+    while any(len(socket.received) < MESSAGES for socket in sockets[SLOW_CLIENTS:]):
+        await asyncio.sleep(0.01)
+    dropped = sum(client.dropped for client in clients)
+    for socket in sockets:
+        await real_time_collaboration.unregister(socket)
+    return latencies(sockets, sent_at), dropped
+
+
+def report(name, values, dropped):
+    values = sorted(values)
+    p99 = values[int(len(values) * 0.99) - 1]
+    print(f"{name}: 中位数 {statistics.median(values) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+          f"最大 {values[-1] * 1000:.1f} ms, 丢弃 {dropped} 条")
+
+
+def main():
+    print(f"{CLIENTS} 个客户端（其中 {SLOW_CLIENTS} 个慢客户端），广播 {MESSAGES} 条消息")
+    report("逐个发送", *asyncio.run(bench_sequential()))
+    report("队列并发发送", *asyncio.run(bench_queued()))
+
+
+if __name__ == "__main__":
+    main()
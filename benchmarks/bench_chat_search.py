@@ -0,0 +1,93 @@
+# benchmarks/bench_chat_search.py
+"""
+聊天消息全文搜索性能测试
+
+在临时目录的数据库中生成指定数量的中英文混合聊天消息（写入时由触发器建立全文索引），
+然后测量不同类型搜索词的查询耗时：常见词、少见词、多关键词、带聊天室和时间过滤的查询、翻页，
+以及少于3个字符、由二字符片段索引查找的短关键词（常见、少见和没有匹配）。
+
+运行方式：python benchmarks/bench_chat_search.py [消息数量]，默认为1000000
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 在 Streamlit 之外访问数据库，关闭其运行时警告
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+from utils import database
+from modules import communication
+
+ROOMS = 50
+USERS = 200
+REPEAT = 20
+BATCH_SIZE = 50000
+
+WORDS = ["实验", "样品", "离心机", "培养箱", "数据", "分析", "明天", "组会", "报告", "试剂", "订购", "预约",
+         "显微镜", "结果", "论文", "修改", "已经", "完成", "请", "检查", "温度", "细胞", "PCR", "buffer",
+         "protocol", "meeting", "sample", "results", "deadline", "gel", "western", "blot", "今天", "下午"]
+RARE_WORDS = ["超速离心转子", "液氮罐补充", "cryostat"]
+
+
+def generate(count):
+    random.seed(0)
+    start = datetime(2020, 1, 1)
+    step = timedelta(days=5 * 365) / count
+    for i in range(count):
+        words = random.choices(WORDS, k=random.randint(4, 12))
+        if random.random() < 0.0005:
+            words.insert(random.randrange(len(words)), random.choice(RARE_WORDS))
+        yield (random.randint(1, ROOMS), random.randint(1, USERS), " ".join(words),
+               (start + step * i).strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def measure(label, **kwargs):
+    timings = []
+    for _ in range(REPEAT):
+        begin = time.perf_counter()
+        result = communication.search_messages(**kwargs)
+        timings.append((time.perf_counter() - begin) * 1000)
+    print(f"{label:<24} 中位数 {statistics.median(timings):7.2f} ms  最大 {max(timings):7.2f} ms  "
+          f"结果 {len(result['results'])} 条{'（还有更多）' if result['has_more'] else ''}", flush=True)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        database.init_db()
+        conn = database.get_connection()
+        conn.executemany("INSERT INTO users (id, username) VALUES (?, ?)", [(i, f"user{i}") for i in range(1, USERS + 1)])
+        begin = time.perf_counter()
+        batch = []
+        for row in generate(count):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                communication.save_messages(batch)
+                batch = []
+        communication.save_messages(batch)
+        print(f"写入 {count:,} 条消息（含全文索引）耗时 {time.perf_counter() - begin:.1f} 秒，"
+              f"数据库大小 {os.path.getsize('lab_management.db') / 2 ** 20:.0f} MB", flush=True)
+
+        measure("常见词", query="离心机")
+        measure("少见词", query="超速离心转子")
+        measure("多关键词", query="显微镜 protocol")
+        measure("聊天室过滤", query="培养箱", room_id=7)
+        measure("时间过滤", query="western", start="2023-01-01", end="2023-02-01")
+        measure("第10页", query="离心机", offset=450)
+        measure("短关键词", query="组会")
+        measure("短关键词+聊天室", query="组会", room_id=7)
+        measure("少见短关键词", query="液氮")
+        measure("无匹配短关键词", query="转速")
+        measure("无匹配", query="不存在的词")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_citation_graph.py
+"""
+引用网络查询性能测试
+
+在临时目录的数据库中生成一个引用网络（N 篇文献，每篇引用 REFERENCES_PER_PAPER 篇更早的文献，
+被引次数呈长尾分布），比较两种实现：
+1. 直接在 citations 表上用 SQL 自连接计算共被引、文献耦合和 2 跳邻域
+2. citation_graph 模块在内存 CSR 矩阵上的向量化查询（另外报告第一次加载矩阵的耗时）
+
+运行方式：python benchmarks/bench_citation_graph.py [文献数量]，默认为100000
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 在 Streamlit 之外访问数据库，关闭其运行时警告
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+from utils import database
+from modules import citation_graph
+
+REFERENCES_PER_PAPER = 20
+QUERIES = 50
+
+CO_CITATION_SQL = """
+    SELECT b.cited_id, COUNT(*) AS shared FROM citations a JOIN citations b ON b.citing_id = a.citing_id
+    WHERE a.cited_id = ? AND b.cited_id != ? GROUP BY b.cited_id ORDER BY shared DESC LIMIT 20
+"""
+COUPLING_SQL = """
+    SELECT b.citing_id, COUNT(*) AS shared FROM citations a JOIN citations b ON b.cited_id = a.cited_id
+    WHERE a.citing_id = ? AND b.citing_id != ? GROUP BY b.citing_id ORDER BY shared DESC LIMIT 20
+"""
+TWO_HOP_SQL = """
+    WITH hop1 AS (SELECT cited_id AS id FROM citations WHERE citing_id = ?
+                  UNION SELECT citing_id FROM citations WHERE cited_id = ?)
+    SELECT id FROM hop1
+    UNION SELECT cited_id FROM citations WHERE citing_id IN (SELECT id FROM hop1)
+    UNION SELECT citing_id FROM citations WHERE cited_id IN (SELECT id FROM hop1)
+"""
+
+
+def generate(count):
+    rng = np.random.default_rng(0)
+    for citing in range(REFERENCES_PER_PAPER + 1, count + 1):
+        # 偏好引用较早、较多被引的文献：被引文献的位置按幂律分布
+        cited = np.unique((citing - 1) * rng.power(0.3, REFERENCES_PER_PAPER)).astype(np.int64) + 1
+        yield from ((citing, int(c)) for c in cited if c != citing)
+
+
+def timed(label, function, ids):
+    timings = []
+    for literature_id in ids:
+        begin = time.perf_counter()
+        function(literature_id)
+        timings.append((time.perf_counter() - begin) * 1000)
+    print(f"{label:<28} 中位数 {statistics.median(timings):8.2f} ms  最大 {max(timings):8.2f} ms", flush=True)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        database.init_db()
+        conn = database.get_connection()
+        conn.executemany("INSERT OR IGNORE INTO citations (citing_id, cited_id) VALUES (?, ?)", generate(count))
+        conn.commit()
+        edges = conn.execute("SELECT COUNT(*) FROM citations").fetchone()[0]
+        print(f"{count:,} 篇文献，{edges:,} 条引用关系", flush=True)
+
+        # 查询的文献：一半是高被引的早期文献，一半随机
+        rng = np.random.default_rng(1)
+        ids = np.concatenate([rng.integers(1, 200, QUERIES // 2), rng.integers(1, count, QUERIES // 2)]).tolist()
+
+        begin = time.perf_counter()
+        citation_graph.get_graph()
+        print(f"加载 CSR 矩阵 {(time.perf_counter() - begin) * 1000:.0f} ms", flush=True)
+
+        timed("共被引 (SQL 自连接)", lambda i: conn.execute(CO_CITATION_SQL, (i, i)).fetchall(), ids)
+        timed("共被引 (CSR)", citation_graph.get_co_cited, ids)
+        timed("文献耦合 (SQL 自连接)", lambda i: conn.execute(COUPLING_SQL, (i, i)).fetchall(), ids)
+        timed("文献耦合 (CSR)", citation_graph.get_coupled, ids)
+        timed("2 跳邻域 (SQL)", lambda i: conn.execute(TWO_HOP_SQL, (i, i)).fetchall(), ids[QUERIES // 2:])
+        timed("2 跳邻域 (CSR)", lambda i: citation_graph.get_neighbourhood(i, 2), ids[QUERIES // 2:])
+
+
+if __name__ == "__main__":
+    main()
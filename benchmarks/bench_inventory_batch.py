@@ -0,0 +1,69 @@
+# benchmarks/bench_inventory_batch.py
+"""
+批量扫码记录性能测试
+
+比较逐条调用 add_usage_record 与一次提交整批扫码（add_usage_records_batch）的吞吐量，
+以每秒记录的扫码次数计。使用临时目录中的独立数据库文件，不影响 lab_management.db。
+
+运行方式：python benchmarks/bench_inventory_batch.py
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import database
+from modules import inventory_management
+
+ITEMS = 500
+SCANS = 20000
+BATCH_SIZE = 100
+
+
+def setup_database(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    database.get_connection = lambda: conn
+    database.init_db()
+    conn.executemany(
+        "INSERT INTO inventory_items (name, category, quantity, unit, version, barcode) VALUES (?, '耗材', ?, '个', 0, ?)",
+        [(f"耗材{i}", 10 ** 9, f"690{i:010d}") for i in range(ITEMS)],
+    )
+    conn.commit()
+    return conn
+
+
+def bench_single(scans):
+    start = time.perf_counter()
+    for line in scans:
+        inventory_management.add_usage_record(1, line["item_id"], line["quantity"])
+    return len(scans) / (time.perf_counter() - start)
+
+
+def bench_batch(scans):
+    start = time.perf_counter()
+    for i in range(0, len(scans), BATCH_SIZE):
+        result = inventory_management.add_usage_records_batch(1, scans[i:i + BATCH_SIZE])
+        assert result["success"]
+    return len(scans) / (time.perf_counter() - start)
+
+
+def main():
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, "bench.db"))
+        single_scans = [{"item_id": random.randint(1, ITEMS), "quantity": 1} for _ in range(SCANS // 10)]
+        batch_scans = [{"barcode": f"690{random.randrange(ITEMS):010d}", "quantity": 1} for _ in range(SCANS)]
+        single_rate = bench_single(single_scans)
+        batch_rate = bench_batch(batch_scans)
+    print(f"逐条记录: {single_rate:,.0f} 次扫码/秒")
+    print(f"批量记录 (每批 {BATCH_SIZE} 条): {batch_rate:,.0f} 次扫码/秒")
+    print(f"加速比: {batch_rate / single_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
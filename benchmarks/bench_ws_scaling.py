@@ -0,0 +1,147 @@
+# benchmarks/bench_ws_scaling.py
+"""
+多进程 WebSocket 聊天服务器吞吐量测试
+
+分别以 1 个和 N 个工作进程（SO_REUSEPORT 共享端口，消息经本地总线在进程间转发）运行聊天服务器，
+由多个负载进程建立连接、加入聊天室并发送消息，以每秒送达客户端的消息数衡量吞吐量。
+服务器对慢客户端会丢弃积压的消息，因此负载进程在收齐所有消息或 IDLE_SECONDS 秒内没有新消息时结束，
+同时报告送达比例。服务器的数据库位于临时目录中，不影响 lab_management.db。
+
+运行方式：python benchmarks/bench_ws_scaling.py [工作进程数]，默认为CPU核数
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 工作进程在 Streamlit 之外访问数据库，关闭其运行时警告
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+from utils import database
+from modules import auth, communication, real_time_collaboration
+
+PORT = 8790
+ROOMS = 10
+LOAD_PROCESSES = 4
+CONNECTIONS_PER_PROCESS = 50
+MESSAGES_PER_CONNECTION = 10
+IDLE_SECONDS = 2
+
+
+async def load_client(index, token, ready, start, finished, counts):
+    import websockets
+    room_id = index % ROOMS + 1
+    async with websockets.connect(f"ws://localhost:{PORT}") as websocket:
+        await websocket.send(json.dumps({"type": "join", "room_id": room_id, "token": token}))
+        await websocket.recv()
+        ready.append(index)
+        await start.wait()
+
+        async def receive():
+            # 只统计聊天消息，不计入在线状态等其他消息
+            async for message in websocket:
+                if json.loads(message).get("type") == "chat":
+                    counts[0] += 1
+
+        receiver = asyncio.create_task(receive())
+        for i in range(MESSAGES_PER_CONNECTION):
+            await websocket.send(json.dumps({"type": "chat", "room_id": room_id, "message": f"{index}-{i}"}))
+            await asyncio.sleep(0)
+        await finished.wait()
+        receiver.cancel()
+
+
+def load_process(offset, token, expected, barrier, result):
+    async def main():
+        ready = []
+        start = asyncio.Event()
+        finished = asyncio.Event()
+        counts = [0]
+        tasks = [asyncio.create_task(load_client(offset + i, token, ready, start, finished, counts)) for i in range(CONNECTIONS_PER_PROCESS)]
+        while len(ready) < CONNECTIONS_PER_PROCESS:
+            await asyncio.sleep(0.01)
+        await asyncio.to_thread(barrier.wait)
+        start.set()
+        last_count, last_change = 0, time.perf_counter()
+        while counts[0] < expected and time.perf_counter() - last_change < IDLE_SECONDS:
+            await asyncio.sleep(0.01)
+            if counts[0] != last_count:
+                last_count, last_change = counts[0], time.perf_counter()
+        result.put((last_change, counts[0]))
+        finished.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("localhost", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError("服务器没有启动")
+
+
+def run_server(workers, bus_path):
+    asyncio.run(real_time_collaboration.serve_workers(workers, "localhost", PORT, bus_path))
+
+
+def bench(workers, tmp, token):
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(target=run_server, args=(workers, os.path.join(tmp, f"bus{workers}.sock")))
+    server.start()
+    wait_for_port(PORT)
+    # 等待所有工作进程开始监听
+    time.sleep(workers)
+
+    total_connections = LOAD_PROCESSES * CONNECTIONS_PER_PROCESS
+    subscribers_per_room = total_connections // ROOMS
+    # 每个连接收到自己聊天室中所有连接发送的消息
+    expected = subscribers_per_room * MESSAGES_PER_CONNECTION * CONNECTIONS_PER_PROCESS
+    barrier = context.Barrier(LOAD_PROCESSES + 1)
+    result = context.Queue()
+    loaders = [context.Process(target=load_process, args=(i * CONNECTIONS_PER_PROCESS, token, expected, barrier, result))
+               for i in range(LOAD_PROCESSES)]
+    for loader in loaders:
+        loader.start()
+    barrier.wait()
+    start = time.perf_counter()
+    results = [result.get() for _ in loaders]
+    for loader in loaders:
+        loader.join()
+    server.terminate()
+    server.join()
+    delivered = sum(count for _, count in results)
+    return delivered / (max(finished for finished, _ in results) - start), delivered / (expected * LOAD_PROCESSES)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        database.init_db()
+        # 所有负载连接以同一个用户的 API 令牌加入聊天室，该用户是所有聊天室的成员
+        database.get_connection().execute("INSERT INTO users (id, username) VALUES (1, 'bench')")
+        database.get_connection().commit()
+        for room in range(ROOMS):
+            communication.create_chat_room(f"room{room}", 1)
+        token = auth.get_api_token(1)
+        print(f"CPU 核数: {os.cpu_count()}，{LOAD_PROCESSES * CONNECTIONS_PER_PROCESS} 个连接，{ROOMS} 个聊天室", flush=True)
+        single, ratio = bench(1, tmp, token)
+        print(f"1 个工作进程: {single:,.0f} 条消息/秒，送达 {ratio:.1%}", flush=True)
+        if workers > 1:
+            multi, ratio = bench(workers, tmp, token)
+            print(f"{workers} 个工作进程: {multi:,.0f} 条消息/秒，送达 {ratio:.1%}，加速比 {multi / single:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
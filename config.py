@@ -0,0 +1,7 @@
+# config.py
+
+# API 服务对外访问的地址，用于生成日历订阅链接等
+API_BASE_URL = "http://localhost:8000"
+
+# 实时协作 WebSocket 服务器的地址
+COLLABORATION_WS_URL = "ws://localhost:8765"
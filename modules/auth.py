@@ -7,6 +7,7 @@
 3. 用户注销：结束用户会话
 4. 用户信息获取：根据用户ID检索用户信息
 5. 权限控制：通过用户角色实现基本的权限管理
+6. API 令牌：每个用户一个随机令牌，API 服务据此识别调用者，不信任客户端自报的用户ID
 
 未来计划：
 - 实现更复杂的权限控制系统
@@ -71,4 +72,43 @@ def get_user(user_id):
             'email': user[2],
             'role': user[3]
         }
-    return None
\ No newline at end of file
+    return None
+
+def get_api_token(user_id, create=True):
+    """
+    获取用户的 API 令牌，不存在时创建。
+
+    参数:
+    user_id (int): 用户ID
+    create (bool): 为False时只查询，不创建新令牌
+
+    返回:
+    str: API 令牌，create为False且用户还没有令牌时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute("SELECT token FROM api_tokens WHERE user_id = ?", (user_id,))
+        result = c.fetchone()
+        if result or not create:
+            return result[0] if result else None
+        token = security.generate_token()
+        c.execute("INSERT INTO api_tokens (token, user_id) VALUES (?, ?)", (token, user_id))
+        conn.commit()
+    return token
+
+def get_token_user(token):
+    """
+    根据 API 令牌获取用户ID。
+
+    参数:
+    token (str): API 令牌
+
+    返回:
+    int: 用户ID，令牌无效时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT user_id FROM api_tokens WHERE token = ?", (token,))
+    result = c.fetchone()
+    return result[0] if result else None
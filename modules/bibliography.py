@@ -0,0 +1,364 @@
+# modules/bibliography.py
+"""
+文献题录解析模块
+
+这个模块解析 Zotero、EndNote 等文献管理软件导出的 BibTeX 和 RIS 文件，供 literature_management 批量导入使用，
+也可以从纯文本的参考文献列表中提取 DOI（供 citation_graph 导入引用关系），并提供去重用的 DOI 规范化和标题指纹函数。
+
+设计思路:
+1. 解析器是生成器，按行读取输入，每解析完一条题录就产出一条，不需要把整个文件读入内存
+2. 每条题录转换为与 literature 表对应的字典：'title'、'authors'、'journal'、'year'、'doi'、'notes'，
+   另带 'line'（题录在文件中的起始行号），用于导入报告
+3. 作者统一为 "名 姓" 形式并用逗号分隔，与页面上手工录入的格式一致；
+   BibTeX 中常见的 LaTeX 重音命令（如 {\"u}）转换为对应的 Unicode 字符
+"""
+
+import hashlib
+import itertools
+import re
+import unicodedata
+
+# DOI 的常见前缀（链接形式或 "doi:"）以及规范化后应满足的格式
+_DOI_PREFIX = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+_DOI = re.compile(r'^10\.\d{4,9}/\S+$')
+
+# 标题指纹中去掉的 ASCII 字符
+_NON_ALNUM_ASCII = re.compile(r'[^0-9A-Za-z]+')
+
+# LaTeX 重音命令对应的 Unicode 组合字符
+_LATEX_ACCENTS = {"'": '\u0301', '`': '\u0300', '^': '\u0302', '"': '\u0308', '~': '\u0303',
+                  '=': '\u0304', '.': '\u0307', 'c': '\u0327', 'v': '\u030c', 'u': '\u0306', 'H': '\u030b'}
+_LATEX_ACCENT = re.compile(r'\\([\'`^"~=.]|[cvuH](?=[\s{]))\s*(?:\{(\w)\}|(\w))')
+_LATEX_SPECIAL = {'ss': 'ß', 'o': 'ø', 'O': 'Ø', 'ae': 'æ', 'AE': 'Æ', 'aa': 'å', 'AA': 'Å', 'l': 'ł', 'L': 'Ł', 'i': 'ı'}
+_LATEX_SPECIAL_COMMAND = re.compile(r'\\(' + '|'.join(_LATEX_SPECIAL) + r')(?![a-zA-Z])\s*')
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+\s*')
+
+# BibTeX 内置的月份宏
+_BIBTEX_MONTHS = {m: str(i) for i, m in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+# BibTeX 条目的开头，如 "@article{"；出现在行首时一定是新条目的开始
+_BIBTEX_START = re.compile(r'@\s*\w+\s*([{(])')
+_BIBTEX_LINE_START = re.compile(r'\s*@\s*\w+\s*[{(]')
+_BIBTEX_DELIMITERS = {'{': re.compile(r'[{}]'), '(': re.compile(r'[()]')}
+_BIBTEX_FIELD = re.compile(r'\s*,?\s*([^\s=,{}"#]+)\s*=')
+_BIBTEX_WORD = re.compile(r'[^\s,#{}"]+')
+
+# 纯文本中的 DOI
+_DOI_IN_TEXT = re.compile(r'10\.\d{4,9}/[^\s"<>]+')
+
+# RIS 的一行：两个字符的标签、两个空格、连字符，后面是值
+_RIS_LINE = re.compile(r'^([A-Z][A-Z0-9])  -(?: (.*))?$')
+
+def normalize_doi(doi):
+    """
+    规范化 DOI：去掉链接或 "doi:" 前缀、空白和末尾的标点，并转为小写（DOI 不区分大小写）。
+
+    参数:
+    doi (str): 原始 DOI，可以为None
+
+    返回:
+    str: 规范化后的 DOI，不是有效的 DOI 时返回None
+    """
+    if not doi:
+        return None
+    doi = _DOI_PREFIX.sub('', doi.strip()).strip().rstrip('.,;').lower()
+    return doi if _DOI.match(doi) else None
+
+def title_hash(title):
+    """
+    计算标题指纹，用于找出同一篇文献的不同录入。
+
+    标题经过 Unicode 规范化、去掉重音和大小写、去掉所有标点和空白后再取哈希，
+    因此只有大小写、标点、LaTeX 花括号或重音写法不同的标题得到相同的指纹。
+
+    参数:
+    title (str): 标题
+
+    返回:
+    str: 16位十六进制指纹，标题为空时返回None
+    """
+    if not title:
+        return None
+    if title.isascii():
+        text = _NON_ALNUM_ASCII.sub('', title).lower()
+    else:
+        text = unicodedata.normalize('NFKD', title)
+        text = ''.join(ch for ch in text if ch.isalnum() and not unicodedata.combining(ch)).casefold()
+    if not text:
+        return None
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def _latex_to_text(value):
+    """把 BibTeX 字段值中的 LaTeX 写法转换为纯文本"""
+    if '\\' not in value and '{' not in value and '~' not in value:
+        return ' '.join(value.split())
+    value = _LATEX_ACCENT.sub(lambda m: (m.group(2) or m.group(3)) + _LATEX_ACCENTS[m.group(1)], value)
+    value = _LATEX_SPECIAL_COMMAND.sub(lambda m: _LATEX_SPECIAL[m.group(1)], value)
+    value = re.sub(r'\\([&%$#_{}])', r'\1', value)
+    value = _LATEX_COMMAND.sub('', value)
+    value = value.replace('{', '').replace('}', '').replace('~', ' ')
+    return unicodedata.normalize('NFC', ' '.join(value.split()))
+
+def _format_name(name):
+    """把 "姓, 名" 或 "姓, Jr, 名" 形式的姓名转换为 "名 姓" 形式"""
+    parts = [part.strip() for part in name.split(',')]
+    if len(parts) == 2:
+        return f"{parts[1]} {parts[0]}".strip()
+    if len(parts) == 3:
+        return f"{parts[2]} {parts[0]} {parts[1]}".strip()
+    return name.strip()
+
+def _split_bibtex_authors(value):
+    """按顶层（不在花括号内）的 "and" 拆分 BibTeX 作者列表"""
+    names = []
+    depth = 0
+    start = 0
+    for match in re.finditer(r'[{}]|\s+and\s+', value, re.IGNORECASE):
+        token = match.group(0)
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+        elif depth == 0:
+            names.append(value[start:match.start()])
+            start = match.end()
+    names.append(value[start:])
+    return [name for name in names if name.strip()]
+
+def _parse_year(value):
+    """从年份或日期字段中取出四位数的年份"""
+    match = re.search(r'\d{4}', value or '')
+    return int(match.group(0)) if match else None
+
+def _read_bibtex_value(text, pos, macros):
+    """从 pos 开始读取一个字段值（可以是用 # 连接的多段），返回 (值, 结束位置)"""
+    parts = []
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            break
+        if text[pos] in '{"':
+            # 花括号或引号括起的值，内部的花括号必须配对
+            closing = '}' if text[pos] == '{' else '"'
+            depth = 0
+            pos += 1
+            start = pos
+            while pos < len(text):
+                ch = text[pos]
+                if ch == '\\':
+                    pos += 2
+                    continue
+                if ch == closing and depth == 0:
+                    break
+                if ch == '{':
+                    depth += 1
+                elif ch == '}':
+                    depth -= 1
+                pos += 1
+            parts.append(text[start:pos])
+            pos += 1
+        else:
+            # 数字或 @string 定义的宏名
+            match = _BIBTEX_WORD.match(text, pos)
+            if not match:
+                break
+            word = match.group(0)
+            parts.append(word if word.isdigit() else macros.get(word.lower(), word))
+            pos = match.end()
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos < len(text) and text[pos] == '#':
+            pos += 1
+            continue
+        break
+    return ''.join(parts), pos
+
+def _parse_bibtex_fields(body, macros):
+    """解析 "名称 = 值, ..." 形式的字段列表，返回 {小写字段名: 原始值}"""
+    fields = {}
+    pos = 0
+    while True:
+        match = _BIBTEX_FIELD.match(body, pos)
+        if not match:
+            return fields
+        value, pos = _read_bibtex_value(body, match.end(), macros)
+        fields[match.group(1).lower()] = value
+
+def _bibtex_entry(text, line, macros):
+    """把一条完整的 BibTeX 条目转换为题录字典，@string 定义写入 macros，其他非题录条目返回None"""
+    match = re.match(r'@\s*(\w+)\s*[{(]', text)
+    if not match:
+        return None
+    entry_type = match.group(1).lower()
+    body = text[match.end():-1]
+    if entry_type == 'string':
+        macros.update({name: _latex_to_text(value) for name, value in _parse_bibtex_fields(body, macros).items()})
+        return None
+    if entry_type in ('comment', 'preamble'):
+        return None
+    # 跳过引用键
+    key_end = body.find(',')
+    fields = _parse_bibtex_fields(body[key_end + 1:] if key_end >= 0 else '', macros)
+    authors = fields.get('author') or fields.get('editor') or ''
+    notes = [_latex_to_text(fields[name]) for name in ('note', 'annote') if fields.get(name)]
+    return {'line': line,
+            'title': _latex_to_text(fields.get('title', '')),
+            'authors': ', '.join(_format_name(_latex_to_text(name)) for name in _split_bibtex_authors(authors)),
+            'journal': _latex_to_text(fields.get('journal') or fields.get('booktitle') or fields.get('publisher') or ''),
+            'year': _parse_year(fields.get('year') or fields.get('date')),
+            'doi': _latex_to_text(fields.get('doi', '')),
+            'notes': '\n'.join(notes)}
+
+def parse_bibtex(lines, errors=None):
+    """
+    流式解析 BibTeX 文件
+
+    条目可以跨多行，按花括号（或圆括号）配对判断条目结束；@string 定义的宏会被展开，
+    @comment 和 @preamble 被忽略，条目之外的文字也被忽略。
+    括号不配对的条目不会吞掉后面的条目：条目内部出现以 "@类型{" 开头的行时，视为上一条目已损坏、新条目开始；
+    损坏的条目和文件结束时仍未结束的条目被跳过，并记入 errors。
+
+    参数:
+    lines (iterable): 文本行，例如以文本模式打开的文件
+    errors (list): 记录无法解析的条目，每条包含'line'（条目的起始行号）和'reason'，默认为None（不记录）
+
+    返回:
+    generator: 逐条产出题录字典
+    """
+    macros = dict(_BIBTEX_MONTHS)
+    buffer = None
+    for number, line in enumerate(lines, 1):
+        pos = 0
+        if buffer is not None and _BIBTEX_LINE_START.match(line):
+            if errors is not None:
+                errors.append({'line': start_line, 'reason': f"条目的括号不配对，在第 {number} 行遇到下一个条目，已跳过"})
+            buffer = None
+        while pos < len(line):
+            if buffer is None:
+                # 在条目之外，寻找下一个 "@类型{" 或 "@类型("
+                match = _BIBTEX_START.search(line, pos)
+                if not match:
+                    break
+                opener = match.group(1)
+                closer = '}' if opener == '{' else ')'
+                buffer, depth, start_line = [], 1, number
+                segment_start, pos = match.start(), match.end()
+            else:
+                segment_start = pos
+            for delimiter in _BIBTEX_DELIMITERS[opener].finditer(line, pos):
+                depth += 1 if delimiter.group(0) == opener else -1
+                if depth == 0:
+                    pos = delimiter.end()
+                    break
+            else:
+                pos = len(line)
+            buffer.append(line[segment_start:pos])
+            if depth == 0:
+                entry = _bibtex_entry(''.join(buffer), start_line, macros)
+                buffer = None
+                if entry is not None:
+                    yield entry
+    if buffer is not None and errors is not None:
+        errors.append({'line': start_line, 'reason': "条目的括号不配对，到文件结束仍未结束，已跳过"})
+
+def parse_ris(lines):
+    """
+    流式解析 RIS 文件
+
+    每条题录以 TY 行开始、以 ER 行结束；不以 "XX  - " 开头的行是上一个字段的续行。
+
+    参数:
+    lines (iterable): 文本行
+
+    返回:
+    generator: 逐条产出题录字典
+    """
+    record = None
+    last_tag = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        match = _RIS_LINE.match(line.lstrip('\ufeff'))
+        if not match:
+            if record is not None and last_tag and line.strip():
+                record[last_tag][-1] += ' ' + line.strip()
+            continue
+        tag, value = match.group(1), (match.group(2) or '').strip()
+        if tag == 'TY':
+            record = {'line': number}
+            last_tag = None
+        elif record is None:
+            continue
+        elif tag == 'ER':
+            yield _ris_record(record)
+            record = None
+        else:
+            record.setdefault(tag, []).append(value)
+            last_tag = tag
+
+def _ris_record(record):
+    """把 RIS 标签字典转换为题录字典"""
+    def first(*tags):
+        for tag in tags:
+            if record.get(tag) and record[tag][0]:
+                return record[tag][0]
+        return ''
+
+    authors = [name for tag in ('AU', 'A1') for name in record.get(tag, ()) if name]
+    return {'line': record['line'],
+            'title': ' '.join(first('TI', 'T1', 'CT').split()),
+            'authors': ', '.join(_format_name(name) for name in authors),
+            'journal': first('JO', 'JF', 'T2', 'JA', 'J2', 'BT'),
+            'year': _parse_year(first('PY', 'Y1', 'DA')),
+            'doi': first('DO'),
+            'notes': '\n'.join(record.get('N1', []))}
+
+def parse_text_references(lines):
+    """
+    解析纯文本的参考文献列表，例如从论文中复制的参考文献，每行一条
+
+    只提取每行中的第一个 DOI，没有 DOI 的行产出空 DOI，'title' 为该行的原文，供报告使用。
+
+    参数:
+    lines (iterable): 文本行
+
+    返回:
+    generator: 逐条产出题录字典
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip().lstrip('\ufeff')
+        if not line:
+            continue
+        match = _DOI_IN_TEXT.search(line)
+        yield {'line': number, 'title': line, 'authors': '', 'journal': '', 'year': None,
+               'doi': match.group(0) if match else '', 'notes': ''}
+
+def parse(lines, fmt=None, errors=None):
+    """
+    解析 BibTeX 或 RIS 文件
+
+    参数:
+    lines (iterable): 文本行
+    fmt (str): 'bibtex'、'ris' 或 'text'（纯文本参考文献列表），为None时根据第一行非空内容判断是 RIS 还是 BibTeX
+    errors (list): 记录无法解析的条目（目前只有 BibTeX 会记录），见 parse_bibtex
+
+    返回:
+    generator: 逐条产出题录字典
+    """
+    lines = iter(lines)
+    if fmt is None:
+        head = []
+        for line in lines:
+            head.append(line)
+            if line.strip():
+                break
+        fmt = 'ris' if head and _RIS_LINE.match(head[-1].strip('\ufeff\r\n')) else 'bibtex'
+        lines = itertools.chain(head, lines)
+    if fmt == 'ris':
+        return parse_ris(lines)
+    if fmt == 'bibtex':
+        return parse_bibtex(lines, errors)
+    if fmt == 'text':
+        return parse_text_references(lines)
+    raise ValueError(f"不支持的格式: {fmt}")
@@ -0,0 +1,180 @@
+# modules/calendar_export.py
+
+"""
+日历导出模块
+
+这个模块把日程管理中的事件导出为 iCalendar (RFC 5545) 格式，供成员在自己的日历应用中订阅。
+
+设计思路:
+1. 每个用户拥有一个随机订阅令牌，订阅地址中不暴露用户名
+2. 使用生成器逐个输出 VEVENT，不在内存中拼接整个日历文档
+3. 重复事件按系列输出一次 RRULE，取消的发生实例输出为 EXDATE，修改的发生实例以 RECURRENCE-ID 覆盖
+4. 根据日程版本号生成 ETag 与 Last-Modified，支持条件请求，未变化时返回 304
+"""
+
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from utils import database, security
+from modules import schedule_management
+
+# 订阅中包含的时间范围（相对于当天）
+FEED_PAST_DAYS = 90
+FEED_FUTURE_DAYS = 365
+
+ICS_DATETIME_FORMAT = "%Y%m%dT%H%M%S"
+PRODID = "-//NewLab//Laboratory Management System//ZH"
+
+def get_feed_token(user_id):
+    """
+    获取用户的日历订阅令牌，不存在时创建。
+
+    参数:
+    user_id (int): 用户ID
+
+    返回:
+    str: 订阅令牌
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    # 查询和创建在同一把锁内完成，并发的首次请求不会为同一用户创建两个令牌
+    with database.write_lock:
+        c.execute("SELECT token FROM calendar_feed_tokens WHERE user_id = ?", (user_id,))
+        result = c.fetchone()
+        if result:
+            return result[0]
+        token = security.generate_token()
+        c.execute("INSERT INTO calendar_feed_tokens (token, user_id) VALUES (?, ?)", (token, user_id))
+        conn.commit()
+    return token
+
+def get_feed_user(token):
+    """
+    根据订阅令牌获取用户ID。
+
+    参数:
+    token (str): 订阅令牌
+
+    返回:
+    int: 用户ID，令牌无效时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT user_id FROM calendar_feed_tokens WHERE token = ?", (token,))
+    result = c.fetchone()
+    return result[0] if result else None
+
+def get_feed_validators(user_id=None):
+    """
+    计算订阅的 ETag 和 Last-Modified。
+
+    ETag 同时包含日程版本号和当天日期，因为订阅的时间窗口随日期滚动。
+
+    参数:
+    user_id (int): 用户ID，为None时表示团队订阅
+
+    返回:
+    tuple: (ETag字符串, Last-Modified的datetime或None)
+    """
+    version, changed_at = schedule_management.get_schedule_version(user_id)
+    scope = "team" if user_id is None else f"user-{user_id}"
+    digest = hashlib.sha1(f"{scope}:{version}:{date.today().isoformat()}".encode('utf-8')).hexdigest()
+    last_modified = changed_at.astimezone(timezone.utc).replace(microsecond=0) if changed_at else None
+    return f'"{digest}"', last_modified
+
+def is_not_modified(headers, etag, last_modified):
+    """
+    判断条件请求是否可以返回 304。
+
+    If-None-Match 优先于 If-Modified-Since，与 HTTP 规范一致。
+
+    参数:
+    headers (Mapping): 请求头
+    etag (str): 当前 ETag
+    last_modified (datetime): 当前最后修改时间（UTC），可为None
+
+    返回:
+    bool: 资源未变化时返回True
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def format_http_date(value):
+    """将datetime格式化为HTTP日期字符串"""
+    return format_datetime(value, usegmt=True)
+
+def _escape_text(value):
+    """按 RFC 5545 转义 TEXT 类型的值"""
+    return (value or "").replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+def _fold_line(line):
+    """
+    按 RFC 5545 将内容行折叠为每行不超过75个字节，并以CRLF结尾。
+
+    按字符而不是字节切分，保证多字节的中文字符不会被截断。
+    """
+    chunks = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > 75:
+            chunks.append(''.join(current))
+            current, size = [' '], 1
+        current.append(char)
+        size += width
+    chunks.append(''.join(current))
+    return '\r\n'.join(chunks) + '\r\n'
+
+def _format_vevent(entry, dtstamp):
+    """
+    将一条日历条目格式化为 VEVENT 内容行列表。
+    """
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{entry['uid']}@newlab",
+        f"DTSTAMP:{dtstamp}",
+        f"DTSTART:{entry['start_time'].strftime(ICS_DATETIME_FORMAT)}",
+        f"DTEND:{entry['end_time'].strftime(ICS_DATETIME_FORMAT)}",
+        f"SUMMARY:{_escape_text(entry['title'])}",
+    ]
+    if entry['description']:
+        lines.append(f"DESCRIPTION:{_escape_text(entry['description'])}")
+    if entry['rrule']:
+        lines.append(f"RRULE:{entry['rrule']}")
+    if entry['exdates']:
+        lines.append("EXDATE:" + ','.join(d.strftime(ICS_DATETIME_FORMAT) for d in entry['exdates']))
+    if entry['recurrence_id']:
+        lines.append(f"RECURRENCE-ID:{entry['recurrence_id'].strftime(ICS_DATETIME_FORMAT)}")
+    lines.append("END:VEVENT")
+    return lines
+
+def iter_ics(user_id=None, calendar_name="实验室日程"):
+    """
+    以生成器形式逐段输出 iCalendar 文档。
+
+    参数:
+    user_id (int): 用户ID，为None时导出团队日程
+    calendar_name (str): 日历名称
+
+    返回:
+    generator: 依次生成UTF-8编码的文档片段，每个片段对应一个日历组件
+    """
+    today = datetime.combine(date.today(), datetime.min.time())
+    start_time = today - timedelta(days=FEED_PAST_DAYS)
+    end_time = today + timedelta(days=FEED_FUTURE_DAYS)
+    dtstamp = datetime.now(timezone.utc).strftime(ICS_DATETIME_FORMAT) + "Z"
+
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{_escape_text(calendar_name)}"]
+    yield ''.join(_fold_line(line) for line in header).encode('utf-8')
+    for entry in schedule_management.iter_calendar_entries(start_time, end_time, user_id):
+        yield ''.join(_fold_line(line) for line in _format_vevent(entry, dtstamp)).encode('utf-8')
+    yield _fold_line("END:VCALENDAR").encode('utf-8')
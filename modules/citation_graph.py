@@ -0,0 +1,296 @@
+# modules/citation_graph.py
+
+"""
+文献引用网络模块
+
+这个模块在 citations 表中保存文献之间的引用关系，并提供引用网络上的查询：
+k 跳邻域、共被引（co-citation）和文献耦合（bibliographic coupling）。
+
+设计思路:
+1. citations 表以 (citing_id, cited_id) 为主键，另有 (cited_id, citing_id) 索引，两个方向的邻接查询都走索引
+2. 查询在内存中的 CSR 稀疏矩阵上完成：第一次查询时从 citations 表加载全部引用关系，
+   建立引用方向和被引方向两个 CSR 邻接矩阵；本进程写入引用关系后标记为过期，
+   其他进程写入数据库后通过 PRAGMA data_version 发现并重新加载
+3. 邻域按跳数做广度优先搜索，每一跳用一次稀疏矩阵行切片取出整个前沿的邻居，不逐个节点循环
+4. 共被引次数 = 同时引用两篇文献的文献数，文献耦合次数 = 两篇文献共同的参考文献数；
+   对一篇文献，用 np.bincount 一次算出它与所有文献的次数，
+   相似度为次数除以两篇文献被引数（或参考文献数）几何平均的 Salton 余弦值
+5. 引用关系可以从本地的参考文献列表（BibTeX、RIS 或每行一条的纯文本）离线导入，
+   按规范化 DOI 或标题指纹匹配文献库中已有的文献，不需要联网查询
+"""
+
+import itertools
+import threading
+import numpy as np
+from scipy import sparse
+from modules import bibliography
+from utils import database
+
+# 邻域查询允许的最大跳数
+MAX_HOPS = 3
+
+# 邻域最多返回的文献数量，超过时保留跳数少、引用关系多的文献
+NEIGHBOURHOOD_LIMIT = 500
+
+# 相似文献默认返回的数量
+SIMILAR_LIMIT = 20
+
+_graph = None
+_graph_lock = threading.Lock()
+
+class CitationGraph:
+    """
+    引用网络的内存表示
+
+    ids 是出现在引用关系中的文献ID（升序），矩阵的第 i 行/列对应 ids[i]；
+    forward[i, j] = 1 表示 ids[i] 引用了 ids[j]，backward 是它的转置。
+    """
+
+    def __init__(self, citing, cited, data_version):
+        self.ids = np.unique(np.concatenate([citing, cited]))
+        size = len(self.ids)
+        rows = np.searchsorted(self.ids, citing)
+        cols = np.searchsorted(self.ids, cited)
+        self.forward = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(size, size))
+        self.backward = self.forward.T.tocsr()
+        self.undirected = (self.forward + self.backward).tocsr()
+        # 参考文献数（出度）和被引数（入度）
+        self.out_degree = np.diff(self.forward.indptr)
+        self.in_degree = np.diff(self.backward.indptr)
+        self.data_version = data_version
+
+    def index(self, literature_id):
+        """文献ID对应的矩阵行号，不在引用网络中时返回None"""
+        pos = int(np.searchsorted(self.ids, literature_id))
+        return pos if pos < len(self.ids) and self.ids[pos] == literature_id else None
+
+def get_graph():
+    """
+    获取引用网络，第一次调用或数据库中的引用关系变化后重新加载
+
+    返回:
+    CitationGraph: 引用网络
+    """
+    global _graph
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("PRAGMA data_version")
+    version = c.fetchone()[0]
+    with _graph_lock:
+        if _graph is None or _graph.data_version != version:
+            c.execute("SELECT citing_id, cited_id FROM citations")
+            edges = np.fromiter(itertools.chain.from_iterable(c), dtype=np.int64).reshape(-1, 2)
+            _graph = CitationGraph(edges[:, 0], edges[:, 1], version)
+        return _graph
+
+def _invalidate():
+    """本进程写入引用关系后丢弃内存中的引用网络（本连接的写入不会改变 data_version）"""
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+def add_citations(pairs):
+    """
+    批量添加引用关系，已存在的关系和自引被忽略
+
+    参数:
+    pairs (iterable): (引用文献ID, 被引文献ID) 元组
+
+    返回:
+    int: 新增的引用关系数量，失败返回None
+    """
+    pairs = [(citing, cited) for citing, cited in pairs if citing != cited]
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            before = conn.total_changes
+            c.executemany("INSERT OR IGNORE INTO citations (citing_id, cited_id) VALUES (?, ?)", pairs)
+            added = conn.total_changes - before
+            conn.commit()
+        except:
+            conn.rollback()
+            return None
+    _invalidate()
+    return added
+
+def remove_citation(citing_id, cited_id):
+    """
+    删除一条引用关系
+
+    参数:
+    citing_id (int): 引用文献ID
+    cited_id (int): 被引文献ID
+
+    返回:
+    bool: 删除成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("DELETE FROM citations WHERE citing_id = ? AND cited_id = ?", (citing_id, cited_id))
+            conn.commit()
+        except:
+            conn.rollback()
+            return False
+    _invalidate()
+    return True
+
+def import_references(citing_id, lines, fmt=None):
+    """
+    从一篇文献的参考文献列表离线导入它的引用关系
+
+    参考文献按规范化 DOI 匹配文献库中的文献，没有 DOI 或 DOI 不在库中时按标题指纹匹配
+    （标题指纹只对应一篇文献时才采用）。不在文献库中的参考文献列入报告，可以先用批量导入添加后再导入一次。
+
+    参数:
+    citing_id (int): 引用这些参考文献的文献ID
+    lines (iterable): 参考文献列表文件的文本行
+    fmt (str): 'bibtex'、'ris' 或 'text'，为None时根据文件内容判断是 RIS 还是 BibTeX
+
+    返回:
+    dict: 包含'added'（新增的引用关系数）、'matched'（匹配到的参考文献数）、
+          'unmatched'（未匹配的参考文献，每条包含'line'、'title'、'doi'）和
+          'errors'（无法解析的条目，每条包含'line'、'reason'），失败返回None
+    """
+    errors = []
+    references = list(bibliography.parse(lines, fmt, errors))
+    dois = {bibliography.normalize_doi(ref['doi']) for ref in references} - {None}
+    hashes = {bibliography.title_hash(ref['title']) for ref in references} - {None}
+    conn = database.get_connection()
+    c = conn.cursor()
+    by_doi = {}
+    by_title = {}
+    for column, keys, found in (('doi_norm', list(dois), by_doi), ('title_hash', list(hashes), by_title)):
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            c.execute(f"SELECT {column}, id FROM literature WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk)
+            for key, literature_id in c.fetchall():
+                found.setdefault(key, []).append(literature_id)
+
+    pairs = []
+    unmatched = []
+    for ref in references:
+        ids = by_doi.get(bibliography.normalize_doi(ref['doi'])) or by_title.get(bibliography.title_hash(ref['title']), [])
+        if len(ids) == 1:
+            pairs.append((citing_id, ids[0]))
+        else:
+            unmatched.append({'line': ref['line'], 'title': ref['title'], 'doi': ref['doi']})
+    added = add_citations(pairs)
+    if added is None:
+        return None
+    return {'added': added, 'matched': len(pairs), 'unmatched': unmatched, 'errors': errors}
+
+def _titles(literature_ids):
+    """批量查询文献标题"""
+    titles = {}
+    literature_ids = [int(i) for i in literature_ids]
+    conn = database.get_connection()
+    c = conn.cursor()
+    for start in range(0, len(literature_ids), 500):
+        chunk = literature_ids[start:start + 500]
+        c.execute(f"SELECT id, title FROM literature WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        titles.update(c.fetchall())
+    return titles
+
+def get_neighbourhood(literature_id, hops=1, direction='both', limit=NEIGHBOURHOOD_LIMIT):
+    """
+    获取文献在引用网络中 hops 跳以内的邻域
+
+    经过高被引文献时邻域会迅速扩大，因此最多返回 limit 篇文献：先按跳数、再按引用关系数（度）保留，
+    已经达到 limit 时不再向外扩展。
+
+    参数:
+    literature_id (int): 文献ID
+    hops (int): 跳数，最大为 MAX_HOPS
+    direction (str): 'out' 只沿引用方向（参考文献），'in' 只沿被引方向（施引文献），'both' 不区分方向
+    limit (int): 最多返回的文献数量，默认为 NEIGHBOURHOOD_LIMIT
+
+    返回:
+    dict: 包含'nodes'（邻域中的文献，每条包含'id'、'title'和'hops'，起点的'hops'为0）、
+          'edges'（这些文献之间的引用关系，(引用文献ID, 被引文献ID) 元组列表）和'truncated'（是否因 limit 截断）
+    """
+    graph = get_graph()
+    start = graph.index(literature_id)
+    if start is None:
+        return {'nodes': [], 'edges': [], 'truncated': False}
+    matrix = {'out': graph.forward, 'in': graph.backward, 'both': graph.undirected}[direction]
+    distance = np.full(len(graph.ids), -1, dtype=np.int32)
+    distance[start] = 0
+    frontier = np.array([start])
+    found = 1
+    truncated = False
+    for hop in range(1, min(hops, MAX_HOPS) + 1):
+        if found >= limit:
+            truncated = True
+            break
+        # 一次取出整个前沿的所有邻居，再去掉已经访问过的
+        neighbours = np.unique(matrix[frontier].indices)
+        frontier = neighbours[distance[neighbours] < 0]
+        if len(frontier) == 0:
+            break
+        distance[frontier] = hop
+        found += len(frontier)
+    reached = np.nonzero(distance >= 0)[0]
+    degree = graph.in_degree[reached] + graph.out_degree[reached]
+    reached = reached[np.lexsort((-degree, distance[reached]))[:limit]]
+    titles = _titles(graph.ids[reached])
+    sub = graph.forward[reached][:, reached].tocoo()
+    return {'nodes': [{'id': int(graph.ids[i]), 'title': titles.get(int(graph.ids[i])), 'hops': int(distance[i])}
+                      for i in reached],
+            'edges': list(zip(graph.ids[reached[sub.row]].tolist(), graph.ids[reached[sub.col]].tolist())),
+            'truncated': truncated or found > len(reached)}
+
+def _rank_similar(graph, counts, degree, index, limit):
+    """按 Salton 余弦相似度排序次数不为零的文献，相似度相同时次数多的在前"""
+    counts[index] = 0
+    candidates = np.nonzero(counts)[0]
+    if len(candidates) == 0:
+        return []
+    shared = counts[candidates]
+    scores = shared / np.sqrt(degree[index] * degree[candidates])
+    top = candidates[np.lexsort((-shared, -scores))[:limit]]
+    titles = _titles(graph.ids[top])
+    return [{'id': int(graph.ids[i]), 'title': titles.get(int(graph.ids[i])), 'count': int(counts[i]),
+             'score': float(counts[i] / np.sqrt(degree[index] * degree[i]))} for i in top]
+
+def get_co_cited(literature_id, limit=SIMILAR_LIMIT):
+    """
+    获取与指定文献共被引最多的文献
+
+    参数:
+    literature_id (int): 文献ID
+    limit (int): 返回数量，默认为 SIMILAR_LIMIT
+
+    返回:
+    list: 字典列表，每个字典包含'id'、'title'、'count'（同时引用两篇文献的文献数）和'score'（余弦相似度），按相似度降序排列
+    """
+    graph = get_graph()
+    index = graph.index(literature_id)
+    if index is None:
+        return []
+    citing = graph.backward[index].indices
+    # 所有施引文献的参考文献合在一起计数，即与每篇文献的共被引次数
+    counts = np.bincount(graph.forward[citing].indices, minlength=len(graph.ids))
+    return _rank_similar(graph, counts, graph.in_degree, index, limit)
+
+def get_coupled(literature_id, limit=SIMILAR_LIMIT):
+    """
+    获取与指定文献文献耦合最强（共同参考文献最多）的文献
+
+    参数:
+    literature_id (int): 文献ID
+    limit (int): 返回数量，默认为 SIMILAR_LIMIT
+
+    返回:
+    list: 字典列表，每个字典包含'id'、'title'、'count'（共同的参考文献数）和'score'（余弦相似度），按相似度降序排列
+    """
+    graph = get_graph()
+    index = graph.index(literature_id)
+    if index is None:
+        return []
+    references = graph.forward[index].indices
+    # 所有参考文献的施引文献合在一起计数，即与每篇文献共同的参考文献数
+    counts = np.bincount(graph.backward[references].indices, minlength=len(graph.ids))
+    return _rank_similar(graph, counts, graph.out_degree, index, limit)
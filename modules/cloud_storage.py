@@ -6,7 +6,7 @@
 2. 文件下载：允许用户下载其上传的文件
 3. 文件删除：允许用户删除其上传的文件
 4. 文件列表：获取用户上传的所有文件列表
-5. 文件共享：允许用户与其他用户共享文件
+5. 文件共享：允许用户与其他用户、用户组（角色）或项目成员共享文件，并分页查看共享给自己的文件
 
 未来计划：
 - 集成第三方云存储服务（如AWS S3）
@@ -21,40 +21,560 @@
 注意：
 - 所有与数据库的交互都使用参数化查询以防止SQL注入攻击
 - 文件操作应考虑异常处理，确保系统稳定性
+
+分块上传：
+- 上传以会话为单位分块进行，每块不超过 MAX_CHUNK_SIZE，服务端内存占用与文件大小无关
+- 会话记录已接收的字节数，连接中断后客户端查询偏移量并从该处继续上传
+- 数据先写入 UPLOAD_FOLDER/.incoming 下的临时文件，完成时原子重命名到最终位置，
+  不会出现写了一半的文件，也不会覆盖其他同名文件
+
+内容寻址存储：
+- 上传过程中边接收边计算SHA-256，内容相同的文件只保存一份，存放在 BLOB_FOLDER/<哈希前两位>/<哈希3-4位>/<哈希>
+- files 表的每一行通过 blob_hash 指向一个 blob，原始文件名只保存在数据库中
+- blob 记录引用计数，删除文件只减少引用计数；引用计数为0超过 BLOB_GC_GRACE 的 blob 由后台垃圾回收删除
+- blob 的文件操作都在数据库写事务内完成，垃圾回收与并发上传同一内容不会互相破坏
+- 上传完成后由 file_previews 在后台生成预览，预览文件保存在 blob 旁边，随 blob 一起回收
+
+存储配额：
+- storage_usage 表记录每个用户已上传文件的字节数和文件数（按逻辑大小计，去重不减少用户的用量），
+  在上传完成和删除文件的同一事务中增减，查询用量不需要遍历目录
+- 进行中的上传会话按声明的文件大小（未声明时按已接收的字节数）预占配额；
+  创建会话时用一条带条件的 INSERT 检查配额，超出时在写入任何数据之前拒绝
+- 对账任务在升级（init_db）和API服务启动时各运行一次，之后定期运行，用文件系统中的实际文件校正
+  files.size 和用量计数器；升级前上传的文件由此计入用量
 """
 
+import asyncio
+import hashlib
+import json
 import os
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from cachetools import TTLCache
 from utils import database, security
+from modules import auth, file_previews
 
 UPLOAD_FOLDER = "uploads"
 
+# 存放未完成上传的临时目录，与最终目录位于同一文件系统，保证重命名是原子的
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, ".incoming")
+
+# 单个分块的最大字节数，也是上传过程中每个请求在内存中保留的最大数据量
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 超过这个时间没有新分块的上传会话会被清理
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+# 按内容哈希存放文件数据的目录
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+
+# 引用计数降为0的 blob 至少保留这么久才会被垃圾回收
+BLOB_GC_GRACE = timedelta(hours=1)
+
+# 后台垃圾回收的运行间隔（秒）
+GC_INTERVAL_SECONDS = 3600
+
+# 各上传会话的增量哈希状态：会话ID -> (已哈希的字节数, hashlib对象)
+# 进程重启或偏移量不一致时从临时文件重新计算
+_session_hashes = {}
+_session_hashes_lock = threading.Lock()
+
+# 各上传会话的锁：同一会话的写分块、完成和放弃串行执行，临时文件的内容与记录的哈希状态始终对应。
+# 锁顺序为先会话锁、后 database.write_lock；没有请求持有时锁自动释放
+_session_locks = weakref.WeakValueDictionary()
+_session_locks_lock = threading.Lock()
+
+# 文件访问检查的缓存：(文件ID, 用户ID) -> 文件信息或None
+# 本进程内的共享关系变化时整体清空；其他进程的变化最多在 ACCESS_CACHE_TTL 秒后生效
+ACCESS_CACHE_TTL = 60
+_access_cache = TTLCache(maxsize=100000, ttl=ACCESS_CACHE_TTL)
+_access_cache_lock = threading.Lock()
+
+# "共享给我的文件" 每页的默认数量
+SHARED_PAGE_SIZE = 50
+
+# 未单独设置配额的用户的默认存储配额（字节）
+DEFAULT_QUOTA_BYTES = 20 * 1024 ** 3
+
+# 签名下载链接的有效期
+SIGNED_URL_TTL = timedelta(hours=1)
+
+# 存储用量对账任务的运行间隔（秒）
+RECONCILE_INTERVAL_SECONDS = 24 * 3600
+
+# 用户已用字节数加上进行中上传会话预占的字节数，参数为两次用户ID
+_USED_AND_RESERVED_SQL = """
+    COALESCE((SELECT bytes_used FROM storage_usage WHERE user_id = ?), 0)
+    + COALESCE((SELECT SUM(COALESCE(total_size, received)) FROM upload_sessions WHERE user_id = ?), 0)
+"""
+
+# 用户的配额，参数为用户ID和默认配额
+_QUOTA_SQL = "COALESCE((SELECT quota_bytes FROM storage_usage WHERE user_id = ?), ?)"
+
+def _blob_path(digest):
+    """获取 blob 的存储路径，哈希的前两级作为分片目录"""
+    return os.path.join(BLOB_FOLDER, digest[:2], digest[2:4], digest)
+
+def _session_hasher(session_id, offset):
+    """
+    获取已覆盖临时文件前 offset 个字节的哈希对象副本。
+
+    内存中的状态与偏移量一致时直接复制，否则按块重新读取临时文件计算。
+    """
+    with _session_hashes_lock:
+        state = _session_hashes.get(session_id)
+    if state and state[0] == offset:
+        return state[1].copy()
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(_incoming_path(session_id), "rb") as f:
+        while remaining > 0:
+            data = f.read(min(MAX_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+def _store_session_hasher(session_id, offset, hasher):
+    """保存上传会话的哈希状态"""
+    with _session_hashes_lock:
+        _session_hashes[session_id] = (offset, hasher)
+
+def _discard_session_hasher(session_id):
+    """丢弃上传会话的哈希状态"""
+    with _session_hashes_lock:
+        _session_hashes.pop(session_id, None)
+
+def _session_lock(session_id):
+    """获取上传会话的锁，不存在时创建"""
+    with _session_locks_lock:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+def _incoming_path(session_id):
+    """获取上传会话的临时文件路径"""
+    return os.path.join(INCOMING_FOLDER, f"{session_id}.part")
+
+def create_upload_session(user_id, file_name, total_size=None):
+    """
+    创建分块上传会话。
+
+    声明了文件大小时会按该大小预占配额，配额不足时不创建会话。
+
+    参数:
+    user_id: 上传文件的用户ID
+    file_name: 原始文件名
+    total_size: 文件总字节数，可选，提供时完成上传前会校验
+
+    返回:
+    上传会话ID，超出存储配额时返回None
+    """
+    session_id = security.generate_token()
+    now = datetime.now()
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute(f"""
+            INSERT INTO upload_sessions (id, user_id, name, total_size, received, created_at, updated_at)
+            SELECT ?, ?, ?, ?, 0, ?, ?
+            WHERE {_USED_AND_RESERVED_SQL} + ? <= {_QUOTA_SQL}
+        """, (session_id, user_id, os.path.basename(file_name), total_size, now, now,
+              user_id, user_id, total_size or 0, user_id, DEFAULT_QUOTA_BYTES))
+        conn.commit()
+    if c.rowcount == 0:
+        return None
+    os.makedirs(INCOMING_FOLDER, exist_ok=True)
+    open(_incoming_path(session_id), "wb").close()
+    return session_id
+
+def get_upload_session(session_id, user_id):
+    """
+    获取上传会话的状态，客户端断线重连后据此决定从哪个偏移量继续上传。
+
+    参数:
+    session_id: 上传会话ID
+    user_id: 用户ID
+
+    返回:
+    包含会话信息的字典，会话不存在或不属于该用户时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, name, total_size, received, created_at, updated_at FROM upload_sessions WHERE id = ? AND user_id = ?",
+              (session_id, user_id))
+    result = c.fetchone()
+    if not result:
+        return None
+    return {'id': result[0], 'name': result[1], 'total_size': result[2], 'received': result[3],
+            'created_at': result[4], 'updated_at': result[5]}
+
+def append_chunk(session_id, user_id, offset, data):
+    """
+    向上传会话追加一个分块。
+
+    分块必须从已接收的字节数处开始；偏移量不一致时不写入，并返回当前已接收的字节数，
+    客户端据此重新对齐。临时文件中超出已确认字节数的部分（上次中断时写了一半的分块）会被截掉。
+    同一会话的并发请求按会话锁串行执行，后到的请求看到新的偏移量后被拒绝，不会改写已确认的数据。
+
+    参数:
+    session_id: 上传会话ID
+    user_id: 用户ID
+    offset: 分块在文件中的起始位置
+    data: 分块内容，不超过 MAX_CHUNK_SIZE 字节
+
+    返回:
+    包含'success'和'received'（已接收字节数）的字典，会话不存在时返回None；
+    未声明文件大小的会话超出配额时还包含'quota_exceeded': True
+    """
+    with _session_lock(session_id):
+        session = get_upload_session(session_id, user_id)
+        if session is None:
+            return None
+        if offset != session['received'] or len(data) > MAX_CHUNK_SIZE:
+            return {'success': False, 'received': session['received']}
+        if session['total_size'] is not None and offset + len(data) > session['total_size']:
+            return {'success': False, 'received': session['received']}
+        if session['total_size'] is None and get_storage_usage(user_id)['available_bytes'] < len(data):
+            # 未声明大小的会话只预占已接收的字节，写入前逐块检查配额
+            return {'success': False, 'received': session['received'], 'quota_exceeded': True}
+
+        hasher = _session_hasher(session_id, offset)
+        with open(_incoming_path(session_id), "r+b") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        hasher.update(data)
+
+        received = offset + len(data)
+        conn = database.get_connection()
+        c = conn.cursor()
+        with database.write_lock:
+            c.execute("UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ? AND received = ?",
+                      (received, datetime.now(), session_id, offset))
+            conn.commit()
+        if c.rowcount == 0:
+            # 会话在写入期间被清理
+            return None
+        _store_session_hasher(session_id, received, hasher)
+        return {'success': True, 'received': received}
+
+def complete_upload(session_id, user_id):
+    """
+    完成上传：按内容哈希把临时文件存入 blob 存储，并在数据库中记录文件信息。
+
+    内容已存在时只增加 blob 的引用计数并删除临时文件，否则把临时文件原子重命名为新的 blob。
+
+    参数:
+    session_id: 上传会话ID
+    user_id: 用户ID
+
+    返回:
+    上传文件的ID，会话不存在或文件不完整时返回None
+    """
+    with _session_lock(session_id):
+        return _complete_upload(session_id, user_id)
+
+def _complete_upload(session_id, user_id):
+    """在持有会话锁时完成上传"""
+    session = get_upload_session(session_id, user_id)
+    if session is None:
+        return None
+    if session['total_size'] is not None and session['received'] != session['total_size']:
+        return None
+
+    temp_path = _incoming_path(session_id)
+    with open(temp_path, "r+b") as f:
+        f.truncate(session['received'])
+    digest = _session_hasher(session_id, session['received']).hexdigest()
+    blob_path = _blob_path(digest)
+    now = datetime.now()
+
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("UPDATE blobs SET ref_count = ref_count + 1, unreferenced_at = NULL WHERE hash = ?", (digest,))
+            if c.rowcount == 0:
+                c.execute("INSERT INTO blobs (hash, size, ref_count, created_at) VALUES (?, ?, 1, ?)", (digest, session['received'], now))
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(temp_path, blob_path)
+            else:
+                os.remove(temp_path)
+            c.execute("INSERT INTO files (name, path, user_id, size, uploaded_at, blob_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                      (session['name'], blob_path, user_id, session['received'], now, digest))
+            file_id = c.lastrowid
+            _add_usage(c, user_id, session['received'], 1)
+            c.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+            conn.commit()
+        except:
+            conn.rollback()
+            return None
+    _discard_session_hasher(session_id)
+    # 预览在后台生成，这里只把任务放入队列
+    file_previews.request_preview(digest, blob_path, session['name'])
+    return file_id
+
+def abort_upload(session_id, user_id):
+    """
+    放弃上传会话并删除临时文件。
+
+    参数:
+    session_id: 上传会话ID
+    user_id: 用户ID
+
+    返回:
+    会话存在并已删除返回True，否则返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with _session_lock(session_id):
+        with database.write_lock:
+            c.execute("DELETE FROM upload_sessions WHERE id = ? AND user_id = ?", (session_id, user_id))
+            conn.commit()
+        if c.rowcount == 0:
+            return False
+        _discard_session_hasher(session_id)
+        if os.path.exists(_incoming_path(session_id)):
+            os.remove(_incoming_path(session_id))
+    return True
+
+def cleanup_stale_uploads(ttl=UPLOAD_SESSION_TTL):
+    """
+    清理长时间没有新分块的上传会话及其临时文件。
+
+    参数:
+    ttl: 会话的最长空闲时间，默认为24小时
+
+    返回:
+    清理的会话数量
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    cutoff = datetime.now() - ttl
+    c.execute("SELECT id FROM upload_sessions WHERE updated_at < ?", (cutoff,))
+    cleaned = 0
+    for (session_id,) in c.fetchall():
+        # 按锁顺序逐个删除，删除前再次检查会话仍然空闲
+        with _session_lock(session_id):
+            with database.write_lock:
+                c.execute("DELETE FROM upload_sessions WHERE id = ? AND updated_at < ?", (session_id, cutoff))
+                conn.commit()
+            if c.rowcount == 0:
+                continue
+            cleaned += 1
+            _discard_session_hasher(session_id)
+            if os.path.exists(_incoming_path(session_id)):
+                os.remove(_incoming_path(session_id))
+    return cleaned
+
+def upload_stream(stream, file_name, user_id, chunk_size=MAX_CHUNK_SIZE):
+    """
+    从文件对象中按块读取并上传，内存中最多保留一个分块。
+
+    参数:
+    stream: 支持read(size)的二进制文件对象
+    file_name: 原始文件名
+    user_id: 上传文件的用户ID
+    chunk_size: 每次读取的字节数，默认为 MAX_CHUNK_SIZE
+
+    返回:
+    上传文件的ID，超出存储配额或失败时返回None
+    """
+    total_size = getattr(stream, 'size', None)
+    if total_size is None and getattr(stream, 'seekable', lambda: False)():
+        position = stream.tell()
+        total_size = stream.seek(0, os.SEEK_END) - position
+        stream.seek(position)
+    session_id = create_upload_session(user_id, file_name, total_size)
+    if session_id is None:
+        return None
+    offset = 0
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            result = append_chunk(session_id, user_id, offset, data)
+            if not result or not result['success']:
+                abort_upload(session_id, user_id)
+                return None
+            offset = result['received']
+        file_id = complete_upload(session_id, user_id)
+    except OSError:
+        file_id = None
+    if file_id is None:
+        abort_upload(session_id, user_id)
+    return file_id
+
 def upload_file(file, user_id):
     """
     上传文件到服务器并在数据库中记录文件信息
     
+    文件按块流式写入，不会一次性把整个文件读入内存。
+
     参数:
     file: 上传的文件对象
     user_id: 上传文件的用户ID
     
     返回:
-    上传文件的ID
+    上传文件的ID，超出存储配额或失败时返回None
+    """
+    file.seek(0)
+    return upload_stream(file, file.name, user_id)
+
+def _add_usage(c, user_id, size, count):
+    """
+    在当前事务中增减用户的存储用量计数器。
+
+    计数器不会减到0以下：升级前上传的文件在对账之前可能没有计入用量，删除这些文件时只减到0。
+    """
+    c.execute("""
+        INSERT INTO storage_usage (user_id, bytes_used, file_count, updated_at) VALUES (?, MAX(?, 0), MAX(?, 0), ?)
+        ON CONFLICT(user_id) DO UPDATE SET bytes_used = MAX(bytes_used + ?, 0),
+            file_count = MAX(file_count + ?, 0), updated_at = excluded.updated_at
+    """, (user_id, size, count, datetime.now(), size, count))
+
+def get_storage_usage(user_id):
+    """
+    获取用户的存储用量和配额。
+
+    参数:
+    user_id: 用户ID
+
+    返回:
+    包含'bytes_used'、'file_count'、'reserved_bytes'（进行中上传预占的字节数）、
+    'quota_bytes'和'available_bytes'的字典
     """
-    # 确保上传文件夹存在
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-    
-    # 保存文件到服务器
-    file_path = os.path.join(UPLOAD_FOLDER, file.name)
-    with open(file_path, "wb") as f:
-        f.write(file.getbuffer())
-    
-    # 在数据库中记录文件信息
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("INSERT INTO files (name, path, user_id) VALUES (?, ?, ?)",
-              (file.name, file_path, user_id))
-    conn.commit()
-    return c.lastrowid
+    c.execute(f"""
+        SELECT COALESCE((SELECT bytes_used FROM storage_usage WHERE user_id = ?), 0),
+               COALESCE((SELECT file_count FROM storage_usage WHERE user_id = ?), 0),
+               COALESCE((SELECT SUM(COALESCE(total_size, received)) FROM upload_sessions WHERE user_id = ?), 0),
+               {_QUOTA_SQL}
+    """, (user_id, user_id, user_id, user_id, DEFAULT_QUOTA_BYTES))
+    bytes_used, file_count, reserved_bytes, quota_bytes = c.fetchone()
+    return {'bytes_used': bytes_used, 'file_count': file_count, 'reserved_bytes': reserved_bytes,
+            'quota_bytes': quota_bytes, 'available_bytes': max(quota_bytes - bytes_used - reserved_bytes, 0)}
+
+def set_user_quota(user_id, quota_bytes):
+    """
+    设置用户的存储配额。
+
+    参数:
+    user_id: 用户ID
+    quota_bytes: 配额字节数，为None时恢复使用默认配额
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute("""
+            INSERT INTO storage_usage (user_id, bytes_used, file_count, quota_bytes, updated_at) VALUES (?, 0, 0, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET quota_bytes = excluded.quota_bytes
+        """, (user_id, quota_bytes, datetime.now()))
+        conn.commit()
+
+def get_storage_report():
+    """
+    生成所有用户的存储用量报告，供管理员查看，按已用空间降序排列。
+
+    返回:
+    包含用户ID、用户名、已用字节数、文件数、配额和使用比例的字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT u.id, u.username, COALESCE(s.bytes_used, 0), COALESCE(s.file_count, 0), COALESCE(s.quota_bytes, ?)
+        FROM users u
+        LEFT JOIN storage_usage s ON s.user_id = u.id
+        ORDER BY COALESCE(s.bytes_used, 0) DESC, u.username
+    """, (DEFAULT_QUOTA_BYTES,))
+    return [{'user_id': r[0], 'username': r[1], 'bytes_used': r[2], 'file_count': r[3], 'quota_bytes': r[4],
+             'usage_ratio': r[2] / r[4] if r[4] else 0.0} for r in c.fetchall()]
+
+def reconcile_storage_usage(fix=True):
+    """
+    用文件系统核对存储用量。
+
+    1. 对每个不同的存储路径执行一次 stat，记录丢失的文件和大小与 files.size 不一致的记录
+    2. 按 files 表重新汇总每个用户的用量，与计数器比较
+    3. 在 blob 目录中查找没有 blobs 记录的孤立文件（只报告，不删除）
+
+    参数:
+    fix: 是否修正 files.size 和用量计数器，默认为True
+
+    返回:
+    包含'checked_files'、'missing_files'、'size_mismatches'、'counter_mismatches'和'orphan_blobs'的字典
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT path, GROUP_CONCAT(id), MAX(COALESCE(size, -1)), MIN(COALESCE(size, -1)) FROM files GROUP BY path")
+    missing_files = []
+    size_mismatches = []
+    checked = 0
+    for path, ids, max_size, min_size in c.fetchall():
+        checked += 1
+        try:
+            actual = os.stat(path).st_size
+        except OSError:
+            missing_files.append({'path': path, 'file_ids': [int(i) for i in ids.split(',')]})
+            continue
+        if max_size != actual or min_size != actual:
+            size_mismatches.append({'path': path, 'recorded': max_size if max_size >= 0 else None, 'actual': actual})
+
+    c.execute("""
+        SELECT u.user_id, COALESCE(s.bytes_used, 0), COALESCE(s.file_count, 0), u.bytes, u.files
+        FROM (SELECT user_id, COALESCE(SUM(size), 0) AS bytes, COUNT(*) AS files FROM files GROUP BY user_id
+              UNION ALL
+              SELECT user_id, 0, 0 FROM storage_usage WHERE user_id NOT IN (SELECT user_id FROM files)) u
+        LEFT JOIN storage_usage s ON s.user_id = u.user_id
+    """)
+    counter_mismatches = []
+    for user_id, recorded_bytes, recorded_files, actual_bytes, actual_files in c.fetchall():
+        if (recorded_bytes, recorded_files) != (actual_bytes, actual_files):
+            counter_mismatches.append({'user_id': user_id, 'recorded_bytes': recorded_bytes, 'actual_bytes': actual_bytes,
+                                       'recorded_files': recorded_files, 'actual_files': actual_files})
+
+    if fix and (size_mismatches or counter_mismatches):
+        with database.write_lock:
+            try:
+                c.executemany("UPDATE files SET size = ? WHERE path = ?", [(m['actual'], m['path']) for m in size_mismatches])
+                # 先修正文件大小，再按 files 表整体重算计数器
+                c.execute("""
+                    INSERT INTO storage_usage (user_id, bytes_used, file_count, updated_at)
+                    SELECT user_id, COALESCE(SUM(size), 0), COUNT(*), ? FROM files GROUP BY user_id
+                    ON CONFLICT(user_id) DO UPDATE SET bytes_used = excluded.bytes_used, file_count = excluded.file_count,
+                        updated_at = excluded.updated_at
+                """, (datetime.now(),))
+                c.execute("UPDATE storage_usage SET bytes_used = 0, file_count = 0 WHERE user_id NOT IN (SELECT user_id FROM files)")
+                conn.commit()
+            except:
+                conn.rollback()
+
+    orphan_blobs = []
+    if os.path.isdir(BLOB_FOLDER):
+        c.execute("SELECT hash FROM blobs")
+        known = {row[0] for row in c.fetchall()}
+        for directory, _, names in os.walk(BLOB_FOLDER):
+            for name in names:
+                if '.' not in name and name not in known:
+                    orphan_blobs.append(os.path.join(directory, name))
+
+    return {'checked_files': checked, 'missing_files': missing_files, 'size_mismatches': size_mismatches,
+            'counter_mismatches': counter_mismatches, 'orphan_blobs': orphan_blobs}
+
+async def run_storage_reconciliation():
+    """
+    启动时立即核对一次存储用量计数器，之后每隔 RECONCILE_INTERVAL_SECONDS 核对一次，
+    供长期运行的API服务作为后台任务启动。
+    """
+    while True:
+        await asyncio.to_thread(reconcile_storage_usage)
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
 
 def list_user_files(user_id):
     """
@@ -72,29 +592,145 @@ def list_user_files(user_id):
     files = c.fetchall()
     return [{'id': f[0], 'name': f[1]} for f in files]
 
+def get_accessible_file(file_id, user_id):
+    """
+    获取用户有权访问的文件信息。
+
+    文件的上传者和被共享者都可以访问，使用一条查询完成，
+    共享关系通过 file_shares 上 (file_id, shared_with) 唯一索引查找。
+    结果（包括无权访问）会缓存 ACCESS_CACHE_TTL 秒，断点续传等重复请求不再查询数据库。
+
+    参数:
+    file_id: 文件ID
+    user_id: 请求访问的用户ID
+
+    返回:
+    包含文件信息的字典，如果文件不存在或用户无权限则返回None
+    """
+    key = (file_id, user_id)
+    with _access_cache_lock:
+        if key in _access_cache:
+            return _access_cache[key]
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT f.id, f.name, f.path, f.size, f.blob_hash, f.uploaded_at, f.user_id
+        FROM files f
+        WHERE f.id = ? AND (f.user_id = ? OR EXISTS (
+            SELECT 1 FROM file_shares s WHERE s.file_id = f.id AND s.shared_with = ?
+        ))
+    """, (file_id, user_id, user_id))
+    f = c.fetchone()
+    file = None
+    if f:
+        file = {'id': f[0], 'name': f[1], 'path': f[2], 'size': f[3], 'blob_hash': f[4], 'uploaded_at': f[5], 'owner_id': f[6]}
+    with _access_cache_lock:
+        _access_cache[key] = file
+    return file
+
+def can_access_file(file_id, user_id):
+    """判断用户是否可以访问文件（上传者或被共享者），结果带缓存"""
+    return get_accessible_file(file_id, user_id) is not None
+
+def _invalidate_access_cache():
+    """共享关系或文件发生变化后清空访问检查缓存"""
+    with _access_cache_lock:
+        _access_cache.clear()
+
+def _file_url_message(file_id, user_id, expires):
+    """签名链接中被签名的内容"""
+    return f"file:{file_id}:{user_id}:{expires}"
+
+def sign_file_url(file_id, user_id, ttl=SIGNED_URL_TTL):
+    """
+    生成文件下载和预览链接的查询参数。
+
+    浏览器直接打开的链接无法携带 API 令牌，因此用该用户的 API 令牌对文件ID、用户ID和过期时间签名，
+    修改其中任何一项都会使签名失效；用户重新生成令牌后旧链接全部失效。
+
+    参数:
+    file_id: 文件ID
+    user_id: 访问文件的用户ID
+    ttl: 链接有效期，默认为 SIGNED_URL_TTL
+
+    返回:
+    查询字符串，包含user_id、expires和signature
+    """
+    expires = int(time.time() + ttl.total_seconds())
+    signature = security.sign_message(_file_url_message(file_id, user_id, expires), auth.get_api_token(user_id))
+    return f"user_id={user_id}&expires={expires}&signature={signature}"
+
+def verify_file_url(file_id, user_id, expires, signature):
+    """
+    校验签名链接。
+
+    参数:
+    file_id: 文件ID
+    user_id: 链接中的用户ID
+    expires: 链接中的过期时间（Unix时间戳）
+    signature: 链接中的签名
+
+    返回:
+    签名有效且未过期时返回True
+    """
+    key = auth.get_api_token(user_id, create=False)
+    if key is None or expires < time.time():
+        return False
+    return security.verify_signature(_file_url_message(file_id, user_id, expires), key, signature)
+
 def download_file(file_id, user_id):
     """
     获取指定文件的路径，用于下载
     
     参数:
     file_id: 文件ID
-    user_id: 请求下载的用户ID
+    user_id: 请求下载的用户ID，可以是上传者或被共享者
     
     返回:
     文件路径，如果文件不存在或用户无权限则返回None
     """
-    conn = database.get_connection()
-    c = conn.cursor()
-    c.execute("SELECT path FROM files WHERE id = ? AND user_id = ?", (file_id, user_id))
-    result = c.fetchone()
-    if result:
-        return result[0]
-    return None
+    file = get_accessible_file(file_id, user_id)
+    return file['path'] if file else None
+
+def parse_range(header, size):
+    """
+    解析 HTTP Range 请求头。
+
+    只支持单个字节范围（bytes=a-b、bytes=a-、bytes=-n），多个范围或格式不正确时忽略，返回整个文件。
+
+    参数:
+    header: Range 请求头的值，可为None
+    size: 文件大小
+
+    返回:
+    (起始位置, 结束位置) 元组，均包含在内；应返回整个文件时返回None
+
+    异常:
+    ValueError: 范围无法满足（起始位置超出文件大小，或对空文件请求后缀范围）
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, separator, last = header[len('bytes='):].strip().partition('-')
+    if not separator or not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+        return None
+    if not first:
+        # 后缀范围：最后 n 个字节；空文件没有可以返回的字节
+        if int(last) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, min(int(last), size - 1) if last else size - 1
 
 def delete_file(file_id, user_id):
     """
     删除指定的文件
     
+    文件记录立即删除；对应 blob 的引用计数减一，数据由垃圾回收在最后一个引用消失后释放。
+
     参数:
     file_id: 要删除的文件ID
     user_id: 请求删除的用户ID
@@ -104,48 +740,302 @@ def delete_file(file_id, user_id):
     """
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("SELECT path FROM files WHERE id = ? AND user_id = ?", (file_id, user_id))
-    result = c.fetchone()
-    if result:
-        os.remove(result[0])
-        c.execute("DELETE FROM files WHERE id = ?", (file_id,))
-        conn.commit()
-        return True
-    return False
+    with database.write_lock:
+        try:
+            c.execute("SELECT path, blob_hash, size FROM files WHERE id = ? AND user_id = ?", (file_id, user_id))
+            result = c.fetchone()
+            if not result:
+                return False
+            path, blob_hash, size = result
+            if size is None:
+                # 升级前上传的文件没有记录大小，按磁盘上的实际大小扣减
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+            c.execute("DELETE FROM file_shares WHERE file_id = ?", (file_id,))
+            c.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            _add_usage(c, user_id, -size, -1)
+            if blob_hash:
+                c.execute("""
+                    UPDATE blobs SET ref_count = ref_count - 1,
+                           unreferenced_at = CASE WHEN ref_count = 1 THEN ? ELSE unreferenced_at END
+                    WHERE hash = ?
+                """, (datetime.now(), blob_hash))
+            elif os.path.exists(path):
+                # 内容寻址存储之前上传的文件没有 blob，直接删除
+                os.remove(path)
+            conn.commit()
+            _invalidate_access_cache()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def collect_garbage(grace=BLOB_GC_GRACE):
+    """
+    删除引用计数为0且超过保留期的 blob。
+
+    每个 blob 的记录删除和文件删除在同一个写事务中完成，
+    并发上传相同内容时要么先增加引用计数使其不再被回收，要么在回收提交后重新写入新的 blob。
+
+    参数:
+    grace: 引用计数降为0后的保留时间，默认为 BLOB_GC_GRACE
+
+    返回:
+    包含'blobs'（删除的 blob 数量）和'bytes'（释放的字节数）的字典
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT hash, size FROM blobs WHERE ref_count = 0 AND unreferenced_at < ?", (datetime.now() - grace,))
+    candidates = c.fetchall()
+    freed = {'blobs': 0, 'bytes': 0}
+    for digest, size in candidates:
+        with database.write_lock:
+            try:
+                c.execute("DELETE FROM blobs WHERE hash = ? AND ref_count = 0", (digest,))
+                deleted = c.rowcount
+                if deleted:
+                    file_previews.remove_previews(c, digest, _blob_path(digest))
+                    if os.path.exists(_blob_path(digest)):
+                        os.remove(_blob_path(digest))
+                conn.commit()
+            except:
+                conn.rollback()
+                continue
+        if deleted:
+            freed['blobs'] += 1
+            freed['bytes'] += size
+    return freed
+
+async def run_garbage_collector():
+    """
+    定期回收无引用的 blob 并清理过期的上传会话，供长期运行的API服务作为后台任务启动。
+    """
+    while True:
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+        await asyncio.to_thread(collect_garbage)
+        await asyncio.to_thread(cleanup_stale_uploads)
+
+def get_dedup_report():
+    """
+    生成去重统计报告。
+
+    返回:
+    包含以下键的字典：
+    'files': 文件记录数
+    'blobs': 仍被引用的 blob 数
+    'logical_bytes': 所有文件大小之和
+    'physical_bytes': 仍被引用的 blob 实际占用的字节数
+    'saved_bytes': 去重节省的字节数
+    'dedup_ratio': 逻辑大小与物理大小之比
+    'reclaimable_bytes': 等待垃圾回收的字节数
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE blob_hash IS NOT NULL")
+    files, logical_bytes = c.fetchone()
+    c.execute("""
+        SELECT COALESCE(SUM(ref_count > 0), 0),
+               COALESCE(SUM(CASE WHEN ref_count > 0 THEN size ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN ref_count = 0 THEN size ELSE 0 END), 0)
+        FROM blobs
+    """)
+    blobs, physical_bytes, reclaimable_bytes = c.fetchone()
+    return {
+        'files': files,
+        'blobs': blobs,
+        'logical_bytes': logical_bytes,
+        'physical_bytes': physical_bytes,
+        'saved_bytes': logical_bytes - physical_bytes,
+        'dedup_ratio': logical_bytes / physical_bytes if physical_bytes else 1.0,
+        'reclaimable_bytes': reclaimable_bytes,
+    }
+
+def _share_with_query(c, file_id, user_id, grantee_query, params):
+    """
+    把文件共享给查询选出的一组用户。
+
+    只有文件的上传者可以共享；已经共享过的用户由唯一索引忽略，上传者本人不会被加入。
+
+    参数:
+    c: 数据库游标对象
+    file_id: 文件ID
+    user_id: 共享文件的用户ID
+    grantee_query: 选出被共享用户ID的SELECT语句，结果列名为 id
+    params: grantee_query 的参数
+
+    返回:
+    新增的共享记录数量，文件不存在或不属于该用户时返回None
+    """
+    c.execute("SELECT 1 FROM files WHERE id = ? AND user_id = ?", (file_id, user_id))
+    if c.fetchone() is None:
+        return None
+    c.execute(f"""
+        INSERT OR IGNORE INTO file_shares (file_id, shared_by, shared_with, created_at)
+        SELECT ?, ?, g.id, ? FROM ({grantee_query}) g WHERE g.id != ?
+    """, (file_id, user_id, datetime.now()) + tuple(params) + (user_id,))
+    return c.rowcount
 
-def share_file(file_name, share_with, user_id):
+def _share(file_id, user_id, grantee_query, params):
+    """在一个事务中执行共享并清空访问检查缓存"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            count = _share_with_query(c, file_id, user_id, grantee_query, params)
+            conn.commit()
+        except:
+            conn.rollback()
+            return None
+    _invalidate_access_cache()
+    return count
+
+def share_file(file_id, share_with, user_id):
     """
     与其他用户共享文件
     
     参数:
-    file_name: 要共享的文件名
+    file_id: 要共享的文件ID
     share_with: 要共享给的用户名
     user_id: 共享文件的用户ID
     
     返回:
-    共享成功返回True，否则返回False
+    共享成功（包括此前已共享过）返回True，否则返回False
     """
     conn = database.get_connection()
     c = conn.cursor()
-    
-    # 获取要共享的文件ID
-    c.execute("SELECT id FROM files WHERE name = ? AND user_id = ?", (file_name, user_id))
-    file_result = c.fetchone()
-    if not file_result:
-        return False
-    
-    file_id = file_result[0]
-    
-    # 获取要共享给的用户ID
     c.execute("SELECT id FROM users WHERE username = ?", (share_with,))
-    user_result = c.fetchone()
-    if not user_result:
+    if c.fetchone() is None:
         return False
-    
-    share_with_id = user_result[0]
-    
-    # 创建共享记录
-    c.execute("INSERT INTO file_shares (file_id, shared_by, shared_with) VALUES (?, ?, ?)",
-              (file_id, user_id, share_with_id))
-    conn.commit()
-    return True
\ No newline at end of file
+    return _share(file_id, user_id, "SELECT id FROM users WHERE username = ?", (share_with,)) is not None
+
+def share_file_with_users(file_id, usernames, user_id):
+    """
+    把文件一次共享给多个用户。
+
+    参数:
+    file_id: 要共享的文件ID
+    usernames: 用户名列表
+    user_id: 共享文件的用户ID
+
+    返回:
+    新增的共享记录数量，文件不存在或不属于该用户时返回None
+    """
+    usernames = list(usernames)
+    if not usernames:
+        return 0
+    # 用 json_each 传入整个列表，避免超过SQLite的参数数量上限
+    return _share(file_id, user_id, "SELECT u.id FROM users u JOIN json_each(?) j ON j.value = u.username", (json.dumps(usernames),))
+
+def share_file_with_group(file_id, role, user_id):
+    """
+    把文件共享给某个用户组（角色）的所有成员。
+
+    参数:
+    file_id: 要共享的文件ID
+    role: 角色名，如'researcher'、'student'
+    user_id: 共享文件的用户ID
+
+    返回:
+    新增的共享记录数量，文件不存在或不属于该用户时返回None
+    """
+    return _share(file_id, user_id, "SELECT id FROM users WHERE role = ?", (role,))
+
+def share_file_with_project(file_id, project_id, user_id):
+    """
+    把文件共享给项目的所有成员。
+
+    参数:
+    file_id: 要共享的文件ID
+    project_id: 项目ID
+    user_id: 共享文件的用户ID
+
+    返回:
+    新增的共享记录数量，文件不存在或不属于该用户时返回None
+    """
+    return _share(file_id, user_id, "SELECT user_id AS id FROM project_members WHERE project_id = ?", (project_id,))
+
+def unshare_file(file_id, shared_with, user_id):
+    """
+    取消对某个用户的共享。
+
+    参数:
+    file_id: 文件ID
+    shared_with: 被共享者的用户ID
+    user_id: 文件上传者的用户ID
+
+    返回:
+    取消成功返回True，否则返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute("""
+            DELETE FROM file_shares
+            WHERE file_id = ? AND shared_with = ? AND file_id IN (SELECT id FROM files WHERE id = ? AND user_id = ?)
+        """, (file_id, shared_with, file_id, user_id))
+        conn.commit()
+    _invalidate_access_cache()
+    return c.rowcount > 0
+
+def get_file_shares(file_id, user_id):
+    """
+    获取文件的共享对象列表，只有上传者可以查看。
+
+    参数:
+    file_id: 文件ID
+    user_id: 文件上传者的用户ID
+
+    返回:
+    包含被共享者ID、用户名和共享时间的字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT u.id, u.username, s.created_at
+        FROM file_shares s
+        JOIN files f ON f.id = s.file_id
+        JOIN users u ON u.id = s.shared_with
+        WHERE s.file_id = ? AND f.user_id = ?
+        ORDER BY u.username
+    """, (file_id, user_id))
+    return [{'user_id': s[0], 'username': s[1], 'shared_at': s[2]} for s in c.fetchall()]
+
+def list_shared_with_me(user_id, limit=SHARED_PAGE_SIZE, before_id=None):
+    """
+    分页获取共享给用户的文件，最近共享的在前。
+
+    使用共享记录ID作为游标（键集分页），通过 (shared_with, id) 索引直接定位到页首，
+    翻到很后面的页也不需要扫描前面的记录。
+
+    参数:
+    user_id: 用户ID
+    limit: 每页数量，默认为 SHARED_PAGE_SIZE
+    before_id: 上一页返回的'next_before_id'，为None时返回第一页
+
+    返回:
+    包含以下键的字典：
+    'files': 文件信息字典列表（文件ID、名称、大小、共享者、共享时间）
+    'next_before_id': 下一页的游标，没有更多时为None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT s.id, f.id, f.name, f.size, u.username, s.created_at
+        FROM file_shares s
+        JOIN files f ON f.id = s.file_id
+        JOIN users u ON u.id = s.shared_by
+        WHERE s.shared_with = ? AND s.id < ?
+        ORDER BY s.id DESC
+        LIMIT ?
+    """, (user_id, before_id if before_id is not None else 2 ** 63 - 1, limit + 1))
+    rows = c.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    files = [{'id': r[1], 'name': r[2], 'size': r[3], 'shared_by': r[4], 'shared_at': r[5]} for r in rows]
+    return {'files': files, 'next_before_id': rows[-1][0] if has_more else None}
+
+def count_shared_with_me(user_id):
+    """获取共享给用户的文件总数"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM file_shares WHERE shared_with = ?", (user_id,))
+    return c.fetchone()[0]
@@ -0,0 +1,216 @@
+"""
+实时协作客户端模块
+
+这个模块为 Streamlit 会话提供一个长连接的 WebSocket 客户端，连接 real_time_collaboration 的聊天服务器。
+
+设计思路:
+1. 每个会话一个客户端，客户端在自己的后台线程中运行独立的事件循环，不占用 Streamlit 的脚本线程，
+   页面重新运行时连接保持不变，不需要每条消息都重新握手
+2. 连接断开后按指数退避（带随机抖动）自动重连，重连后重新加入之前订阅的聊天室
+3. 收到的消息放入线程安全的 queue.Queue，页面每次运行时取出；要发送的消息通过
+   call_soon_threadsafe 交给事件循环线程，断线期间暂存在有界的发送队列中，重连后发送
+4. 连接期间每 HEARTBEAT_INTERVAL 秒发送一次心跳，服务器据此判断用户是否在线
+5. 客户端的生命周期跟随页面：超过 IDLE_TIMEOUT 秒没有被使用（页面没有取消息、发消息或加入聊天室），
+   说明会话已结束或用户离开了页面，客户端自动停止，关闭连接并结束后台线程；页面再次使用时重新创建
+"""
+
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+import websockets
+from modules import real_time_collaboration
+
+# 重连退避的初始和最大等待时间（秒）
+RECONNECT_INITIAL_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
+# 断线期间暂存的待发送消息数量和收到的待处理消息数量上限
+OUTBOX_SIZE = 100
+INBOX_SIZE = 1000
+
+# 心跳间隔（秒），与服务器的设置一致
+HEARTBEAT_INTERVAL = real_time_collaboration.HEARTBEAT_INTERVAL
+
+# 客户端多久没有被使用时自动停止（秒），页面每秒取一次消息，远小于这个时间
+IDLE_TIMEOUT = 60
+
+class CollaborationClient:
+    """
+    在后台线程中保持 WebSocket 长连接的聊天客户端
+    """
+
+    def __init__(self, uri, token):
+        self.uri = uri
+        self.token = token
+        self.incoming = queue.Queue(maxsize=INBOX_SIZE)
+        self.connected = threading.Event()
+        self.rooms = set()
+        self._loop = asyncio.new_event_loop()
+        self._outbox = None
+        self._stopped = False
+        self._last_used = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="collaboration-client", daemon=True)
+
+    def start(self):
+        """启动后台线程，返回客户端本身"""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._outbox = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        try:
+            self._loop.run_until_complete(asyncio.gather(self._connect_forever(), self._stop_when_idle()))
+        except asyncio.CancelledError:
+            # stop() 取消了所有任务
+            pass
+        finally:
+            self._loop.close()
+
+    async def _connect_forever(self):
+        """保持连接，断开后按指数退避重连"""
+        delay = RECONNECT_INITIAL_DELAY
+        while not self._stopped:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    delay = RECONNECT_INITIAL_DELAY
+                    # 先标记为已连接再取订阅列表，之后加入的聊天室由 _join 经发送队列订阅
+                    self.connected.set()
+                    for room_id in list(self.rooms):
+                        await websocket.send(json.dumps(self._join_frame(room_id)))
+                    self._deliver({"type": "status", "connected": True})
+                    await self._pump(websocket)
+            except (OSError, websockets.WebSocketException):
+                pass
+            if self.connected.is_set():
+                self.connected.clear()
+                self._deliver({"type": "status", "connected": False})
+            if not self._stopped:
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _stop_when_idle(self):
+        """页面超过 IDLE_TIMEOUT 秒没有使用客户端时停止客户端"""
+        while not self._stopped:
+            idle = time.monotonic() - self._last_used
+            if idle >= IDLE_TIMEOUT:
+                self.stop()
+                return
+            await asyncio.sleep(IDLE_TIMEOUT - idle)
+
+    async def _pump(self, websocket):
+        """同时收发消息，任一方向出错时结束，由外层重连"""
+        async def receive():
+            async for message in websocket:
+                self._deliver(json.loads(message))
+
+        async def send():
+            while True:
+                data = await self._outbox.get()
+                await websocket.send(json.dumps(data))
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                await websocket.send(json.dumps({"type": "heartbeat"}))
+
+        tasks = [asyncio.create_task(receive()), asyncio.create_task(send()), asyncio.create_task(heartbeat())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _deliver(self, data):
+        """把收到的消息交给页面，页面长时间不读取时丢弃最旧的消息"""
+        while True:
+            try:
+                self.incoming.put_nowait(data)
+                return
+            except queue.Full:
+                try:
+                    self.incoming.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _post(self, data):
+        """在事件循环线程中把消息放入发送队列，队列满时丢弃最旧的消息"""
+        if self._outbox.full():
+            self._outbox.get_nowait()
+        self._outbox.put_nowait(data)
+
+    def send(self, data):
+        """
+        发送一条消息，可以在任意线程中调用，不等待发送完成
+
+        参数:
+        data (dict): 要发送的消息，会被编码为JSON
+        """
+        self._last_used = time.monotonic()
+        self._loop.call_soon_threadsafe(self._post, data)
+
+    def _join_frame(self, room_id):
+        """加入聊天室的消息，带上 API 令牌，服务器据此识别用户并检查聊天室成员关系"""
+        return {"type": "join", "room_id": room_id, "token": self.token}
+
+    def _join(self, room_id):
+        """在事件循环线程中记录订阅；已连接时立即订阅，否则在连接建立时订阅"""
+        if room_id not in self.rooms:
+            self.rooms.add(room_id)
+            if self.connected.is_set():
+                self._post(self._join_frame(room_id))
+
+    def _leave(self, room_id):
+        if room_id in self.rooms:
+            self.rooms.discard(room_id)
+            if self.connected.is_set():
+                self._post({"type": "leave", "room_id": room_id})
+
+    def join(self, room_id):
+        """订阅聊天室，重连后会自动重新订阅"""
+        self._last_used = time.monotonic()
+        self._loop.call_soon_threadsafe(self._join, room_id)
+
+    def leave(self, room_id):
+        """取消订阅聊天室"""
+        self._loop.call_soon_threadsafe(self._leave, room_id)
+
+    def set_typing(self, room_id, typing):
+        """设置当前用户在聊天室中是否正在输入"""
+        self.send({"type": "typing", "room_id": room_id, "typing": typing})
+
+    def drain(self):
+        """
+        取出所有已收到的消息，不阻塞
+
+        返回:
+        list: 按接收顺序排列的消息字典列表
+        """
+        self._last_used = time.monotonic()
+        messages = []
+        while True:
+            try:
+                messages.append(self.incoming.get_nowait())
+            except queue.Empty:
+                return messages
+
+    @property
+    def running(self):
+        """客户端是否仍在运行，停止（包括因闲置自动停止）后不能再使用"""
+        return not self._stopped and self._thread.is_alive()
+
+    def stop(self):
+        """停止客户端，关闭连接并结束后台线程"""
+        self._stopped = True
+
+        def cancel_all():
+            for task in asyncio.all_tasks(self._loop):
+                task.cancel()
+
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(cancel_all)
@@ -5,8 +5,10 @@
 该模块实现了一个基本的聊天系统，包括以下功能：
 1. 获取聊天室列表
 2. 创建新的聊天室
-3. 获取特定聊天室的消息
-4. 发送消息到聊天室
+3. 管理聊天室成员，只有成员可以查看和发送聊天室的消息
+4. 分页获取特定聊天室的消息
+5. 发送消息到聊天室
+6. 全文搜索聊天消息
 
 设计思路:
 1. 实现实时聊天功能
@@ -15,24 +17,85 @@
 4. 实现文件和图片共享
 5. 提供消息历史记录和搜索功能
 
+消息分页:
+- 消息按 (timestamp, id) 排序，使用键集分页：每次只取游标之前的一页，
+  查询走 (room_id, timestamp, id) 索引，耗时与聊天室的消息总数无关
+- 增量获取新消息按消息ID（写入顺序）判断，实时聊天批量写入的消息时间戳早于写入时间，也不会被漏掉
+- 用户名不再在每次查询中 JOIN users 表，而是按用户ID批量查询并缓存
+
+消息搜索:
+- 使用 chat_messages_fts 全文索引（trigram 分词），关键词按子串匹配，中文不需要分词
+- 页面和 API 只在当前用户是成员的聊天室中搜索（search_messages 的 user_id 参数）
+- 常见词可能匹配大量消息，只对最近的 SEARCH_RANK_WINDOW 条匹配按 BM25 相关度排序分页，
+  FTS5 按 rowid 倒序流式返回匹配项，耗时与匹配总数无关；匹配超过这个数量时结果中的'truncated'为True，
+  更早的匹配不会出现在任何一页中，调用方应提示用户缩小搜索范围（增加关键词或限定聊天室、时间）
+- trigram 索引只能检索不少于3个字符的关键词，更短的关键词（如两个汉字的词）在有较长关键词时用 LIKE 在候选消息上过滤；
+  全部关键词都少于3个字符时改用 chat_messages_fts_bigram 二字符片段索引查找，再用 LIKE 核对；
+  只有不含任何文字或数字的关键词（如标点）才按时间倒序扫描消息，直到找满一页
+
 注意：当前实现仅包含基本功能，未来可能会扩展以支持更多高级特性。
 """
 
+import re
+import threading
+from cachetools import TTLCache
 from utils import database
 from datetime import datetime
 
-def get_chat_rooms():
+# 每页的默认消息数量
+CHAT_PAGE_SIZE = 50
+
+# 用户名缓存：用户ID -> 用户名，用户改名最多在 USERNAME_CACHE_TTL 秒后生效
+USERNAME_CACHE_TTL = 300
+_username_cache = TTLCache(maxsize=10000, ttl=USERNAME_CACHE_TTL)
+_username_cache_lock = threading.Lock()
+
+# 参与相关度排序的最近匹配消息数量上限
+SEARCH_RANK_WINDOW = 1000
+
+# 搜索结果摘要中关键词的高亮标记（Markdown 粗体）和摘要长度
+SNIPPET_MARK = '**'
+SNIPPET_LENGTH = 40
+
+def get_chat_rooms(user_id=None):
     """
-    获取所有聊天室的列表
+    获取聊天室的列表
+
+    参数:
+    user_id (int): 只返回该用户是成员的聊天室，默认为None（所有聊天室）
 
     返回:
-    list: 包含聊天室信息的字典列表，每个字典包含'id'和'name'键
+    list: 包含聊天室信息的字典列表，每个字典包含'id'、'name'和'creator_id'键
     """
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("SELECT id, name FROM chat_rooms")
+    if user_id is None:
+        c.execute("SELECT id, name, creator_id FROM chat_rooms")
+    else:
+        c.execute("""
+            SELECT r.id, r.name, r.creator_id
+            FROM chat_room_members rm JOIN chat_rooms r ON r.id = rm.room_id
+            WHERE rm.user_id = ?
+            ORDER BY r.id
+        """, (user_id,))
     rooms = c.fetchall()
-    return [{'id': r[0], 'name': r[1]} for r in rooms]
+    return [{'id': r[0], 'name': r[1], 'creator_id': r[2]} for r in rooms]
+
+def get_chat_room(room_id):
+    """
+    获取指定聊天室
+
+    参数:
+    room_id (int): 聊天室ID
+
+    返回:
+    dict: 包含'id'、'name'和'creator_id'键的字典，聊天室不存在时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, name, creator_id FROM chat_rooms WHERE id = ?", (room_id,))
+    room = c.fetchone()
+    return {'id': room[0], 'name': room[1], 'creator_id': room[2]} if room else None
 
 def create_chat_room(name, creator_id):
     """
@@ -43,39 +106,195 @@ def create_chat_room(name, creator_id):
     creator_id (int): 创建者的用户ID
 
     返回:
-    bool: 创建成功返回True，失败返回False
+    bool: 创建成功返回True，失败返回False；创建者自动成为聊天室成员
     """
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("INSERT INTO chat_rooms (name, creator_id) VALUES (?, ?)", (name, creator_id))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
+    with database.write_lock:
+        try:
+            c.execute("INSERT INTO chat_rooms (name, creator_id) VALUES (?, ?)", (name, creator_id))
+            c.execute("INSERT INTO chat_room_members (room_id, user_id) VALUES (?, ?)", (c.lastrowid, creator_id))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
-def get_chat_messages(room_id):
+def is_room_member(room_id, user_id):
     """
-    获取指定聊天室的所有消息
+    检查用户是否是聊天室的成员
 
     参数:
     room_id (int): 聊天室ID
+    user_id (int): 用户ID
 
     返回:
-    list: 包含消息信息的字典列表，每个字典包含'content'、'timestamp'和'username'键
+    bool: 是成员返回True，否则（包括聊天室不存在）返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM chat_room_members WHERE room_id = ? AND user_id = ?", (room_id, user_id))
+    return c.fetchone() is not None
+
+def get_room_members(room_id):
+    """
+    获取聊天室成员
+
+    参数:
+    room_id (int): 聊天室ID
+
+    返回:
+    list: 包含成员ID和用户名的字典列表
     """
     conn = database.get_connection()
     c = conn.cursor()
     c.execute("""
-        SELECT m.content, m.timestamp, u.username 
-        FROM chat_messages m 
-        JOIN users u ON m.user_id = u.id 
-        WHERE m.room_id = ? 
-        ORDER BY m.timestamp
+        SELECT u.id, u.username
+        FROM chat_room_members rm
+        JOIN users u ON u.id = rm.user_id
+        WHERE rm.room_id = ?
+        ORDER BY u.username
     """, (room_id,))
-    messages = c.fetchall()
-    return [{'content': m[0], 'timestamp': m[1], 'username': m[2]} for m in messages]
+    return [{'id': m[0], 'username': m[1]} for m in c.fetchall()]
+
+def add_room_member(room_id, user_id):
+    """
+    添加聊天室成员
+
+    参数:
+    room_id (int): 聊天室ID
+    user_id (int): 用户ID
+
+    返回:
+    bool: 添加成功返回True，成员已存在或失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("INSERT OR IGNORE INTO chat_room_members (room_id, user_id) VALUES (?, ?)", (room_id, user_id))
+            conn.commit()
+            return c.rowcount > 0
+        except:
+            conn.rollback()
+            return False
+
+def remove_room_member(room_id, user_id):
+    """将用户移出聊天室"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute("DELETE FROM chat_room_members WHERE room_id = ? AND user_id = ?", (room_id, user_id))
+        conn.commit()
+
+def get_usernames(user_ids):
+    """
+    批量获取用户名，结果带缓存，只查询缓存中没有的用户。
+
+    参数:
+    user_ids (iterable): 用户ID
+
+    返回:
+    dict: 用户ID -> 用户名，不存在的用户不包含在结果中
+    """
+    user_ids = set(user_ids)
+    with _username_cache_lock:
+        names = {user_id: _username_cache[user_id] for user_id in user_ids if user_id in _username_cache}
+    missing = list(user_ids - names.keys())
+    if missing:
+        conn = database.get_connection()
+        c = conn.cursor()
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            c.execute(f"SELECT id, username FROM users WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            fetched = dict(c.fetchall())
+            names.update(fetched)
+            with _username_cache_lock:
+                _username_cache.update(fetched)
+    return names
+
+def get_chat_messages(room_id, limit=CHAT_PAGE_SIZE, before=None, after_id=None):
+    """
+    获取指定聊天室的一页消息
+
+    不指定游标时获取最新的一页；指定 before 时获取紧挨在它之前的一页（加载更早的消息），
+    指定 after_id 时获取ID大于它的一页（增量获取新消息）。
+
+    实时聊天服务器批量持久化消息，消息最多晚 PERSIST_INTERVAL_MS 写入数据库，且保留发送时较早的时间戳，
+    因此增量获取按写入顺序（ID）而不是 (timestamp, id) 判断，刷新时机落在发送和写入之间也不会漏掉消息。
+
+    参数:
+    room_id (int): 聊天室ID
+    limit (int): 每页消息数量，默认为 CHAT_PAGE_SIZE
+    before (tuple): 游标 (timestamp, id)，只返回排在它之前的消息，默认为None
+    after_id (int): 已获取的最大消息ID，只返回在它之后写入的消息，默认为None
+
+    返回:
+    list: 消息字典列表，每个字典包含'id'、'user_id'、'content'、'timestamp'和'username'键；
+          指定 after_id 时按写入顺序排列，否则按时间先后排列
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    if after_id is not None:
+        # +room_id 让查询走主键范围扫描，只读取 after_id 之后写入的少量消息，而不是整个聊天室的索引
+        c.execute("""
+            SELECT id, user_id, content, timestamp
+            FROM chat_messages
+            WHERE id > ? AND +room_id = ?
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, room_id, limit))
+        messages = c.fetchall()
+    else:
+        c.execute(f"""
+            SELECT id, user_id, content, timestamp
+            FROM chat_messages
+            WHERE room_id = ? {'AND (timestamp, id) < (?, ?)' if before is not None else ''}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (room_id, *(before or ()), limit))
+        messages = c.fetchall()[::-1]
+    usernames = get_usernames(m[1] for m in messages)
+    return [{'id': m[0], 'user_id': m[1], 'content': m[2], 'timestamp': m[3], 'username': usernames.get(m[1])}
+            for m in messages]
+
+def get_older_messages(room_id, before_timestamp=None, before_id=None, limit=CHAT_PAGE_SIZE):
+    """
+    加载更早的消息
+
+    参数:
+    room_id (int): 聊天室ID
+    before_timestamp (str): 当前已加载的最早一条消息的时间，为None时返回最新的一页
+    before_id (int): 当前已加载的最早一条消息的ID
+    limit (int): 每页消息数量，默认为 CHAT_PAGE_SIZE
+
+    返回:
+    dict: 包含'messages'（按时间先后排列）和'has_more'（是否还有更早的消息）
+    """
+    before = (before_timestamp, before_id) if before_timestamp is not None and before_id is not None else None
+    messages = get_chat_messages(room_id, limit=limit + 1, before=before)
+    return {'messages': messages[-limit:] if limit else [], 'has_more': len(messages) > limit}
+
+def save_messages(messages):
+    """
+    批量保存消息，所有消息在一个事务中写入，供实时聊天服务器批量持久化使用
+
+    参数:
+    messages (list): (room_id, user_id, content, timestamp) 元组列表
+
+    返回:
+    bool: 保存成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.executemany("INSERT INTO chat_messages (room_id, user_id, content, timestamp) VALUES (?, ?, ?, ?)", messages)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
 def send_message(room_id, user_id, content):
     """
@@ -98,4 +317,136 @@ def send_message(room_id, user_id, content):
         return True
     except:
         conn.rollback()
-        return False
\ No newline at end of file
+        return False
+
+def _search_terms(query):
+    """把搜索词按空白拆分为去重后的关键词列表"""
+    return list(dict.fromkeys(query.split()))
+
+def _make_snippet(content, terms, length=SNIPPET_LENGTH):
+    """
+    生成消息摘要：截取第一个关键词附近的文本，并高亮其中所有关键词
+
+    参数:
+    content (str): 消息内容
+    terms (list): 关键词列表
+    length (int): 摘要的大致字符数
+
+    返回:
+    str: 摘要文本，截断处用省略号表示
+    """
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    first = min((p for p in positions if p >= 0), default=0)
+    start = max(0, first - length // 4)
+    end = min(len(content), start + length)
+    start = max(0, end - length)
+    text = content[start:end]
+    pattern = '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    text = re.sub(pattern, lambda m: f"{SNIPPET_MARK}{m.group(0)}{SNIPPET_MARK}", text, flags=re.IGNORECASE)
+    return ('…' if start > 0 else '') + text + ('…' if end < len(content) else '')
+
+def search_messages(query, room_id=None, start=None, end=None, limit=CHAT_PAGE_SIZE, offset=0, user_id=None):
+    """
+    全文搜索聊天消息，结果按相关度排序并分页
+
+    多个关键词用空格分隔，消息需要包含所有关键词（不区分大小写）。
+
+    参数:
+    query (str): 搜索词
+    room_id (int): 只搜索该聊天室的消息，默认为None（搜索所有聊天室）
+    start (datetime|str): 只返回该时间及之后的消息，默认为None
+    end (datetime|str): 只返回该时间之前的消息（不含），默认为None
+    limit (int): 每页结果数量，默认为 CHAT_PAGE_SIZE
+    offset (int): 跳过的结果数量，用于翻页
+    user_id (int): 只搜索该用户是成员的聊天室，默认为None（不限制，仅供内部使用）
+
+    返回:
+    dict: 包含'results'、'has_more'（是否还有下一页）和'truncated'（匹配超过 SEARCH_RANK_WINDOW 条，
+          只有最近的这些匹配参与排序和分页）；每条结果包含'id'、'room_id'、'user_id'、'username'、
+          'content'、'timestamp'和'snippet'（高亮关键词的摘要）键
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return {'results': [], 'has_more': False, 'truncated': False}
+    indexed = [term for term in terms if len(term) >= 3]
+    short = [term for term in terms if len(term) < 3]
+    # 二字符片段索引按 unicode61 分词，标点等分隔符不会被索引，只用它查找含有文字或数字的短关键词
+    bigram = [term for term in short if any(ch.isalnum() for ch in term)]
+
+    # 聊天室和时间过滤条件
+    filters = []
+    params = []
+    if room_id is not None:
+        filters.append("m.room_id = ?")
+        params.append(room_id)
+    if user_id is not None:
+        filters.append("m.room_id IN (SELECT room_id FROM chat_room_members WHERE user_id = ?)")
+        params.append(user_id)
+    if start is not None:
+        filters.append("m.timestamp >= ?")
+        params.append(start.strftime("%Y-%m-%d %H:%M:%S") if isinstance(start, datetime) else start)
+    if end is not None:
+        filters.append("m.timestamp < ?")
+        params.append(end.strftime("%Y-%m-%d %H:%M:%S") if isinstance(end, datetime) else end)
+    conditions = filters + ["m.content LIKE ? ESCAPE '\\'"] * len(short)
+    like_params = ['%' + re.sub(r'([\\%_])', r'\\\1', term) + '%' for term in short]
+
+    conn = database.get_connection()
+    c = conn.cursor()
+    truncated = False
+    if indexed or bigram:
+        id_range = ''
+        if end is not None:
+            # 索引按 rowid 倒序返回匹配项，结束时间之后的匹配都要被逐条跳过；
+            # 先用时间索引求出范围内消息的ID区间，再让 FTS5 只查找这个 rowid 区间
+            c.execute(f"SELECT MIN(m.id), MAX(m.id) FROM chat_messages m WHERE {' AND '.join(filters)}", params)
+            low, high = c.fetchone()
+            if low is None:
+                return {'results': [], 'has_more': False, 'truncated': False}
+            id_range = f" AND f.rowid BETWEEN {low} AND {high}"
+        # 每个关键词作为一个带引号的短语，避免用户输入被解释为 FTS5 查询语法；
+        # 二字符片段索引中一个字符的关键词按前缀查找，短关键词最后仍由 LIKE 核对
+        if indexed:
+            fts = 'chat_messages_fts'
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in indexed)
+        else:
+            fts = 'chat_messages_fts_bigram'
+            match = ' '.join('"' + term.replace('"', '""') + '"' + ('*' if len(term) == 1 else '') for term in bigram)
+        ranked = f"""
+            SELECT m.id, m.room_id, m.user_id, m.content, m.timestamp, f.rank AS score
+            FROM {fts} f JOIN chat_messages m ON m.id = f.rowid
+            WHERE {fts} MATCH ?{id_range} {''.join(' AND ' + condition for condition in conditions)}
+            ORDER BY f.rowid DESC
+            LIMIT ?
+        """
+        ranked_params = (match, *params, *like_params, SEARCH_RANK_WINDOW)
+        # 同时统计参与排序的匹配数，达到 SEARCH_RANK_WINDOW 说明更早的匹配被截断
+        c.execute(f"""
+            SELECT id, room_id, user_id, content, timestamp, COUNT(*) OVER ()
+            FROM ({ranked})
+            ORDER BY score, id DESC
+            LIMIT ? OFFSET ?
+        """, (*ranked_params, limit + 1, offset))
+        rows = c.fetchall()
+        if rows:
+            truncated = rows[0][5] >= SEARCH_RANK_WINDOW
+        elif offset > 0:
+            # 翻页超出了参与排序的范围，单独统计
+            c.execute(f"SELECT COUNT(*) FROM ({ranked})", ranked_params)
+            truncated = c.fetchone()[0] >= SEARCH_RANK_WINDOW
+    else:
+        c.execute(f"""
+            SELECT m.id, m.room_id, m.user_id, m.content, m.timestamp
+            FROM chat_messages m
+            WHERE {' AND '.join(conditions)}
+            ORDER BY m.id DESC
+            LIMIT ? OFFSET ?
+        """, (*params, *like_params, limit + 1, offset))
+        rows = c.fetchall()
+    usernames = get_usernames(r[2] for r in rows[:limit])
+    return {'results': [{'id': r[0], 'room_id': r[1], 'user_id': r[2], 'username': usernames.get(r[2]),
+                         'content': r[3], 'timestamp': r[4], 'snippet': _make_snippet(r[3], terms)}
+                        for r in rows[:limit]],
+            'has_more': len(rows) > limit,
+            'truncated': truncated}
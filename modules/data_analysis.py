@@ -6,7 +6,7 @@
 
 主要功能:
 1. 基础统计分析
-2. 预测分析（支出、库存需求）
+2. 预测分析（支出、库存需求；库存需求基于月度使用量矩阵做向量化趋势拟合）
 3. 项目成功因素分析
 4. 用户行为聚类分析
 5. 综合洞察生成
@@ -160,43 +160,67 @@ def predict_future_expenses(months_ahead=3):
         'dates': future_dates
     }
 
-def predict_inventory_needs():
+def predict_inventory_needs(min_history_months=12, test_size=0.2):
     """
     预测未来的库存需求
 
+    对每个物品的月使用量拟合线性趋势，所有物品在同一组矩阵运算中完成：
+    按掩码计算加权最小二乘的闭式解，用每个物品最后 test_size 比例的月份评估，
+    再用完整历史预测下个月的需求。
+
+    参数:
+    min_history_months (int): 至少需要的历史月数，默认为12
+    test_size (float): 用于评估的末尾月份比例，默认为0.2
+
     返回:
     dict: 包含每种物品预测需求量和模型评估指标的字典
     """
-    inventory_usage = inventory_management.get_inventory_usage_history()
-    
-    predictions = {}
-    for item in inventory_usage:
-        if len(item['usage_history']) > 12:  # 只预测有足够历史数据的物品
-            # 准备特征
-            X = np.array(range(len(item['usage_history']))).reshape(-1, 1)
-            y = np.array(item['usage_history'])
-            
-            # 分割数据
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # 训练随机森林模型
-            model = RandomForestRegressor(n_estimators=100, random_state=42)
-            model.fit(X_train, y_train)
-            
-            # 评估模型
-            y_pred = model.predict(X_test)
-            mse = mean_squared_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
-            
-            # 预测下个月的需求
-            next_month_prediction = model.predict([[len(item['usage_history'])]])
-            predictions[item['name']] = {
-                'prediction': next_month_prediction[0],
-                'mse': mse,
-                'r2': r2
-            }
-    
-    return predictions
+    history = inventory_management.get_inventory_usage_history()
+    usage = history['usage'].astype(float)
+    first_month = history['first_month']
+    n_months = usage.shape[1]
+
+    # 只预测有足够历史数据的物品
+    lengths = np.where(first_month >= 0, n_months - first_month, 0)
+    selected = lengths > min_history_months
+    if not selected.any():
+        return {}
+    y = usage[selected]
+    starts = first_month[selected][:, None]
+    lengths = lengths[selected][:, None]
+    x = np.arange(n_months, dtype=float)[None, :]
+    in_history = x >= starts
+    test_counts = np.ceil(lengths * test_size)
+    is_test = in_history & (x >= n_months - test_counts)
+
+    def fit(weights):
+        sw = weights.sum(axis=1)
+        sx = (weights * x).sum(axis=1)
+        sy = (weights * y).sum(axis=1)
+        sxx = (weights * x * x).sum(axis=1)
+        sxy = (weights * x * y).sum(axis=1)
+        denominator = sw * sxx - sx * sx
+        slope = np.divide(sw * sxy - sx * sy, denominator, out=np.zeros_like(sw), where=denominator != 0)
+        intercept = (sy - slope * sx) / sw
+        return slope, intercept
+
+    # 评估模型
+    slope, intercept = fit((in_history & ~is_test).astype(float))
+    residuals = np.where(is_test, y - (intercept[:, None] + slope[:, None] * x), 0.0)
+    n_test = is_test.sum(axis=1)
+    mse = (residuals ** 2).sum(axis=1) / n_test
+    test_mean = np.where(is_test, y, 0.0).sum(axis=1) / n_test
+    sst = (np.where(is_test, y - test_mean[:, None], 0.0) ** 2).sum(axis=1)
+    r2 = np.where(sst > 0, 1 - (residuals ** 2).sum(axis=1) / np.where(sst > 0, sst, 1), 0.0)
+
+    # 预测下个月的需求
+    slope, intercept = fit(in_history.astype(float))
+    next_month = np.maximum(intercept + slope * n_months, 0)
+
+    return {
+        name: {'prediction': prediction, 'mse': error, 'r2': score}
+        for name, prediction, error, score in zip(history['names'][selected], next_month, mse, r2)
+    }
 
 def analyze_project_success_factors():
     """
@@ -0,0 +1,262 @@
+# modules/file_previews.py
+
+"""
+文件预览模块
+
+这个模块在文件上传后于后台生成预览，用户不需要下载大文件就能看到其内容：
+- PDF：第一页渲染为PNG（使用 poppler 的 pdftoppm）
+- 图片：缩略图
+- CSV/XLSX：前若干行及各列的数据类型
+
+设计思路:
+1. 预览按 blob 生成，内容相同的文件共用一份预览，预览文件保存在 blob 旁边（<blob路径>.preview.png/.json）
+2. 上传完成时只把任务放入有界队列（put_nowait），队列满时任务保留为 pending 状态，上传永远不会等待预览
+3. 一个调度线程从队列取任务，提交给有界的进程池，同时在进程池中的任务数不超过工作进程数
+4. 预览在被请求时才读取；尚未生成（例如服务重启后丢失了队列）时重新入队并返回 pending
+"""
+
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+from PIL import Image
+from utils import database
+
+# 进程池的工作进程数和等待队列的长度
+PREVIEW_WORKERS = 2
+PREVIEW_QUEUE_SIZE = 256
+
+# 缩略图的最大边长（像素）和表格预览的行数
+THUMBNAIL_SIZE = (320, 320)
+TABLE_PREVIEW_ROWS = 20
+
+# 单个预览任务的超时时间（秒）
+PREVIEW_TIMEOUT = 120
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+# 旧版 .xls 需要 xlrd，不在依赖中，因此只预览 .xlsx（openpyxl）
+PREVIEW_KINDS = {**{ext: 'image' for ext in IMAGE_EXTENSIONS}, '.pdf': 'pdf', '.csv': 'csv', '.xlsx': 'excel'}
+
+_queue = queue.Queue(maxsize=PREVIEW_QUEUE_SIZE)
+_queued = set()
+_state_lock = threading.Lock()
+_executor = None
+_dispatcher = None
+
+def preview_kind(file_name):
+    """
+    根据文件扩展名判断预览类型。
+
+    返回:
+    str: 'image'、'pdf'、'csv'、'excel'，不支持预览时返回None
+    """
+    return PREVIEW_KINDS.get(os.path.splitext(file_name)[1].lower())
+
+def preview_path(blob_path, kind):
+    """获取预览文件的路径，图片和PDF的预览为PNG，表格的预览为JSON"""
+    return blob_path + ('.preview.json' if kind in ('csv', 'excel') else '.preview.png')
+
+def _render_image(source, target):
+    with Image.open(source) as image:
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGB')
+        image.save(target, 'PNG')
+
+def _render_pdf(source, target):
+    if shutil.which('pdftoppm') is None:
+        raise RuntimeError("pdftoppm is not installed")
+    prefix = target[:-len('.png')]
+    subprocess.run(['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(max(THUMBNAIL_SIZE)), source, prefix],
+                   check=True, capture_output=True, timeout=PREVIEW_TIMEOUT)
+
+def _render_table(source, target, kind):
+    if kind == 'csv':
+        df = pd.read_csv(source, nrows=TABLE_PREVIEW_ROWS)
+    else:
+        df = pd.read_excel(source, nrows=TABLE_PREVIEW_ROWS)
+    summary = {
+        'columns': [{'name': str(name), 'dtype': str(dtype)} for name, dtype in df.dtypes.items()],
+        'rows': json.loads(df.to_json(orient='values', date_format='iso', force_ascii=False)),
+    }
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+
+def render_preview(kind, source, target):
+    """
+    生成一个预览文件，在工作进程中运行。
+
+    先写入临时文件再原子重命名，读取方不会看到写了一半的预览。
+
+    参数:
+    kind (str): 预览类型
+    source (str): blob 路径
+    target (str): 预览文件路径
+    """
+    temp = target + '.tmp' + os.path.splitext(target)[1]
+    try:
+        if kind == 'image':
+            _render_image(source, temp)
+        elif kind == 'pdf':
+            _render_pdf(source, temp)
+        else:
+            _render_table(source, temp, kind)
+        os.replace(temp, target)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+def _get_status(blob_hash):
+    """获取预览记录的状态和错误信息，没有记录时返回(None, None)"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT status, error FROM file_previews WHERE blob_hash = ?", (blob_hash,))
+    return c.fetchone() or (None, None)
+
+def _set_status(blob_hash, status, kind=None, error=None):
+    """更新预览状态"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("""
+                INSERT INTO file_previews (blob_hash, kind, status, error, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(blob_hash) DO UPDATE SET kind = COALESCE(excluded.kind, kind), status = excluded.status,
+                    error = excluded.error, updated_at = excluded.updated_at
+            """, (blob_hash, kind, status, error, datetime.now()))
+            conn.commit()
+        except:
+            conn.rollback()
+
+def _finish(blob_hash, future):
+    """进程池任务完成后的回调，记录结果并释放队列中的位置"""
+    try:
+        future.result()
+        _set_status(blob_hash, 'ready')
+    except Exception as e:
+        _set_status(blob_hash, 'failed', error=str(e)[:500])
+    finally:
+        with _state_lock:
+            _queued.discard(blob_hash)
+
+def _dispatch():
+    """调度线程：从队列取任务提交给进程池，进程池中的任务数不超过 PREVIEW_WORKERS"""
+    slots = threading.BoundedSemaphore(PREVIEW_WORKERS)
+    while True:
+        blob_hash, kind, source, target = _queue.get()
+        slots.acquire()
+
+        def done(future, blob_hash=blob_hash):
+            slots.release()
+            _finish(blob_hash, future)
+
+        try:
+            future = _executor.submit(render_preview, kind, source, target)
+        except Exception as e:
+            # 进程池已关闭或损坏时任务直接记为失败
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(done)
+
+def _ensure_started():
+    """首次使用时启动进程池和调度线程"""
+    global _executor, _dispatcher
+    with _state_lock:
+        if _executor is None:
+            # 使用 spawn 启动工作进程，避免在多线程进程中 fork
+            _executor = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(target=_dispatch, name='preview-dispatcher', daemon=True)
+            _dispatcher.start()
+
+def request_preview(blob_hash, blob_path, file_name):
+    """
+    请求为 blob 生成预览，立即返回，不等待生成。
+
+    队列已满时任务保持 pending 状态，之后请求预览时会重新入队。
+
+    参数:
+    blob_hash (str): blob 的内容哈希
+    blob_path (str): blob 路径
+    file_name (str): 原始文件名，用于判断预览类型
+
+    返回:
+    str: 预览状态：'ready'（已有预览）、'queued'、'pending'（队列已满）、'unsupported'
+    """
+    kind = preview_kind(file_name)
+    if kind is None:
+        return 'unsupported'
+    with _state_lock:
+        if blob_hash in _queued:
+            return 'queued'
+    if _get_status(blob_hash)[0] == 'ready' and os.path.exists(preview_path(blob_path, kind)):
+        # 相同内容之前已经生成过预览
+        return 'ready'
+    _set_status(blob_hash, 'pending', kind)
+    _ensure_started()
+    with _state_lock:
+        if blob_hash in _queued:
+            return 'queued'
+        try:
+            _queue.put_nowait((blob_hash, kind, blob_path, preview_path(blob_path, kind)))
+        except queue.Full:
+            return 'pending'
+        _queued.add(blob_hash)
+    return 'queued'
+
+def get_preview(blob_hash, blob_path, file_name):
+    """
+    获取文件的预览，预览不存在时请求生成。
+
+    参数:
+    blob_hash (str): blob 的内容哈希
+    blob_path (str): blob 路径
+    file_name (str): 原始文件名
+
+    返回:
+    dict: 包含'status'和'kind'；status 为'ready'时图片类预览包含'path'，表格类预览包含'columns'和'rows'，
+          status 为'failed'时包含'error'
+    """
+    kind = preview_kind(file_name)
+    if kind is None or not blob_hash:
+        return {'status': 'unsupported', 'kind': kind}
+    status, error = _get_status(blob_hash)
+    path = preview_path(blob_path, kind)
+    if status == 'failed':
+        return {'status': 'failed', 'kind': kind, 'error': error}
+    if status == 'ready' and os.path.exists(path):
+        if kind in ('csv', 'excel'):
+            with open(path, encoding='utf-8') as f:
+                return {'status': 'ready', 'kind': kind, **json.load(f)}
+        return {'status': 'ready', 'kind': kind, 'path': path}
+    request_preview(blob_hash, blob_path, file_name)
+    return {'status': 'pending', 'kind': kind}
+
+def remove_previews(c, blob_hash, blob_path):
+    """
+    在调用方的事务中删除 blob 的预览记录和预览文件，由垃圾回收在删除 blob 时调用。
+
+    参数:
+    c: 数据库游标对象
+    blob_hash (str): blob 的内容哈希
+    blob_path (str): blob 路径
+    """
+    c.execute("DELETE FROM file_previews WHERE blob_hash = ?", (blob_hash,))
+    for suffix in ('.preview.png', '.preview.json'):
+        if os.path.exists(blob_path + suffix):
+            os.remove(blob_path + suffix)
+
+def shutdown():
+    """关闭进程池，已提交的任务会被取消"""
+    global _executor
+    with _state_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,188 @@
+# modules/free_busy.py
+
+"""
+空闲/忙碌计算模块
+
+这个模块根据参与者的日程事件和设备/资源预约计算忙碌时间，
+并在工作时间内为一组参与者寻找可用的会议时间段。
+
+设计思路:
+1. 一次性批量取回所有参与者的忙碌区间（单次事件、重复事件、设备预约、资源预约）
+2. 使用扫描线算法合并N个参与者的忙碌区间，得到按时间排序的忙碌时间段及每段的忙碌人员
+3. 在工作时间内按固定步长生成候选时间段，借助二分查找统计每个候选时间段的冲突人员
+4. 按冲突人数和开始时间对候选时间段排序，优先返回所有人都有空的时间段
+"""
+
+import heapq
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from utils import database
+from modules import schedule_management
+
+# 默认工作时间及候选时间段步长
+WORK_START = time(9, 0)
+WORK_END = time(18, 0)
+SLOT_STEP_MINUTES = 30
+
+def _get_user_ids(c, usernames):
+    """
+    根据用户名批量获取用户ID。
+
+    返回:
+    list: 存在的用户ID列表
+    """
+    if not usernames:
+        return []
+    placeholders = ', '.join('?' * len(usernames))
+    c.execute(f"SELECT id FROM users WHERE username IN ({placeholders})", tuple(usernames))
+    return [row[0] for row in c.fetchall()]
+
+def _get_booking_intervals(c, user_ids, start_time, end_time):
+    """
+    获取用户在时间段内的设备预约和资源预约。
+
+    返回:
+    list: (用户名, 开始时间, 结束时间) 元组列表
+    """
+    placeholders = ', '.join('?' * len(user_ids))
+    lower = start_time.strftime(schedule_management.TIMESTAMP_FORMAT)
+    upper = end_time.strftime(schedule_management.TIMESTAMP_FORMAT)
+    c.execute(f"""
+        SELECT u.username, eb.start_time, eb.end_time
+        FROM equipment_bookings eb
+        JOIN users u ON u.id = eb.user_id
+        WHERE eb.user_id IN ({placeholders}) AND eb.start_time < ? AND eb.end_time > ?
+    """, tuple(user_ids) + (upper, lower))
+    intervals = [(username, datetime.fromisoformat(str(start)), datetime.fromisoformat(str(end))) for username, start, end in c.fetchall()]
+
+    c.execute(f"""
+        SELECT u.username, rb.date, rb.time_slot
+        FROM resource_bookings rb
+        JOIN users u ON u.id = rb.user_id
+        WHERE rb.user_id IN ({placeholders}) AND rb.date >= ? AND rb.date <= ?
+    """, tuple(user_ids) + (start_time.date().isoformat(), end_time.date().isoformat()))
+    for username, booking_date, time_slot in c.fetchall():
+        slot_start, _, slot_end = time_slot.partition('-')
+        day = date.fromisoformat(str(booking_date)[:10])
+        intervals.append((username, datetime.combine(day, time.fromisoformat(slot_start)), datetime.combine(day, time.fromisoformat(slot_end))))
+    return intervals
+
+def merge_busy_intervals(intervals):
+    """
+    使用扫描线算法合并多个参与者的忙碌区间。
+
+    将每个区间拆成开始(+1)和结束(-1)两个事件点按时间排序后扫描，
+    同一时刻先处理结束再处理开始，因此首尾相接的区间不会被视为冲突。
+    同一参与者自身重叠的区间按计数处理，只计为一人忙碌。
+
+    参数:
+    intervals (list): (用户名, 开始时间, 结束时间) 元组列表
+
+    返回:
+    list: 按时间排序且互不重叠的 (开始时间, 结束时间, 忙碌用户名frozenset) 元组列表
+    """
+    points = []
+    for username, start, end in intervals:
+        if start < end:
+            points.append((start, 1, username))
+            points.append((end, -1, username))
+    points.sort(key=lambda p: (p[0], p[1]))
+
+    segments = []
+    depth = {}
+    busy = set()
+    previous = None
+    for moment, delta, username in points:
+        if previous is not None and moment > previous and busy:
+            current = frozenset(busy)
+            if segments and segments[-1][1] == previous and segments[-1][2] == current:
+                segments[-1] = (segments[-1][0], moment, current)
+            else:
+                segments.append((previous, moment, current))
+        depth[username] = depth.get(username, 0) + delta
+        if depth[username] > 0:
+            busy.add(username)
+        else:
+            busy.discard(username)
+        previous = moment
+    return segments
+
+def _collect_intervals(usernames, start_time, end_time):
+    """批量收集参与者在时间段内的所有忙碌区间"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    user_ids = _get_user_ids(c, usernames)
+    if not user_ids:
+        return []
+    return schedule_management.get_busy_intervals(user_ids, start_time, end_time) + _get_booking_intervals(c, user_ids, start_time, end_time)
+
+def get_free_busy(usernames, start_time, end_time):
+    """
+    获取一组参与者在时间段内合并后的忙碌时间。
+
+    参数:
+    usernames (list): 参与者用户名列表
+    start_time (datetime): 时间段开始
+    end_time (datetime): 时间段结束（不包含）
+
+    返回:
+    list: 包含'start'、'end'和'busy'（忙碌的用户名列表）的字典列表
+    """
+    return [{'start': max(start, start_time), 'end': min(end, end_time), 'busy': sorted(busy)}
+            for start, end, busy in merge_busy_intervals(_collect_intervals(usernames, start_time, end_time))]
+
+def find_meeting_slots(usernames, start_date, end_date, duration_minutes=60, work_start=WORK_START, work_end=WORK_END,
+                       step_minutes=SLOT_STEP_MINUTES, limit=10, include_weekends=False):
+    """
+    在工作时间内为一组参与者寻找会议时间段，并按适合程度排序。
+
+    排序规则：冲突人数越少越靠前，冲突人数相同时开始时间越早越靠前。
+    所有人都有空的时间段冲突人数为0，总是排在最前面。
+
+    参数:
+    usernames (list): 参与者用户名列表
+    start_date (date): 开始日期
+    end_date (date): 结束日期（包含当天）
+    duration_minutes (int): 会议时长（分钟），默认为60
+    work_start (time): 每天工作开始时间，默认为9:00
+    work_end (time): 每天工作结束时间，默认为18:00
+    step_minutes (int): 候选时间段的步长（分钟），默认为30
+    limit (int): 返回的时间段数量上限，默认为10
+    include_weekends (bool): 是否包含周末，默认为False
+
+    返回:
+    list: 包含'start'、'end'、'available'和'unavailable'的字典列表
+    """
+    lower = datetime.combine(start_date, time.min)
+    upper = datetime.combine(end_date, time.min) + timedelta(days=1)
+    segments = merge_busy_intervals(_collect_intervals(usernames, lower, upper))
+    segment_starts = [segment[0] for segment in segments]
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=step_minutes)
+    now = datetime.now()
+
+    def candidates():
+        day = start_date
+        while day <= end_date:
+            if include_weekends or day.weekday() < 5:
+                slot = datetime.combine(day, work_start)
+                day_end = datetime.combine(day, work_end)
+                while slot + duration <= day_end:
+                    if slot >= now:
+                        yield slot
+                    slot += step
+            day += timedelta(days=1)
+
+    ranked = []
+    for slot in candidates():
+        slot_end = slot + duration
+        conflicts = set()
+        i = max(bisect_right(segment_starts, slot) - 1, 0)
+        while i < len(segments) and segments[i][0] < slot_end:
+            if segments[i][1] > slot:
+                conflicts.update(segments[i][2])
+            i += 1
+        ranked.append((len(conflicts), slot, conflicts))
+
+    return [{'start': slot, 'end': slot + duration, 'available': [u for u in usernames if u not in conflicts], 'unavailable': sorted(conflicts)}
+            for _, slot, conflicts in heapq.nsmallest(limit, ranked, key=lambda r: (r[0], r[1]))]
@@ -4,13 +4,96 @@
 这个模块负责管理库存系统的核心功能。
 它包含了添加、更新、查询库存项目以及记录使用情况的函数。
 同时还提供了生成库存报告和设备使用率分析的功能。
+
+库存的每一次变化都追加到 stock_movements 流水表中，inventory_items.quantity 是流水的物化结果。
+出库使用带条件的原子扣减（WHERE quantity >= ?），库存不会变为负数；
+手动修改数量使用版本号做乐观并发检查，不会覆盖并发的扣减。
+每个物品每 SNAPSHOT_INTERVAL 条流水记录一次快照，任意历史时刻的数量通过
+"最近快照 + 其后少量流水" 计算，查询代价为一次索引查找。
+每次库存变化时在同一事务中维护低库存集合 low_stock_items，并在物品跌破再订货点时
+产生一条 stock_alerts 通知，回到再订货点以上后下次跌破会再次通知。
+再订货点可以手动设置，也可以由 replenishment_planning 根据需求统计每晚计算。
 """
 
 from utils import database
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
-def add_item(name, category, quantity, unit):
+# 每个物品每产生这么多次变更就记录一次库存快照
+SNAPSHOT_INTERVAL = 64
+
+# 未单独设置再订货点、也没有补货计划的物品使用的默认阈值
+DEFAULT_REORDER_POINT = 10
+
+# 物品的有效再订货点：手动设置优先，其次是补货计划算出的值，最后是默认阈值
+EFFECTIVE_REORDER_POINT = "COALESCE(i.reorder_point, i.planned_reorder_point, ?)"
+
+def _sync_low_stock(c, item_ids, timestamp):
+    """
+    在当前事务中根据物品的最新数量维护低库存集合。
+
+    新跌破再订货点的物品加入集合并产生一条通知；回到再订货点以上的物品移出集合。
+    只检查本次发生变化的物品，不扫描整个库存表。
+
+    参数:
+    c: 数据库游标对象
+    item_ids (list): 数量发生变化的项目ID列表
+    timestamp (datetime): 变化时间
+    """
+    if not item_ids:
+        return
+    placeholders = ', '.join('?' * len(item_ids))
+    below = f"i.id IN ({placeholders}) AND i.quantity < {EFFECTIVE_REORDER_POINT}"
+    params = tuple(item_ids) + (DEFAULT_REORDER_POINT,)
+    c.execute(f"""
+        INSERT INTO stock_alerts (item_id, quantity, reorder_point, created_at)
+        SELECT i.id, i.quantity, {EFFECTIVE_REORDER_POINT}, ?
+        FROM inventory_items i
+        WHERE {below} AND NOT EXISTS (SELECT 1 FROM low_stock_items l WHERE l.item_id = i.id)
+    """, (DEFAULT_REORDER_POINT, timestamp) + params)
+    c.execute(f"""
+        INSERT OR IGNORE INTO low_stock_items (item_id, since)
+        SELECT i.id, ? FROM inventory_items i WHERE {below}
+    """, (timestamp,) + params)
+    c.execute(f"""
+        DELETE FROM low_stock_items
+        WHERE item_id IN (SELECT i.id FROM inventory_items i WHERE i.id IN ({placeholders}) AND i.quantity >= {EFFECTIVE_REORDER_POINT})
+    """, params)
+
+def _record_movement(c, item_id, user_id, delta, reason, timestamp):
+    """
+    在当前事务中追加一条库存流水，必要时记录快照，并同步低库存集合。
+
+    调用前 inventory_items 中的数量和版本号必须已在同一事务中更新。
+
+    参数:
+    c: 数据库游标对象
+    item_id (int): 项目ID
+    user_id (int): 操作用户ID
+    delta (int): 数量变化，正数为入库，负数为出库
+    reason (str): 变动原因，如'initial'、'usage'、'restock'、'adjustment'
+    timestamp (datetime): 变动时间
+
+    返回:
+    int: 流水ID
+    """
+    c.execute("""
+        INSERT INTO stock_movements (item_id, user_id, delta, reason, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    """, (item_id, user_id, delta, reason, timestamp))
+    movement_id = c.lastrowid
+    c.execute("SELECT quantity, version FROM inventory_items WHERE id = ?", (item_id,))
+    quantity, version = c.fetchone()
+    if version % SNAPSHOT_INTERVAL == 0:
+        c.execute("""
+            INSERT INTO stock_snapshots (item_id, movement_id, quantity, timestamp)
+            VALUES (?, ?, ?, ?)
+        """, (item_id, movement_id, quantity, timestamp))
+    _sync_low_stock(c, [item_id], timestamp)
+    return movement_id
+
+def add_item(name, category, quantity, unit, barcode=None):
     """
     向库存中添加新项目。
     
@@ -19,22 +102,25 @@ def add_item(name, category, quantity, unit):
     category (str): 项目类别
     quantity (int): 数量
     unit (str): 单位
+    barcode (str): 条形码，可选，不能与其他项目重复
     
     返回:
     bool: 添加成功返回True，失败返回False
     """
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO inventory_items (name, category, quantity, unit)
-            VALUES (?, ?, ?, ?)
-        """, (name, category, quantity, unit))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
+    with database.write_lock:
+        try:
+            c.execute("""
+                INSERT INTO inventory_items (name, category, quantity, unit, version, barcode)
+                VALUES (?, ?, ?, ?, 0, ?)
+            """, (name, category, quantity, unit, barcode or None))
+            _record_movement(c, c.lastrowid, None, quantity, 'initial', datetime.now())
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
 def get_all_items():
     """
@@ -45,50 +131,206 @@ def get_all_items():
     """
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("SELECT id, name, category, quantity, unit FROM inventory_items")
+    c.execute("SELECT id, name, category, quantity, unit, version, barcode FROM inventory_items")
     items = c.fetchall()
-    return [{'id': i[0], 'name': i[1], 'category': i[2], 'quantity': i[3], 'unit': i[4]} for i in items]
+    return [{'id': i[0], 'name': i[1], 'category': i[2], 'quantity': i[3], 'unit': i[4], 'version': i[5], 'barcode': i[6]} for i in items]
 
-def update_item_quantity(item_id, new_quantity):
+def update_item_quantity(item_id, new_quantity, expected_version=None, user_id=None):
     """
-    更新指定项目的数量。
+    更新指定项目的数量（盘点调整）。
+
+    使用版本号做乐观并发检查：如果调用方读取数量之后项目已被其他操作修改，
+    更新会被拒绝，而不是覆盖并发的出库或入库。差额作为'adjustment'流水记录。
     
     参数:
     item_id (int): 项目ID
     new_quantity (int): 新数量
+    expected_version (int): 调用方读取到的版本号，为None时以当前版本为准
+    user_id (int): 操作用户ID
     
     返回:
-    bool: 更新成功返回True，失败返回False
+    bool: 更新成功返回True，版本冲突或失败返回False
     """
+    if new_quantity < 0:
+        return False
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("UPDATE inventory_items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
+    with database.write_lock:
+        try:
+            c.execute("SELECT quantity, version FROM inventory_items WHERE id = ?", (item_id,))
+            result = c.fetchone()
+            if result is None:
+                return False
+            current_quantity, version = result
+            if expected_version is not None and expected_version != version:
+                return False
+            if new_quantity == current_quantity:
+                return True
+            c.execute("""
+                UPDATE inventory_items SET quantity = ?, version = version + 1
+                WHERE id = ? AND version = ?
+            """, (new_quantity, item_id, version))
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            _record_movement(c, item_id, user_id, new_quantity - current_quantity, 'adjustment', datetime.now())
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def restock_item(user_id, item_id, quantity):
+    """
+    为项目入库，原子地增加数量并记录流水。
+    
+    参数:
+    user_id (int): 用户ID
+    item_id (int): 项目ID
+    quantity (int): 入库数量
+    
+    返回:
+    bool: 入库成功返回True，失败返回False
+    """
+    if quantity <= 0:
         return False
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("UPDATE inventory_items SET quantity = quantity + ?, version = version + 1 WHERE id = ?", (quantity, item_id))
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            _record_movement(c, item_id, user_id, quantity, 'restock', datetime.now())
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
-def get_low_stock_items(threshold=10):
+def get_low_stock_items(threshold=None):
     """
-    获取库存低于指定阈值的项目。
+    获取库存低于再订货点的项目。
+
+    默认直接读取写入时维护的低库存集合；指定threshold时按统一阈值扫描库存表。
     
     参数:
-    threshold (int): 库存阈值，默认为10
+    threshold (int): 统一的库存阈值，默认为None，表示使用每个项目自己的再订货点
     
     返回:
     list: 包含低库存项目信息的字典列表
     """
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("SELECT id, name, category, quantity, unit FROM inventory_items WHERE quantity < ?", (threshold,))
+    if threshold is None:
+        c.execute(f"""
+            SELECT i.id, i.name, i.category, i.quantity, i.unit, {EFFECTIVE_REORDER_POINT}
+            FROM low_stock_items l
+            JOIN inventory_items i ON i.id = l.item_id
+            ORDER BY l.since
+        """, (DEFAULT_REORDER_POINT,))
+    else:
+        c.execute("SELECT id, name, category, quantity, unit, ? FROM inventory_items WHERE quantity < ?", (threshold, threshold))
     items = c.fetchall()
-    return [{'id': i[0], 'name': i[1], 'category': i[2], 'quantity': i[3], 'unit': i[4]} for i in items]
+    return [{'id': i[0], 'name': i[1], 'category': i[2], 'quantity': i[3], 'unit': i[4], 'reorder_point': i[5]} for i in items]
+
+def set_reorder_point(item_id, reorder_point):
+    """
+    设置项目的再订货点，并立即重新判断其是否处于低库存状态。
+    
+    参数:
+    item_id (int): 项目ID
+    reorder_point (int): 再订货点，为None时恢复使用默认阈值
+    
+    返回:
+    bool: 设置成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("UPDATE inventory_items SET reorder_point = ? WHERE id = ?", (reorder_point, item_id))
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            _sync_low_stock(c, [item_id], datetime.now())
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def rebuild_low_stock_items():
+    """
+    根据当前库存全量重建低库存集合，每次启动时由 init_db 调用，用于升级旧数据库或人工修复后的校正。
+
+    重建不会产生新的低库存通知。
+    
+    返回:
+    int: 集合中的项目数量
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute(f"DELETE FROM low_stock_items WHERE item_id IN (SELECT i.id FROM inventory_items i WHERE i.quantity >= {EFFECTIVE_REORDER_POINT})", (DEFAULT_REORDER_POINT,))
+            c.execute(f"""
+                INSERT OR IGNORE INTO low_stock_items (item_id, since)
+                SELECT i.id, ? FROM inventory_items i WHERE i.quantity < {EFFECTIVE_REORDER_POINT}
+            """, (datetime.now(), DEFAULT_REORDER_POINT))
+            conn.commit()
+            c.execute("SELECT COUNT(*) FROM low_stock_items")
+            return c.fetchone()[0]
+        except:
+            conn.rollback()
+            return 0
+
+def apply_planned_reorder_points(c, points, timestamp):
+    """
+    在调用方的事务中写入补货计划算出的再订货点，并同步这些物品的低库存状态。
+
+    手动设置的再订货点仍然优先，计划值只在物品没有手动设置时生效。
+
+    参数:
+    c: 数据库游标对象
+    points (list): (项目ID, 再订货点) 元组列表，再订货点为None表示历史数据不足，使用默认阈值
+    timestamp (datetime): 计算时间
+    """
+    c.executemany("UPDATE inventory_items SET planned_reorder_point = ? WHERE id = ?", [(point, item_id) for item_id, point in points])
+    item_ids = [item_id for item_id, _ in points]
+    # 分批同步，避免单条语句的参数数量超过SQLite的上限
+    for i in range(0, len(item_ids), 500):
+        _sync_low_stock(c, item_ids[i:i + 500], timestamp)
+
+def get_stock_alerts(limit=20):
+    """
+    获取最近产生的低库存通知。
+    
+    参数:
+    limit (int): 返回记录的最大数量，默认为20
+    
+    返回:
+    list: 包含通知信息的字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT a.id, i.name, a.quantity, i.unit, a.reorder_point, a.created_at
+        FROM stock_alerts a
+        JOIN inventory_items i ON i.id = a.item_id
+        ORDER BY a.id DESC
+        LIMIT ?
+    """, (limit,))
+    alerts = c.fetchall()
+    return [{'id': a[0], 'name': a[1], 'quantity': a[2], 'unit': a[3], 'reorder_point': a[4], 'created_at': a[5]} for a in alerts]
 
 def add_usage_record(user_id, item_id, quantity):
     """
     添加项目使用记录并更新库存。
+
+    扣减使用单条带条件的UPDATE完成，库存不足时不做任何修改，
+    因此并发使用同一物品时既不会丢失扣减，也不会出现负库存。
     
     参数:
     user_id (int): 用户ID
@@ -96,21 +338,202 @@ def add_usage_record(user_id, item_id, quantity):
     quantity (int): 使用数量
     
     返回:
-    bool: 添加成功返回True，失败返回False
+    bool: 添加成功返回True，库存不足或失败返回False
     """
+    if quantity <= 0:
+        return False
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO inventory_usage (user_id, item_id, quantity, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, item_id, quantity, datetime.now()))
-        c.execute("UPDATE inventory_items SET quantity = quantity - ? WHERE id = ?", (quantity, item_id))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
+    with database.write_lock:
+        try:
+            now = datetime.now()
+            c.execute("""
+                UPDATE inventory_items SET quantity = quantity - ?, version = version + 1
+                WHERE id = ? AND quantity >= ?
+            """, (quantity, item_id, quantity))
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            c.execute("""
+                INSERT INTO inventory_usage (user_id, item_id, quantity, timestamp)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, item_id, quantity, now))
+            _record_movement(c, item_id, user_id, -quantity, 'usage', now)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def add_usage_records_batch(user_id, lines):
+    """
+    在一个事务中批量记录使用情况（例如实验结束后一次扫码的几十到几百件耗材）。
+
+    整个批次在同一事务中校验和扣减：先按行顺序累计每个物品的需求并与库存比较，
+    任一行失败则整个批次不做任何修改；全部通过时用 executemany 一次写入扣减、使用记录和库存流水。
+    
+    参数:
+    user_id (int): 用户ID
+    lines (list): 每行为包含'quantity'以及'item_id'或'barcode'之一的字典
+    
+    返回:
+    dict: {'success': bool, 'results': list}，results 与 lines 一一对应，每项包含
+    'item_id'、'quantity'、'status'（'ok'、'unknown_item'、'invalid_quantity'、'insufficient_stock'）和'remaining'
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            if not conn.in_transaction:
+                # 立即获取写锁，保证校验时读到的库存在提交前不会被其他连接修改
+                c.execute("BEGIN IMMEDIATE")
+            barcodes = list({line['barcode'] for line in lines if line.get('item_id') is None and line.get('barcode')})
+            barcode_ids = {}
+            if barcodes:
+                c.execute(f"SELECT barcode, id FROM inventory_items WHERE barcode IN ({', '.join('?' * len(barcodes))})", barcodes)
+                barcode_ids = dict(c.fetchall())
+            item_ids = [line['item_id'] if line.get('item_id') is not None else barcode_ids.get(line.get('barcode')) for line in lines]
+            known_ids = list({item_id for item_id in item_ids if item_id is not None})
+            stock = {}
+            if known_ids:
+                c.execute(f"SELECT id, quantity, version FROM inventory_items WHERE id IN ({', '.join('?' * len(known_ids))})", known_ids)
+                stock = {row[0]: [row[1], row[2]] for row in c.fetchall()}
+
+            results = []
+            demand = {}
+            for line, item_id in zip(lines, item_ids):
+                quantity = line.get('quantity', 0)
+                result = {'item_id': item_id, 'barcode': line.get('barcode'), 'quantity': quantity, 'remaining': None}
+                if item_id not in stock:
+                    result['status'] = 'unknown_item'
+                elif not isinstance(quantity, int) or quantity <= 0:
+                    result['status'] = 'invalid_quantity'
+                elif stock[item_id][0] - demand.get(item_id, 0) < quantity:
+                    result['status'] = 'insufficient_stock'
+                    result['remaining'] = stock[item_id][0] - demand.get(item_id, 0)
+                else:
+                    demand[item_id] = demand.get(item_id, 0) + quantity
+                    result['status'] = 'ok'
+                    result['remaining'] = stock[item_id][0] - demand[item_id]
+                results.append(result)
+
+            if not lines or any(r['status'] != 'ok' for r in results):
+                conn.rollback()
+                return {'success': False, 'results': results}
+
+            now = datetime.now()
+            c.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements")
+            last_movement_id = c.fetchone()[0]
+            c.executemany("""
+                UPDATE inventory_items SET quantity = quantity - ?, version = version + 1
+                WHERE id = ? AND quantity >= ?
+            """, [(total, item_id, total) for item_id, total in demand.items()])
+            if c.rowcount != len(demand):
+                conn.rollback()
+                return {'success': False, 'results': results}
+            c.executemany("""
+                INSERT INTO inventory_usage (user_id, item_id, quantity, timestamp)
+                VALUES (?, ?, ?, ?)
+            """, [(user_id, r['item_id'], r['quantity'], now) for r in results])
+            c.executemany("""
+                INSERT INTO stock_movements (item_id, user_id, delta, reason, timestamp)
+                VALUES (?, ?, ?, 'usage', ?)
+            """, [(item_id, user_id, -total, now) for item_id, total in demand.items()])
+            c.execute("""
+                INSERT INTO stock_snapshots (item_id, movement_id, quantity, timestamp)
+                SELECT m.item_id, m.id, i.quantity, m.timestamp
+                FROM stock_movements m
+                JOIN inventory_items i ON i.id = m.item_id
+                WHERE m.id > ? AND i.version % ? = 0
+            """, (last_movement_id, SNAPSHOT_INTERVAL))
+            _sync_low_stock(c, list(demand), now)
+            conn.commit()
+            return {'success': True, 'results': results}
+        except:
+            conn.rollback()
+            return {'success': False, 'results': []}
+
+def get_item_quantity_at(item_id, timestamp):
+    """
+    计算项目在任意历史时刻的数量。
+
+    先通过 (item_id, timestamp) 索引定位该时刻之前最近的快照，
+    再累加快照之后到该时刻的流水（最多约 SNAPSHOT_INTERVAL 条）。
+    
+    参数:
+    item_id (int): 项目ID
+    timestamp (datetime): 查询时刻
+    
+    返回:
+    int: 该时刻的数量，项目当时尚无记录时返回0
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT movement_id, quantity, timestamp FROM stock_snapshots
+        WHERE item_id = ? AND timestamp <= ?
+        ORDER BY timestamp DESC, movement_id DESC
+        LIMIT 1
+    """, (item_id, timestamp))
+    snapshot = c.fetchone()
+    if snapshot is None:
+        return 0
+    movement_id, quantity, snapshot_time = snapshot
+    c.execute("""
+        SELECT COALESCE(SUM(delta), 0) FROM stock_movements
+        WHERE item_id = ? AND timestamp >= ? AND timestamp <= ? AND id > ?
+    """, (item_id, snapshot_time, timestamp, movement_id))
+    return quantity + c.fetchone()[0]
+
+def replay_item_quantity(item_id):
+    """
+    从流水完整重放计算项目的数量，用于核对 inventory_items 中物化的数量。
+    
+    参数:
+    item_id (int): 项目ID
+    
+    返回:
+    int: 所有流水之和
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(SUM(delta), 0) FROM stock_movements WHERE item_id = ?", (item_id,))
+    return c.fetchone()[0]
+
+def take_stock_snapshots():
+    """
+    为自上次快照以来有新流水的所有项目记录快照，由补货计划的每晚任务调用。
+
+    升级时 init_db 已为旧物品补记期初流水；仍没有任何流水的项目（例如绕过本模块直接写入的数据）
+    会先补记一条'opening'流水作为期初数量。
+    
+    返回:
+    int: 新记录的快照数量
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            now = datetime.now()
+            c.execute("""
+                INSERT INTO stock_movements (item_id, user_id, delta, reason, timestamp)
+                SELECT i.id, NULL, i.quantity, 'opening', ?
+                FROM inventory_items i
+                WHERE NOT EXISTS (SELECT 1 FROM stock_movements m WHERE m.item_id = i.id)
+            """, (now,))
+            c.execute("""
+                INSERT INTO stock_snapshots (item_id, movement_id, quantity, timestamp)
+                SELECT i.id, m.id, i.quantity, m.timestamp
+                FROM inventory_items i
+                JOIN stock_movements m ON m.id = (SELECT MAX(id) FROM stock_movements WHERE item_id = i.id)
+                WHERE m.id > COALESCE((SELECT MAX(movement_id) FROM stock_snapshots WHERE item_id = i.id), 0)
+            """)
+            count = c.rowcount
+            conn.commit()
+            return count
+        except:
+            conn.rollback()
+            return 0
 
 def get_usage_records(limit=20):
     """
@@ -169,4 +592,96 @@ def get_inventory_report():
         SELECT name, category, quantity, unit
         FROM inventory_items
     """, conn)
-    return df
\ No newline at end of file
+    return df
+
+def refresh_usage_rollup():
+    """
+    将 inventory_usage 中新增的使用记录增量汇总到 inventory_usage_monthly。
+
+    只处理ID大于上次汇总位置的记录，按 (物品, 月份) 分组后累加到已有汇总上，
+    汇总结果和处理位置在同一事务中更新。
+    
+    返回:
+    int: 本次处理的使用记录数量
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("SELECT last_id FROM rollup_state WHERE name = 'inventory_usage_monthly'")
+            result = c.fetchone()
+            last_id = result[0] if result else 0
+            c.execute("SELECT MAX(id), COUNT(*) FROM inventory_usage WHERE id > ?", (last_id,))
+            max_id, count = c.fetchone()
+            if not count:
+                return 0
+            c.execute("""
+                INSERT INTO inventory_usage_monthly (item_id, month, quantity)
+                SELECT item_id, substr(timestamp, 1, 7), SUM(quantity)
+                FROM inventory_usage
+                WHERE id > ? AND id <= ?
+                GROUP BY item_id, substr(timestamp, 1, 7)
+                ON CONFLICT(item_id, month) DO UPDATE SET quantity = quantity + excluded.quantity
+            """, (last_id, max_id))
+            c.execute("""
+                INSERT INTO rollup_state (name, last_id) VALUES ('inventory_usage_monthly', ?)
+                ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id
+            """, (max_id,))
+            conn.commit()
+            return count
+        except:
+            conn.rollback()
+            return 0
+
+def get_inventory_usage_history(months=None):
+    """
+    获取所有物品按月的使用量时间序列。
+
+    先增量刷新月度汇总，再用一次查询取回窗口内所有 (物品, 月份, 使用量)，
+    直接填入二维数组，便于对成千上万个物品做向量化预测。
+    
+    参数:
+    months (int): 只返回截至本月的最近若干个月，为None时从最早有使用记录的月份开始
+    
+    返回:
+    dict: 包含以下NumPy数组的字典
+        'item_ids': 形状为(n,)的物品ID
+        'names': 形状为(n,)的物品名称
+        'months': 形状为(m,)的月份（datetime64[M]），按时间升序
+        'usage': 形状为(n, m)的月使用量，没有使用记录的月份为0
+        'first_month': 形状为(n,)的每个物品首次有使用记录的月份下标，从未使用过为-1
+    """
+    refresh_usage_rollup()
+    conn = database.get_connection()
+    c = conn.cursor()
+    current_month = np.datetime64(datetime.now().strftime('%Y-%m'), 'M')
+    if months is None:
+        c.execute("SELECT MIN(month) FROM inventory_usage_monthly")
+        earliest = c.fetchone()[0]
+        start_month = np.datetime64(earliest, 'M') if earliest else current_month
+    else:
+        start_month = current_month - (months - 1)
+    month_axis = np.arange(start_month, current_month + 1, dtype='datetime64[M]')
+
+    c.execute("SELECT id, name FROM inventory_items ORDER BY id")
+    items = c.fetchall()
+    item_ids = np.array([i[0] for i in items], dtype=np.int64)
+    names = np.array([i[1] for i in items], dtype=object)
+    usage = np.zeros((len(items), len(month_axis)), dtype=np.int64)
+
+    c.execute("""
+        SELECT item_id, month, quantity FROM inventory_usage_monthly
+        WHERE month >= ? AND month <= ?
+    """, (str(start_month), str(current_month)))
+    rows = c.fetchall()
+    if rows and len(items):
+        row_items = np.array([r[0] for r in rows], dtype=np.int64)
+        row_months = np.array([r[1] for r in rows], dtype='datetime64[M]')
+        row_quantities = np.array([r[2] for r in rows], dtype=np.int64)
+        row_index = np.searchsorted(item_ids, row_items)
+        valid = (row_index < len(item_ids)) & (item_ids[np.minimum(row_index, len(item_ids) - 1)] == row_items)
+        usage[row_index[valid], (row_months[valid] - start_month).astype(np.int64)] = row_quantities[valid]
+
+    has_usage = usage > 0
+    first_month = np.where(has_usage.any(axis=1), has_usage.argmax(axis=1), -1)
+    return {'item_ids': item_ids, 'names': names, 'months': month_axis, 'usage': usage, 'first_month': first_month}
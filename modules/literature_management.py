@@ -3,10 +3,38 @@
 """
 这个模块提供了文献管理的功能，包括添加、搜索、获取和更新文献信息。
 它与数据库交互，处理文献的各种属性，如标题、作者、期刊等。
+
+文献搜索:
+- 标题、作者和笔记建有两个全文索引，写入和修改文献时由触发器增量更新：
+  literature_fts 按词切分，支持前缀查询（关键词以 * 结尾，如 "neuro*"）；
+  literature_fts_trigram 按三字符片段切分，中文关键词按子串匹配
+- 多个关键词用空格分隔，文献需要包含所有关键词，与关键词的顺序无关
+- 结果按 BM25 相关度排序，标题中的匹配权重最高，其次是作者，最后是笔记
+- 少于3个字符的中文关键词无法使用 trigram 索引，用 LIKE 过滤
+
+批量导入:
+- 流式解析 BibTeX/RIS 文件（见 bibliography 模块），每 IMPORT_BATCH_SIZE 条查重一次，并用 executemany 在一个事务中写入
+- 每条文献保存规范化 DOI（唯一索引）和标题指纹，同一篇文献不会因为 DOI 写法或标题大小写、标点不同而重复导入
+- DOI 和标题都一致（或一方没有 DOI）的视为重复并跳过；DOI 相同但标题不同、或标题相同但 DOI 不同的视为冲突，
+  同样跳过并列入导入报告，由用户核对
 """
 
+import re
+from modules import bibliography
 from utils import database
 
+# 每页的默认搜索结果数量
+LITERATURE_PAGE_SIZE = 20
+
+# BM25 排序时标题、作者、笔记三个字段的权重
+FIELD_WEIGHTS = (10.0, 5.0, 1.0)
+
+# 批量导入时每批查重和写入的文献数量
+IMPORT_BATCH_SIZE = 1000
+
+# 含有这些字符（中日韩文字）的关键词使用 trigram 索引
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
 def add_literature(user_id, title, authors, journal, year, doi, notes):
     """
     添加新的文献到数据库。
@@ -21,38 +49,82 @@ def add_literature(user_id, title, authors, journal, year, doi, notes):
     notes (str): 笔记
     
     返回:
-    bool: 添加成功返回True，失败返回False
+    bool: 添加成功返回True，失败（包括已有相同 DOI 的文献）返回False
     """
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO literature (user_id, title, authors, journal, year, doi, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, title, authors, journal, year, doi, notes))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
-
-def search_literature(query):
+    with database.write_lock:
+        try:
+            c.execute("""
+                INSERT INTO literature (user_id, title, authors, journal, year, doi, notes, doi_norm, title_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, title, authors, journal, year, doi, notes,
+                  bibliography.normalize_doi(doi), bibliography.title_hash(title)))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def _fts_phrase(term):
+    """把关键词转成带引号的 FTS5 短语，避免用户输入被解释为查询语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+def search_literature(query, limit=LITERATURE_PAGE_SIZE, offset=0):
     """
-    搜索文献。
-    
+    全文搜索文献，结果按相关度排序并分页。
+
     参数:
-    query (str): 搜索关键词
-    
+    query (str): 搜索关键词，多个关键词用空格分隔，以 * 结尾的关键词按前缀匹配
+    limit (int): 每页结果数量，默认为 LITERATURE_PAGE_SIZE
+    offset (int): 跳过的结果数量，用于翻页
+
     返回:
-    list: 包含匹配文献信息的字典列表
+    list: 包含匹配文献信息的字典列表，相关度最高的在前
     """
+    word_phrases = []
+    trigram_phrases = []
+    short_terms = []
+    for term in dict.fromkeys(query.split()):
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if not term:
+            continue
+        if not _CJK.search(term):
+            word_phrases.append(_fts_phrase(term) + ('*' if prefix else ''))
+        elif len(term) >= 3:
+            # trigram 按子串匹配，前缀查询也包含在内
+            trigram_phrases.append(_fts_phrase(term))
+        else:
+            short_terms.append(term)
+    if not (word_phrases or trigram_phrases or short_terms):
+        return []
+
+    indexes = [(fts, ' '.join(phrases)) for fts, phrases in (('literature_fts', word_phrases),
+                                                            ('literature_fts_trigram', trigram_phrases)) if phrases]
+    conditions = [f"{fts} MATCH ?" for fts, _ in indexes]
+    params = [match for _, match in indexes]
+    patterns = ['%' + re.sub(r'([\\%_])', r'\\\1', term) + '%' for term in short_terms]
+    for pattern in patterns:
+        conditions.append("(l.title LIKE ? ESCAPE '\\' OR l.authors LIKE ? ESCAPE '\\' OR l.notes LIKE ? ESCAPE '\\')")
+        params.extend([pattern] * 3)
+    if indexes:
+        # 同时用到两个索引时相关度相加（bm25 越小越相关）
+        order = ' + '.join(f"bm25({fts}, {', '.join(map(str, FIELD_WEIGHTS))})" for fts, _ in indexes)
+    else:
+        # 只有短关键词时按匹配的字段排序
+        order = "CASE WHEN l.title LIKE ? ESCAPE '\\' THEN 0 WHEN l.authors LIKE ? ESCAPE '\\' THEN 1 ELSE 2 END"
+        params.extend([patterns[0]] * 2)
+
     conn = database.get_connection()
     c = conn.cursor()
-    c.execute("""
-        SELECT id, title, authors, journal, year, doi, notes
-        FROM literature
-        WHERE title LIKE ? OR authors LIKE ? OR notes LIKE ?
-    """, (f"%{query}%", f"%{query}%", f"%{query}%"))
+    c.execute(f"""
+        SELECT l.id, l.title, l.authors, l.journal, l.year, l.doi, l.notes
+        FROM literature l{''.join(f' JOIN {fts} ON {fts}.rowid = l.id' for fts, _ in indexes)}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order}, l.id DESC
+        LIMIT ? OFFSET ?
+    """, (*params, limit, offset))
     results = c.fetchall()
     return [{'id': r[0], 'title': r[1], 'authors': r[2], 'journal': r[3], 'year': r[4], 'doi': r[5], 'notes': r[6]} for r in results]
 
@@ -86,18 +158,147 @@ def update_literature(literature_id, title, authors, journal, year, doi, notes):
     notes (str): 新的笔记
     
     返回:
-    bool: 更新成功返回True，失败返回False
+    bool: 更新成功返回True，失败（包括 DOI 与其他文献相同）返回False
     """
     conn = database.get_connection()
     c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("""
+                UPDATE literature
+                SET title = ?, authors = ?, journal = ?, year = ?, doi = ?, notes = ?, doi_norm = ?, title_hash = ?
+                WHERE id = ?
+            """, (title, authors, journal, year, doi, notes,
+                  bibliography.normalize_doi(doi), bibliography.title_hash(title), literature_id))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def _fill_dedup_keys(c):
+    """为还没有去重键的旧文献补上规范化 DOI 和标题指纹，DOI 与已有文献重复时只补标题指纹"""
+    c.execute("SELECT id, title, doi FROM literature WHERE title_hash IS NULL AND title IS NOT NULL AND title != ''")
+    for literature_id, title, doi in c.fetchall():
+        c.execute("UPDATE literature SET title_hash = ? WHERE id = ?", (bibliography.title_hash(title), literature_id))
+        c.execute("UPDATE OR IGNORE literature SET doi_norm = ? WHERE id = ?", (bibliography.normalize_doi(doi), literature_id))
+
+def _lookup_existing(c, column, keys):
+    """
+    按规范化 DOI 或标题指纹批量查询已有文献
+
+    返回:
+    dict: 键 -> [(文献ID, None, 规范化DOI, 标题指纹), ...]，第二项对应本文件中题录的行号
+    """
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        c.execute(f"SELECT id, doi_norm, title_hash, {column} FROM literature WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk)
+        for literature_id, doi_norm, thash, key in c.fetchall():
+            found.setdefault(key, []).append((literature_id, None, doi_norm, thash))
+    return found
+
+def _import_batch(c, user_id, batch, seen_dois, seen_titles, report):
+    """对一批题录查重并写入，seen_dois / seen_titles 记录本次导入中已接受的题录，用于文件内部查重"""
+    by_doi = _lookup_existing(c, 'doi_norm', {entry['doi_norm'] for entry in batch if entry['doi_norm']})
+    by_title = _lookup_existing(c, 'title_hash', {entry['title_hash'] for entry in batch})
+    rows = []
+    for entry in batch:
+        doi, thash = entry['doi_norm'], entry['title_hash']
+        # 先与数据库中的文献比较，再与本文件中前面的题录比较
+        matches = by_doi.get(doi, []) + seen_dois.get(doi, []) if doi else []
+        if matches:
+            match = matches[0]
+            kind, reason = ('duplicates', 'DOI 相同') if match[3] == thash else ('conflicts', 'DOI 相同但标题不同')
+        else:
+            matches = by_title.get(thash, []) + seen_titles.get(thash, [])
+            match = next((m for m in matches if m[2] is None or doi is None or m[2] == doi), None)
+            if match is not None:
+                kind, reason = 'duplicates', '标题相同'
+            elif matches:
+                match = matches[0]
+                kind, reason = 'conflicts', '标题相同但 DOI 不同'
+            else:
+                kind = None
+        if kind is not None:
+            report[kind].append({'line': entry['line'], 'title': entry['title'], 'doi': entry['doi'], 'reason': reason,
+                                 'existing_id': match[0], 'existing_line': match[1]})
+            continue
+        rows.append((user_id, entry['title'], entry['authors'], entry['journal'], entry['year'], entry['doi'],
+                     entry['notes'], doi, thash))
+        key = (None, entry['line'], doi, thash)
+        if doi:
+            seen_dois.setdefault(doi, []).append(key)
+        seen_titles.setdefault(thash, []).append(key)
+    c.executemany("""
+        INSERT INTO literature (user_id, title, authors, journal, year, doi, notes, doi_norm, title_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    report['imported'] += len(rows)
+
+def import_literature(user_id, lines, fmt=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    从 BibTeX 或 RIS 文件批量导入文献，并报告重复和冲突的题录。
+
+    文件按行流式解析，每 batch_size 条题录查重后在一个事务中写入；
+    中途出错时已提交的批次保留，报告中的'failed'为True。
+
+    参数:
+    user_id (int): 导入文献的用户ID
+    lines (iterable): 文件的文本行，例如以文本模式打开的文件
+    fmt (str): 'bibtex' 或 'ris'，为None时根据文件内容判断
+    batch_size (int): 每批的题录数量，默认为 IMPORT_BATCH_SIZE
+
+    返回:
+    dict: 导入报告，包含'imported'（导入数量）、'duplicates'（重复而跳过的题录）、
+          'conflicts'（与已有文献冲突而跳过的题录）、'errors'（无法导入的题录）和'failed'；
+          重复和冲突的题录包含'line'、'title'、'doi'、'reason'，以及匹配到的'existing_id'（已有文献ID）
+          或'existing_line'（本文件中前面题录的行号）
+    """
+    report = {'imported': 0, 'duplicates': [], 'conflicts': [], 'errors': [], 'failed': False}
+    seen_dois = {}
+    seen_titles = {}
+    conn = database.get_connection()
+    c = conn.cursor()
+
+    def flush(batch):
+        with database.write_lock:
+            try:
+                _import_batch(c, user_id, batch, seen_dois, seen_titles, report)
+                conn.commit()
+                return True
+            except:
+                conn.rollback()
+                report['failed'] = True
+                return False
+
+    with database.write_lock:
+        try:
+            _fill_dedup_keys(c)
+            conn.commit()
+        except:
+            conn.rollback()
+            report['failed'] = True
+            return report
+
+    batch = []
     try:
-        c.execute("""
-            UPDATE literature
-            SET title = ?, authors = ?, journal = ?, year = ?, doi = ?, notes = ?
-            WHERE id = ?
-        """, (title, authors, journal, year, doi, notes, literature_id))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
\ No newline at end of file
+        for entry in bibliography.parse(lines, fmt, report['errors']):
+            entry['title_hash'] = bibliography.title_hash(entry['title'])
+            if entry['title_hash'] is None:
+                report['errors'].append({'line': entry['line'], 'reason': '缺少标题'})
+                continue
+            # 无法识别的 DOI 按原样保存，不参与 DOI 查重
+            entry['doi_norm'] = bibliography.normalize_doi(entry['doi'])
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                if not flush(batch):
+                    return report
+                batch = []
+    except (UnicodeDecodeError, ValueError) as e:
+        report['errors'].append({'line': None, 'reason': f"文件无法解析: {e}"})
+        report['failed'] = True
+    if batch:
+        flush(batch)
+    return report
@@ -0,0 +1,166 @@
+"""
+本地消息总线模块
+
+这个模块实现一个基于 Unix 域套接字的轻量发布/订阅总线，用于在多个 WebSocket 工作进程之间转发聊天消息。
+它只提供 Redis pub/sub 中用到的那一小部分功能（订阅、取消订阅、发布），部署到多台机器时可以换成 Redis。
+
+协议:
+- 每一帧是一行JSON（json.dumps 的结果中不含换行符）
+- 客户端发送 {"op": "sub" | "unsub", "channel": ...} 和 {"op": "pub", "channel": ..., "data": ...}
+- 代理把消息以 {"channel": ..., "data": ...} 转发给该频道除发布者以外的所有订阅者
+
+设计思路:
+1. 代理转发时只把数据写入各订阅者连接的缓冲区，不等待写完，一个慢订阅者不会拖慢其他订阅者；
+   缓冲区超过 MAX_BUFFERED_BYTES 的订阅者被断开，由其客户端重连
+2. 客户端断开后按指数退避重连，并重新订阅之前的频道；断线期间发布的消息被丢弃（与 Redis pub/sub 相同，不保证送达）
+"""
+
+import asyncio
+import json
+import os
+
+# 默认的套接字路径
+DEFAULT_BUS_PATH = "/tmp/lab_collaboration_bus.sock"
+
+# 单帧的最大长度和每个订阅者连接允许积压的最大字节数
+MAX_FRAME_SIZE = 1024 * 1024
+MAX_BUFFERED_BYTES = 16 * 1024 * 1024
+
+# 客户端重连退避的初始和最大等待时间（秒）
+RECONNECT_INITIAL_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5
+
+async def start_broker(path=DEFAULT_BUS_PATH):
+    """
+    启动消息总线代理
+
+    参数:
+    path (str): Unix 域套接字路径，已存在的旧套接字文件会被删除
+
+    返回:
+    asyncio.Server 对象
+    """
+    subscribers = {}
+
+    async def handle(reader, writer):
+        channels = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                channel = frame["channel"]
+                if frame["op"] == "sub":
+                    channels.add(channel)
+                    subscribers.setdefault(channel, set()).add(writer)
+                elif frame["op"] == "unsub":
+                    channels.discard(channel)
+                    subscribers.get(channel, set()).discard(writer)
+                elif frame["op"] == "pub":
+                    out = json.dumps({"channel": channel, "data": frame["data"]}).encode() + b"\n"
+                    for subscriber in list(subscribers.get(channel, ())):
+                        if subscriber is writer:
+                            continue
+                        if subscriber.transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+                            # 订阅者长时间不读取，断开连接
+                            subscriber.close()
+                            continue
+                        subscriber.write(out)
+        except (ConnectionError, ValueError, KeyError, asyncio.CancelledError):
+            # 连接断开、帧格式错误或代理关闭
+            pass
+        finally:
+            for channel in channels:
+                subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    return await asyncio.start_unix_server(handle, path=path, limit=MAX_FRAME_SIZE)
+
+class BusClient:
+    """
+    消息总线客户端，在调用方的事件循环中运行，收到的消息交给订阅时登记的回调函数处理
+    """
+
+    def __init__(self, path=DEFAULT_BUS_PATH):
+        self.path = path
+        self.handlers = {}
+        self.connected = asyncio.Event()
+        self._writer = None
+        self._task = None
+
+    async def start(self):
+        """启动接收任务，并等待第一次连接成功"""
+        self._task = asyncio.create_task(self._run())
+        await self.connected.wait()
+        return self
+
+    async def _run(self):
+        """保持连接并分发收到的消息，断开后按指数退避重连"""
+        delay = RECONNECT_INITIAL_DELAY
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_FRAME_SIZE)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            delay = RECONNECT_INITIAL_DELAY
+            self._writer = writer
+            for channel in self.handlers:
+                self._send({"op": "sub", "channel": channel})
+            self.connected.set()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    frame = json.loads(line)
+                    handler = self.handlers.get(frame["channel"])
+                    if handler is not None:
+                        handler(frame["data"])
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                self.connected.clear()
+                self._writer = None
+                writer.close()
+
+    def _send(self, frame):
+        if self._writer is not None:
+            self._writer.write(json.dumps(frame).encode() + b"\n")
+
+    def subscribe(self, channel, handler):
+        """
+        订阅频道
+
+        参数:
+        channel (str): 频道名
+        handler (callable): 收到消息时调用的函数，参数为消息数据
+        """
+        self.handlers[channel] = handler
+        self._send({"op": "sub", "channel": channel})
+
+    def unsubscribe(self, channel):
+        """取消订阅频道"""
+        self.handlers.pop(channel, None)
+        self._send({"op": "unsub", "channel": channel})
+
+    def publish(self, channel, data):
+        """
+        发布消息，不等待发送完成；未连接时消息被丢弃
+
+        参数:
+        channel (str): 频道名
+        data: 可以编码为JSON的消息数据
+        """
+        self._send({"op": "pub", "channel": channel, "data": data})
+
+    def close(self):
+        """停止接收任务并关闭连接"""
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
@@ -3,6 +3,8 @@
 """
 这个模块实现了一个通知系统，用于生成各种类型的通知，包括库存不足、预算超支和即将到期的项目。
 它提供了一系列函数来检查不同的条件并生成相应的通知。
+
+库存不足不再在每次渲染时扫描库存表，而是读取 inventory_management 在库存变化时维护的低库存集合。
 """
 
 from utils import database
@@ -39,22 +41,24 @@ def generate_notifications():
     
     return notifications
 
-def check_low_stock(cursor, threshold=10):
+def check_low_stock(cursor):
     """
-    检查库存低于指定阈值的物品。
+    获取当前低于再订货点的物品。
+
+    直接读取库存写入时维护的 low_stock_items 集合，只涉及少量行。
     
     参数:
     cursor: 数据库游标对象
-    threshold (int): 库存数量的阈值，默认为10。
     
     返回:
-    list: 包含库存低于阈值的物品信息的字典列表。
+    list: 包含库存低于再订货点的物品信息的字典列表。
     """
     cursor.execute("""
-        SELECT name, quantity, unit
-        FROM inventory_items
-        WHERE quantity < ?
-    """, (threshold,))
+        SELECT i.name, i.quantity, i.unit
+        FROM low_stock_items l
+        JOIN inventory_items i ON i.id = l.item_id
+        ORDER BY l.since
+    """)
     return [{'name': item[0], 'quantity': item[1], 'unit': item[2]} for item in cursor.fetchall()]
 
 def check_over_budget(cursor):
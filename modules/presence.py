@@ -0,0 +1,199 @@
+"""
+在线状态模块
+
+这个模块跟踪各聊天室的在线用户和"正在输入"状态，供 real_time_collaboration 的聊天服务器使用。
+模块只维护状态，不直接收发消息，时间由调用方传入（事件循环的 loop.time()）。
+
+设计思路:
+1. 加入、离开和输入状态的变化只把聊天室标记为已变化，不立即通知；
+   服务器每隔 PRESENCE_INTERVAL 秒调用一次 collect_diffs，与上次发出的状态比较，
+   每个有变化的聊天室至多生成一条差异消息，短时间内的反复变化被合并，在线状态的流量与聊天室数量成正比，而不是与客户端数的平方成正比
+   发给新加入客户端的完整状态同样记为已发出，之后的差异以它为基准，不会重复宣布已在线的用户
+2. 同一用户可以有多个连接，按连接数计数，最后一个连接离开时才算离线
+3. "正在输入"状态在 TYPING_TIMEOUT 秒内没有刷新时自动结束
+4. 多进程部署时其他工作进程的在线用户通过 update_remote 合并进来，
+   超过 REMOTE_TTL 秒没有刷新的远端状态视为该工作进程已退出
+"""
+
+import collections
+
+# 生成在线状态差异的间隔（秒）
+PRESENCE_INTERVAL = 1.0
+
+# "正在输入"状态的有效时间（秒）
+TYPING_TIMEOUT = 5
+
+# 其他工作进程的在线状态的有效时间（秒），工作进程会定期重新发布
+REMOTE_TTL = 45
+
+class PresenceTracker:
+    """
+    跟踪各聊天室的在线用户和输入状态，并合并变化
+    """
+
+    def __init__(self):
+        self._connections = collections.defaultdict(collections.Counter)
+        self._names = {}
+        self._typing = collections.defaultdict(dict)
+        self._remote = {}
+        self._sent = {}
+        self._dirty = set()
+        self._local_dirty = set()
+
+    def _mark(self, room_id):
+        self._dirty.add(room_id)
+        self._local_dirty.add(room_id)
+
+    def join(self, room_id, user_id, user):
+        """记录用户的一个连接加入聊天室"""
+        self._names[user_id] = user
+        self._connections[room_id][user_id] += 1
+        self._mark(room_id)
+
+    def leave(self, room_id, user_id):
+        """记录用户的一个连接离开聊天室"""
+        counts = self._connections.get(room_id)
+        if counts is None or counts[user_id] <= 0:
+            return
+        counts[user_id] -= 1
+        if counts[user_id] <= 0:
+            del counts[user_id]
+            self._typing[room_id].pop(user_id, None)
+        if not counts:
+            del self._connections[room_id]
+        self._mark(room_id)
+
+    def set_typing(self, room_id, user_id, typing, now):
+        """设置用户在聊天室中是否正在输入，正在输入的状态在 TYPING_TIMEOUT 秒后过期"""
+        if typing:
+            self._typing[room_id][user_id] = now + TYPING_TIMEOUT
+        elif self._typing[room_id].pop(user_id, None) is None:
+            return
+        self._mark(room_id)
+
+    def local_members(self, room_id, now):
+        """
+        获取本进程中聊天室的在线用户
+
+        返回:
+        dict: 用户ID -> (用户名, 是否正在输入)
+        """
+        typing = self._typing.get(room_id, {})
+        return {user_id: (self._names.get(user_id), typing.get(user_id, 0) > now)
+                for user_id in self._connections.get(room_id, ())}
+
+    def members(self, room_id, now):
+        """
+        获取聊天室的在线用户，包括其他工作进程中的用户
+
+        返回:
+        dict: 用户ID -> (用户名, 是否正在输入)
+        """
+        members = {}
+        for (source, remote_room), (expires_at, remote_members) in self._remote.items():
+            if remote_room == room_id and expires_at > now:
+                for user_id, (user, typing) in remote_members.items():
+                    previous = members.get(user_id)
+                    members[user_id] = (user, typing or (previous is not None and previous[1]))
+        for user_id, (user, typing) in self.local_members(room_id, now).items():
+            previous = members.get(user_id)
+            members[user_id] = (user, typing or (previous is not None and previous[1]))
+        return members
+
+    def update_remote(self, source, room_id, members, now):
+        """
+        合并其他工作进程发布的聊天室在线用户
+
+        参数:
+        source -- 发布者的标识（工作进程ID）
+        room_id -- 聊天室ID
+        members (list): [用户ID, 用户名, 是否正在输入] 列表，为空表示该工作进程中已没有在线用户
+        now -- 当前时间
+        """
+        if members:
+            self._remote[(source, room_id)] = (now + REMOTE_TTL, {m[0]: (m[1], m[2]) for m in members})
+        else:
+            self._remote.pop((source, room_id), None)
+        self._dirty.add(room_id)
+
+    def take_local_changes(self, refresh=False):
+        """
+        取出自上次调用以来本进程中状态有变化的聊天室，用于发布给其他工作进程
+
+        参数:
+        refresh -- 为True时返回所有本进程中有在线用户的聊天室，用于定期重新发布
+
+        返回:
+        set: 聊天室ID集合
+        """
+        changed = self._local_dirty | (set(self._connections) if refresh else set())
+        self._local_dirty = set()
+        return changed
+
+    def full_snapshot(self, room_id, now):
+        """
+        生成聊天室当前在线状态的完整消息，发给刚加入聊天室的客户端
+
+        完整消息之后的差异以它为基准，因此同时把当前状态记为已发出；在此之前尚未发出的变化
+        作为差异消息返回，由调用方发给聊天室中已有的订阅者，之后的 collect_diffs 不会重复发出这些变化。
+
+        返回:
+        (差异消息字典或None, 完整消息字典)
+        """
+        diff = self._diff(room_id, now)
+        current = self._sent.get(room_id, {})
+        snapshot = {"type": "presence", "room_id": room_id, "full": True,
+                    "online": [{"user_id": user_id, "user": user} for user_id, (user, _) in current.items()],
+                    "offline": [],
+                    "typing": sorted(user_id for user_id, (_, typing) in current.items() if typing)}
+        return diff, snapshot
+
+    def _diff(self, room_id, now):
+        """比较聊天室的当前状态与上次发出的状态，记录当前状态为已发出，有变化时返回差异消息，否则返回None"""
+        current = self.members(room_id, now)
+        previous = self._sent.get(room_id, {})
+        if current:
+            self._sent[room_id] = current
+        else:
+            self._sent.pop(room_id, None)
+        online = [{"user_id": user_id, "user": user} for user_id, (user, _) in current.items() if user_id not in previous]
+        offline = [user_id for user_id in previous if user_id not in current]
+        typing = sorted(user_id for user_id, (_, is_typing) in current.items() if is_typing)
+        previous_typing = sorted(user_id for user_id, (_, is_typing) in previous.items() if is_typing)
+        if online or offline or typing != previous_typing:
+            return {"type": "presence", "room_id": room_id, "full": False,
+                    "online": online, "offline": offline, "typing": typing}
+        return None
+
+    def collect_diffs(self, now):
+        """
+        为每个状态有变化的聊天室生成至多一条差异消息
+
+        除了被标记为已变化的聊天室，还会检查有人正在输入的聊天室（输入状态可能已过期）
+        和远端状态已过期的聊天室。
+
+        返回:
+        list: 差异消息字典列表，每条包含'room_id'、'online'（新上线的用户）、'offline'（已离线的用户ID）
+              和'typing'（当前正在输入的用户ID）
+        """
+        rooms = self._dirty
+        self._dirty = set()
+        for room_id, deadlines in list(self._typing.items()):
+            if deadlines:
+                rooms.add(room_id)
+            for user_id, deadline in list(deadlines.items()):
+                if deadline <= now:
+                    del deadlines[user_id]
+            if not deadlines:
+                del self._typing[room_id]
+        for key, (expires_at, _) in list(self._remote.items()):
+            if expires_at <= now:
+                del self._remote[key]
+                rooms.add(key[1])
+
+        diffs = []
+        for room_id in rooms:
+            diff = self._diff(room_id, now)
+            if diff is not None:
+                diffs.append(diff)
+        return diffs
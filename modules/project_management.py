@@ -117,6 +117,57 @@ def get_user_projects(user_id):
     return [{'id': p[0], 'name': p[1], 'description': p[2], 'start_date': p[3], 'end_date': p[4], 
              'status': p[5], 'total_tasks': p[6], 'completed_tasks': p[7]} for p in projects]
 
+def add_project_member(project_id, user_id):
+    """
+    添加项目成员
+    
+    参数:
+    project_id (int): 项目ID
+    user_id (int): 用户ID
+    
+    返回:
+    bool: 添加成功返回True，成员已存在或失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("INSERT OR IGNORE INTO project_members (project_id, user_id) VALUES (?, ?)", (project_id, user_id))
+            conn.commit()
+            return c.rowcount > 0
+        except:
+            conn.rollback()
+            return False
+
+def remove_project_member(project_id, user_id):
+    """将用户移出项目"""
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        c.execute("DELETE FROM project_members WHERE project_id = ? AND user_id = ?", (project_id, user_id))
+        conn.commit()
+
+def get_project_members(project_id):
+    """
+    获取项目成员
+    
+    参数:
+    project_id (int): 项目ID
+    
+    返回:
+    list: 包含成员ID和用户名的字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT u.id, u.username
+        FROM project_members pm
+        JOIN users u ON u.id = pm.user_id
+        WHERE pm.project_id = ?
+        ORDER BY u.username
+    """, (project_id,))
+    return [{'id': m[0], 'username': m[1]} for m in c.fetchall()]
+
 def add_task(project_id, description):
     """
     向项目添加新任务
@@ -8,16 +8,395 @@
 1. 建立WebSocket服务器
 2. 处理客户端连接
 3. 广播消息给所有连接的客户端
+4. 按聊天室订阅消息，加入时回放最近的消息，并批量持久化到 chat_messages 表
+
+广播设计:
+- 每个连接有一个有界的发送队列和一个独立的写入任务，广播只把消息放入各连接的队列（不等待发送），
+  各连接的发送并发进行，一个慢客户端不会拖慢其他客户端
+- 队列满时按 SLOW_CLIENT_POLICY 处理慢客户端：'drop_oldest' 丢弃最旧的待发消息，
+  'drop_newest' 丢弃新消息，'disconnect' 断开该连接；单条消息发送超过 SEND_TIMEOUT 秒同样断开连接
+- 广播遍历的是连接表的快照，放入队列的过程中没有 await，连接的加入和断开不会影响正在进行的广播
+
+聊天室:
+- 客户端发送 {"type": "join", "room_id": ..., "token": ...} 订阅聊天室，{"type": "leave", ...} 取消订阅；
+  {"type": "chat", "room_id": ..., "message": ...} 只发送给该聊天室的订阅者。
+  不带 room_id 的消息按原来的方式广播给所有连接，不保存
+
+身份验证:
+- 连接第一次加入聊天室时必须带上凭证：服务端客户端使用用户的 API 令牌（"token"），
+  浏览器中的脚本使用 sign_ticket 生成的短期票据（"ticket"），用户名从数据库查询。
+  消息中自带的 user_id 和 user 字段一律忽略，保存和转发的发送者只来自凭证
+- 只有聊天室成员可以加入聊天室和发送消息，成员关系在加入和每次发送前检查（结果缓存 MEMBERSHIP_CACHE_TTL 秒）；
+  未通过验证、不是成员或未加入聊天室时回复 {"type": "error", ...}，消息不会被保存
+- 每个聊天室在内存中保留最近 ROOM_HISTORY_SIZE 条消息（首次使用时从数据库加载），加入时立即回放，不查询数据库
+- 聊天消息先放入待保存列表，每 PERSIST_INTERVAL_MS 毫秒或累计 PERSIST_BATCH_SIZE 条时在一个事务中批量写入，
+  与 communication 模块使用同一张 chat_messages 表
+
+在线状态:
+- 客户端加入聊天室并通过身份验证后，每 HEARTBEAT_INTERVAL 秒发送一次 {"type": "heartbeat"}，
+  超过 HEARTBEAT_TIMEOUT 秒没有收到任何消息的连接被断开，其用户从在线列表中移除
+- {"type": "typing", "room_id": ..., "typing": true/false} 设置"正在输入"状态
+- 状态变化由 presence.PresenceTracker 合并，每 PRESENCE_INTERVAL 秒每个聊天室至多发出一条 presence 差异消息；
+  加入聊天室时先收到一条完整的在线状态
+
+多进程部署:
+- serve_workers 启动一个 message_bus 代理和 N 个工作进程，工作进程用 SO_REUSEPORT 监听同一端口，由内核分配连接
+- 每个工作进程把本进程收到的消息发送给本地订阅者，同时发布到总线；其他工作进程从总线收到后
+  记入自己的最近消息并发送给各自的本地订阅者。消息只由收到它的工作进程保存一次
 """
 
+import argparse
 import asyncio
+import collections
 import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from cachetools import TTLCache
+from datetime import datetime
 import websockets
+from modules import auth, communication, message_bus, presence
+from utils import security
+
+# 每个连接的发送队列长度
+OUTBOUND_QUEUE_SIZE = 256
+
+# 发送队列满时的处理策略：'drop_oldest'、'drop_newest' 或 'disconnect'
+SLOW_CLIENT_POLICY = 'drop_oldest'
+
+# 单条消息的发送超时时间（秒），超时视为客户端已失去响应
+SEND_TIMEOUT = 10
+
+# 因发送队列满而断开连接时使用的关闭码（1008: 违反策略）
+SLOW_CLIENT_CLOSE_CODE = 1008
+
+# 每个聊天室在内存中保留的最近消息数，加入聊天室时回放
+ROOM_HISTORY_SIZE = 100
+
+# 批量持久化的时间间隔（毫秒）和批次大小
+PERSIST_INTERVAL_MS = 200
+PERSIST_BATCH_SIZE = 100
+
+# 工作进程之间转发聊天消息使用的总线频道
+BUS_CHANNEL = "chat"
+
+# 停止服务时等待工作进程写完待保存消息的时间（秒）
+WORKER_SHUTDOWN_TIMEOUT = 10
+
+# 客户端发送心跳的间隔，以及多久没有收到任何消息时断开连接（秒）
+HEARTBEAT_INTERVAL = 15
+HEARTBEAT_TIMEOUT = 45
+
+# 因心跳超时而断开连接时使用的关闭码（1001: 离开）
+HEARTBEAT_CLOSE_CODE = 1001
+
+# 工作进程之间同步在线状态使用的总线频道
+PRESENCE_CHANNEL = "presence"
+
+# 浏览器中的脚本连接时使用的票据的有效期（秒），只在加入聊天室时检查
+TICKET_TTL = 3600
+
+# 聊天室成员关系的缓存时间（秒），移出的成员最多在这段时间后不能再发送消息
+MEMBERSHIP_CACHE_TTL = 30
+
+class ClientConnection:
+    """
+    一个已连接客户端的发送端：有界发送队列及负责把队列中的消息写入 WebSocket 的写入任务
+    """
+
+    def __init__(self, websocket, queue_size=OUTBOUND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.rooms = set()
+        self.user_id = None
+        self.user = None
+        self.last_seen = asyncio.get_running_loop().time()
+        self.dropped = 0
+        self.closing = False
+        self.writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        """写入任务：按顺序发送队列中的消息，连接关闭或发送超时后停止"""
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send(message), SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.close(SLOW_CLIENT_CLOSE_CODE, "send timeout")
+        except websockets.ConnectionClosed:
+            pass
+
+    def enqueue(self, message, policy=None):
+        """
+        把消息放入发送队列，不等待发送。
 
-# 存储所有连接的WebSocket客户端
-connected = set()
+        参数:
+        message -- 要发送的消息字符串
+        policy -- 队列满时的处理策略，默认为 SLOW_CLIENT_POLICY
 
-async def chat_server(websocket, path):
+        返回:
+        消息已放入队列返回True，被丢弃或连接被断开返回False
+        """
+        if self.closing:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        policy = policy or SLOW_CLIENT_POLICY
+        if policy == 'drop_oldest':
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+        elif policy == 'disconnect':
+            asyncio.ensure_future(self.close(SLOW_CLIENT_CLOSE_CODE, "slow consumer"))
+        return False
+
+    async def close(self, code=1000, reason=""):
+        """停止写入任务并关闭连接，丢弃尚未发送的消息"""
+        if self.closing:
+            return
+        self.closing = True
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        try:
+            await self.websocket.close(code, reason)
+        except Exception:
+            pass
+
+# 所有已连接的客户端：WebSocket连接 -> ClientConnection
+connected = {}
+
+# 聊天室订阅：聊天室ID -> 订阅该聊天室的 ClientConnection 集合
+rooms = collections.defaultdict(set)
+
+# 每个聊天室最近的消息：聊天室ID -> deque
+_recent = {}
+
+# 正在从数据库加载最近消息的聊天室：聊天室ID -> (加载完成时设置结果的 Future, 加载期间从总线收到的消息)
+_loading = {}
+
+# 等待批量写入数据库的消息：(room_id, user_id, content, timestamp)
+_pending = []
+_pending_ready = None
+_persister = None
+
+# 各聊天室的在线状态及定期发出差异的任务
+_presence = presence.PresenceTracker()
+_presence_task = None
+
+# 多进程部署时本进程的总线客户端，单进程运行时为None
+_bus = None
+
+# 聊天室成员关系缓存：(聊天室ID, 用户ID) -> 是否是成员
+_memberships = TTLCache(maxsize=100000, ttl=MEMBERSHIP_CACHE_TTL)
+
+def register(websocket):
+    """登记一个新连接并启动其写入任务"""
+    client = ClientConnection(websocket)
+    connected[websocket] = client
+    return client
+
+async def unregister(websocket):
+    """移除一个连接，取消其所有聊天室订阅并停止写入任务"""
+    client = connected.pop(websocket, None)
+    if client is not None:
+        for room_id in list(client.rooms):
+            leave_room(client, room_id)
+        client.closing = True
+        client.writer.cancel()
+
+def _ticket_message(user_id, expires):
+    return f"chat:{user_id}:{expires}"
+
+def sign_ticket(user_id, ttl=TICKET_TTL):
+    """
+    生成浏览器连接聊天服务器使用的短期票据，用该用户的 API 令牌签名
+
+    参数:
+    user_id (int): 用户ID
+    ttl (int): 有效期（秒），默认为 TICKET_TTL
+
+    返回:
+    str: "用户ID.过期时间.签名" 形式的票据
+    """
+    expires = int(time.time() + ttl)
+    return f"{user_id}.{expires}.{security.sign_message(_ticket_message(user_id, expires), auth.get_api_token(user_id))}"
+
+def authenticate(data):
+    """
+    根据加入聊天室消息中的凭证（"token" 为 API 令牌，"ticket" 为 sign_ticket 生成的票据）识别用户
+
+    返回:
+    int: 用户ID，凭证缺失、无效或已过期时返回None
+    """
+    if data.get("token"):
+        return auth.get_token_user(str(data["token"]))
+    user_id, _, rest = str(data.get("ticket") or "").partition(".")
+    expires, _, signature = rest.partition(".")
+    if not user_id.isdigit() or not expires.isdigit() or int(expires) < time.time():
+        return None
+    key = auth.get_api_token(int(user_id), create=False)
+    if key is None or not security.verify_signature(_ticket_message(int(user_id), int(expires)), key, signature):
+        return None
+    return int(user_id)
+
+async def is_member(room_id, user_id):
+    """检查用户是否是聊天室成员，结果缓存 MEMBERSHIP_CACHE_TTL 秒"""
+    key = (room_id, user_id)
+    if key not in _memberships:
+        _memberships[key] = await asyncio.to_thread(communication.is_room_member, room_id, user_id)
+    return _memberships[key]
+
+def reject(client, room_id, reason):
+    """回复客户端一条错误消息，说明该请求未被处理"""
+    client.enqueue(json.dumps({"type": "error", "room_id": room_id, "message": reason}))
+
+async def room_history(room_id):
+    """
+    获取聊天室最近的消息，第一次使用时从数据库加载。
+
+    同一聊天室只加载一次，其他协程等待加载完成。加载期间从总线收到的其他工作进程的消息先暂存，
+    加载完成后追加到最近消息中（已经写入数据库、包含在加载结果中的除外），不会丢失。
+
+    返回:
+    该聊天室的消息 deque，按时间先后排列
+    """
+    while room_id not in _recent:
+        if room_id in _loading:
+            await asyncio.shield(_loading[room_id][0])
+            continue
+        done, buffered = asyncio.get_running_loop().create_future(), []
+        _loading[room_id] = (done, buffered)
+        try:
+            messages = await asyncio.to_thread(communication.get_chat_messages, room_id, ROOM_HISTORY_SIZE)
+            loaded = [{"type": "chat", "room_id": room_id, "user_id": m['user_id'], "user": m['username'],
+                       "message": m['content'], "timestamp": m['timestamp']} for m in messages]
+            saved = {(m['user_id'], m['message'], m['timestamp']) for m in loaded}
+            loaded.extend(m for m in buffered if (m.get('user_id'), m['message'], m['timestamp']) not in saved)
+            _recent[room_id] = collections.deque(loaded, maxlen=ROOM_HISTORY_SIZE)
+        finally:
+            del _loading[room_id]
+            done.set_result(None)
+    return _recent[room_id]
+
+async def join_room(client, room_id):
+    """订阅聊天室，并把最近的消息和当前的在线状态回放给该客户端"""
+    history = await room_history(room_id)
+    if room_id in client.rooms:
+        return
+    rooms[room_id].add(client)
+    client.rooms.add(room_id)
+    if client.user_id is not None:
+        _presence.join(room_id, client.user_id, client.user)
+    client.enqueue(json.dumps({"type": "history", "room_id": room_id, "messages": list(history)}))
+    # 尚未发出的在线状态变化（包括该用户上线）先发给聊天室中的其他订阅者，再把完整状态发给该客户端
+    diff, snapshot = _presence.full_snapshot(room_id, asyncio.get_running_loop().time())
+    if diff is not None:
+        await broadcast(json.dumps(diff), clients=[other for other in rooms[room_id] if other is not client])
+    client.enqueue(json.dumps(snapshot))
+    _ensure_background_tasks()
+
+def leave_room(client, room_id):
+    """取消聊天室订阅，没有订阅者的聊天室从订阅表中移除"""
+    if room_id not in client.rooms:
+        return
+    subscribers = rooms.get(room_id)
+    if subscribers is not None:
+        subscribers.discard(client)
+        if not subscribers:
+            del rooms[room_id]
+    client.rooms.discard(room_id)
+    if client.user_id is not None:
+        _presence.leave(room_id, client.user_id)
+
+async def publish(room_id, user_id, user, message):
+    """
+    发布一条聊天室消息：记入最近消息、发送给订阅者，并加入待保存列表
+
+    返回:
+    发送给客户端的消息字典
+    """
+    history = await room_history(room_id)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    data = {"type": "chat", "room_id": room_id, "user_id": user_id, "user": user, "message": message, "timestamp": timestamp}
+    history.append(data)
+    await broadcast(json.dumps(data), clients=list(rooms.get(room_id, ())))
+    if _bus is not None:
+        _bus.publish(BUS_CHANNEL, data)
+    _pending.append((room_id, user_id, message, timestamp))
+    _ensure_background_tasks()
+    if len(_pending) >= PERSIST_BATCH_SIZE:
+        _pending_ready.set()
+    return data
+
+async def flush_pending():
+    """把待保存的消息在一个事务中写入数据库，写入失败的消息放回列表等待下次重试"""
+    if not _pending:
+        return 0
+    batch = _pending[:]
+    del _pending[:]
+    if not await asyncio.to_thread(communication.save_messages, batch):
+        _pending[:0] = batch
+        return 0
+    return len(batch)
+
+async def run_persistence():
+    """批量持久化任务：每 PERSIST_INTERVAL_MS 毫秒或累计 PERSIST_BATCH_SIZE 条消息时写入一次"""
+    while True:
+        try:
+            await asyncio.wait_for(_pending_ready.wait(), PERSIST_INTERVAL_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        _pending_ready.clear()
+        await flush_pending()
+
+def _publish_presence(room_ids, now):
+    """把本进程中这些聊天室的在线用户发布给其他工作进程"""
+    for room_id in room_ids:
+        members = [[user_id, user, typing] for user_id, (user, typing) in _presence.local_members(room_id, now).items()]
+        _bus.publish(PRESENCE_CHANNEL, {"source": os.getpid(), "room_id": room_id, "members": members})
+
+def _on_presence_message(data):
+    """合并其他工作进程发布的在线用户"""
+    if data["source"] != os.getpid():
+        _presence.update_remote(data["source"], data["room_id"], data["members"], asyncio.get_running_loop().time())
+
+async def run_presence():
+    """
+    在线状态任务：每 PRESENCE_INTERVAL 秒断开心跳超时的连接，
+    并向每个状态有变化的聊天室的订阅者发送至多一条差异消息
+    """
+    loop = asyncio.get_running_loop()
+    last_refresh = loop.time()
+    while True:
+        await asyncio.sleep(presence.PRESENCE_INTERVAL)
+        now = loop.time()
+        for client in list(connected.values()):
+            if now - client.last_seen > HEARTBEAT_TIMEOUT:
+                await unregister(client.websocket)
+                asyncio.ensure_future(client.websocket.close(HEARTBEAT_CLOSE_CODE, "heartbeat timeout"))
+        if _bus is not None:
+            refresh = now - last_refresh >= HEARTBEAT_INTERVAL
+            if refresh:
+                last_refresh = now
+            _publish_presence(_presence.take_local_changes(refresh), now)
+        for diff in _presence.collect_diffs(now):
+            await broadcast(json.dumps(diff), clients=list(rooms.get(diff["room_id"], ())))
+
+def _ensure_background_tasks():
+    """在当前事件循环中启动批量持久化任务和在线状态任务"""
+    global _pending_ready, _persister, _presence_task
+    if _persister is None or _persister.done():
+        _pending_ready = asyncio.Event()
+        _persister = asyncio.create_task(run_persistence())
+    if _presence_task is None or _presence_task.done():
+        _presence_task = asyncio.create_task(run_presence())
+
+async def chat_server(websocket, path=None):
     """
     处理单个WebSocket连接的协程函数
 
@@ -25,39 +404,187 @@ async def chat_server(websocket, path):
     websocket -- WebSocket连接对象
     path -- 请求路径（在此示例中未使用）
     """
-    connected.add(websocket)
+    client = register(websocket)
+    loop = asyncio.get_running_loop()
     try:
         async for message in websocket:
+            # 任何消息都说明连接仍然存活
+            client.last_seen = loop.time()
             # 解析接收到的JSON消息
             data = json.loads(message)
-            # 广播消息给所有连接的客户端
-            await broadcast(json.dumps({"type": "chat", "user": data["user"], "message": data["message"]}))
+            kind = data.get("type", "chat")
+            if kind == "heartbeat":
+                continue
+            elif kind == "join":
+                if client.user_id is None:
+                    # 身份只取自服务器校验过的凭证，不使用消息中自带的用户字段
+                    user_id = await asyncio.to_thread(authenticate, data)
+                    if user_id is None:
+                        reject(client, data["room_id"], "身份验证失败")
+                        continue
+                    names = await asyncio.to_thread(communication.get_usernames, [user_id])
+                    client.user_id, client.user = user_id, names.get(user_id)
+                if not await is_member(data["room_id"], client.user_id):
+                    reject(client, data["room_id"], "聊天室不存在或不是聊天室成员")
+                    continue
+                await join_room(client, data["room_id"])
+            elif kind == "leave":
+                leave_room(client, data["room_id"])
+            elif kind == "typing":
+                if client.user_id is not None and data["room_id"] in client.rooms:
+                    _presence.set_typing(data["room_id"], client.user_id, bool(data.get("typing")), client.last_seen)
+            elif data.get("room_id") is not None:
+                # 聊天室消息只发送给该聊天室的订阅者，发送者是验证过的用户，不信任消息中的用户字段
+                if client.user_id is None or data["room_id"] not in client.rooms:
+                    reject(client, data["room_id"], "未加入该聊天室")
+                    continue
+                if not await is_member(data["room_id"], client.user_id):
+                    leave_room(client, data["room_id"])
+                    reject(client, data["room_id"], "不是聊天室成员")
+                    continue
+                # 发出消息即结束"正在输入"状态
+                _presence.set_typing(data["room_id"], client.user_id, False, client.last_seen)
+                await publish(data["room_id"], client.user_id, client.user, data["message"])
+            else:
+                # 广播消息给所有连接的客户端，同样只允许验证过身份的连接发送
+                if client.user_id is None:
+                    reject(client, None, "身份验证失败")
+                    continue
+                data = {"type": "chat", "user": client.user, "message": data["message"]}
+                await broadcast(json.dumps(data))
+                if _bus is not None:
+                    _bus.publish(BUS_CHANNEL, data)
+    except websockets.ConnectionClosed:
+        pass
     finally:
-        # 确保在连接关闭时从集合中移除
-        connected.remove(websocket)
+        # 确保在连接关闭时从连接表中移除
+        await unregister(websocket)
 
-async def broadcast(message):
+async def broadcast(message, clients=None):
     """
     向所有连接的客户端广播消息
 
+    只把消息放入各连接的发送队列，实际发送由各连接的写入任务并发完成。
+
     参数:
     message -- 要广播的消息字符串
+    clients -- 接收消息的 ClientConnection 列表，默认为所有已连接的客户端
+
+    返回:
+    成功放入队列的客户端数量
     """
-    for conn in connected:
-        await conn.send(message)
+    delivered = 0
+    for client in list(connected.values()) if clients is None else clients:
+        if client.enqueue(message):
+            delivered += 1
+    return delivered
 
-def start_chat_server():
+def _on_bus_message(data):
+    """处理其他工作进程发布的消息：记入最近消息并发送给本进程的订阅者"""
+    room_id = data.get("room_id")
+    message = json.dumps(data)
+    if room_id is None:
+        for client in list(connected.values()):
+            client.enqueue(message)
+        return
+    if room_id in _recent:
+        _recent[room_id].append(data)
+    elif room_id in _loading:
+        _loading[room_id][1].append(data)
+    for client in list(rooms.get(room_id, ())):
+        client.enqueue(message)
+
+def start_chat_server(host="localhost", port=8765, reuse_port=False):
     """
     启动WebSocket聊天服务器
 
+    参数:
+    host, port -- 监听地址和端口
+    reuse_port -- 是否设置 SO_REUSEPORT，多个工作进程监听同一端口时使用
+
     返回:
     websockets.serve对象，可用于启动服务器
     """
-    return websockets.serve(chat_server, "localhost", 8765)
+    return websockets.serve(chat_server, host, port, reuse_port=reuse_port or None)
+
+async def serve(host="localhost", port=8765, bus_path=None):
+    """
+    运行聊天服务器直到被取消，退出前写入尚未保存的消息
+
+    参数:
+    host, port -- 监听地址和端口
+    bus_path -- 消息总线的套接字路径，指定时以多进程工作进程的方式运行
+    """
+    global _bus
+    try:
+        if bus_path is not None:
+            _bus = await message_bus.BusClient(bus_path).start()
+            _bus.subscribe(BUS_CHANNEL, _on_bus_message)
+            _bus.subscribe(PRESENCE_CHANNEL, _on_presence_message)
+        async with start_chat_server(host, port, reuse_port=bus_path is not None):
+            _ensure_background_tasks()
+            await asyncio.Future()
+    finally:
+        for task in (_persister, _presence_task):
+            if task is not None:
+                task.cancel()
+        await flush_pending()
+        if _bus is not None:
+            _bus.close()
+            _bus = None
+
+def _worker_main(host, port, bus_path):
+    """工作进程入口，父进程退出后工作进程随之结束，不会留下继续占用端口的孤儿进程"""
+    def watch_parent():
+        multiprocessing.parent_process().join()
+        os.kill(os.getpid(), signal.SIGINT)
+
+    threading.Thread(target=watch_parent, daemon=True).start()
+    try:
+        asyncio.run(serve(host, port, bus_path))
+    except KeyboardInterrupt:
+        pass
+
+async def serve_workers(workers, host="localhost", port=8765, bus_path=message_bus.DEFAULT_BUS_PATH):
+    """
+    以多进程方式运行聊天服务器：在本进程中运行消息总线代理，并启动 workers 个工作进程
+
+    参数:
+    workers -- 工作进程数，一般等于CPU核数
+    host, port -- 所有工作进程共同监听的地址和端口
+    bus_path -- 消息总线的套接字路径
+    """
+    broker = await message_bus.start_broker(bus_path)
+    # 收到 SIGTERM 时也走正常的退出流程，先结束工作进程
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_main, args=(host, port, bus_path), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        await broker.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        broker.close()
+        # 用 SIGINT 结束工作进程，使其在退出前写入尚未保存的消息
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in processes:
+            process.join(WORKER_SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
 
 # 在主应用中启动WebSocket服务器
 if __name__ == "__main__":
-    # 运行聊天服务器
-    asyncio.get_event_loop().run_until_complete(start_chat_server())
-    # 保持事件循环运行
-    asyncio.get_event_loop().run_forever()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="实时协作 WebSocket 服务器")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，大于1时通过 SO_REUSEPORT 共享端口")
+    args = parser.parse_args()
+    # 运行聊天服务器，保持事件循环运行
+    if args.workers > 1:
+        asyncio.run(serve_workers(args.workers, args.host, args.port))
+    else:
+        asyncio.run(serve(args.host, args.port))
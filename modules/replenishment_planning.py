@@ -0,0 +1,270 @@
+# modules/replenishment_planning.py
+
+"""
+补货计划模块
+
+这个模块根据每个物品的月使用量统计计算安全库存和再订货点，并生成采购建议清单。
+
+设计思路:
+1. 只使用已结束月份的使用量，按物品计算月需求的均值和样本方差
+2. 交货期内的需求服从均值为 μ·L、标准差为 σ·√L 的近似正态分布（L 为以月计的交货期），
+   安全库存 = z·σ·√L，再订货点 = μ·L + 安全库存，z 由目标服务水平决定
+3. 所有待计算物品在同一组NumPy数组运算中完成，不逐个物品循环
+4. 计划每晚增量重算：只计算新物品、交货期被修改的物品，以及统计截止月份已经过期的物品；
+   采购建议在查询时用计划结果和当前库存现算，不需要重算计划
+5. 算出的再订货点写入 inventory_items.planned_reorder_point，手动设置的再订货点仍然优先
+"""
+
+import asyncio
+import math
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+import numpy as np
+from utils import database
+from modules import inventory_management
+
+# 未设置交货期的物品使用的默认交货期（天）
+DEFAULT_LEAD_TIME_DAYS = 14
+
+# 目标服务水平，即补货周期内不缺货的概率
+SERVICE_LEVEL = 0.95
+
+# 统计使用的已结束月份数量，以及计算计划所需的最少历史月数
+PLANNING_WINDOW_MONTHS = 12
+MIN_HISTORY_MONTHS = 3
+
+# 每次补货需要覆盖的天数，决定建议采购量中的周转库存部分
+REVIEW_PERIOD_DAYS = 30
+
+# 每晚重算计划的时间
+NIGHTLY_RECOMPUTE_TIME = time(2, 0)
+
+DAYS_PER_MONTH = 365.25 / 12
+
+def compute_replenishment_parameters(usage, start_index, lead_time_days, service_level=SERVICE_LEVEL):
+    """
+    对一组物品向量化地计算需求统计、安全库存和再订货点。
+
+    参数:
+    usage (numpy.ndarray): 形状为(n, m)的月使用量，只包含已结束的月份
+    start_index (numpy.ndarray): 形状为(n,)的每个物品开始有历史的月份下标，从未使用过为m
+    lead_time_days (numpy.ndarray): 形状为(n,)的交货期（天）
+    service_level (float): 目标服务水平，默认为0.95
+
+    返回:
+    dict: 包含以下形状为(n,)的NumPy数组的字典
+        'history_months': 参与统计的月数
+        'mean_monthly' / 'std_monthly': 月需求的均值和样本标准差
+        'safety_stock' / 'reorder_point' / 'cycle_stock': 安全库存、再订货点和周转库存，
+            历史不足 MIN_HISTORY_MONTHS 的物品为-1
+    """
+    usage = np.asarray(usage, dtype=float)
+    n_months = usage.shape[1]
+    in_history = np.arange(n_months)[None, :] >= np.asarray(start_index)[:, None]
+    history_months = in_history.sum(axis=1)
+    counts = np.maximum(history_months, 1)
+    mean = np.where(in_history, usage, 0.0).sum(axis=1) / counts
+    squared = np.where(in_history, usage - mean[:, None], 0.0) ** 2
+    std = np.sqrt(squared.sum(axis=1) / np.maximum(history_months - 1, 1))
+
+    lead_months = np.asarray(lead_time_days, dtype=float) / DAYS_PER_MONTH
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = np.ceil(z * std * np.sqrt(lead_months))
+    reorder_point = np.ceil(mean * lead_months + safety_stock)
+    cycle_stock = np.ceil(mean * REVIEW_PERIOD_DAYS / DAYS_PER_MONTH)
+
+    enough = history_months >= MIN_HISTORY_MONTHS
+    return {
+        'history_months': history_months,
+        'mean_monthly': mean,
+        'std_monthly': std,
+        'safety_stock': np.where(enough, safety_stock, -1).astype(np.int64),
+        'reorder_point': np.where(enough, reorder_point, -1).astype(np.int64),
+        'cycle_stock': np.where(enough, cycle_stock, -1).astype(np.int64),
+    }
+
+def _select_stale_items(c, basis_month, full):
+    """
+    获取需要重新计算计划的物品ID。
+
+    返回:
+    set: 新物品、计划被标记失效的物品以及统计截止月份早于 basis_month 的物品
+    """
+    if full:
+        c.execute("SELECT id FROM inventory_items")
+    else:
+        c.execute("""
+            SELECT i.id
+            FROM inventory_items i
+            LEFT JOIN replenishment_plan p ON p.item_id = i.id
+            WHERE p.item_id IS NULL OR p.basis_month < ?
+        """, (basis_month,))
+    return {row[0] for row in c.fetchall()}
+
+def recompute_plan(full=False):
+    """
+    增量重算补货计划，并把算出的再订货点应用到库存物品上。
+
+    先刷新月度使用量汇总，然后只对需要重算的物品在一次向量化运算中计算统计量，
+    计划结果、计划再订货点和受影响物品的低库存状态在同一事务中更新。
+
+    参数:
+    full (bool): 是否重算所有物品，默认为False
+
+    返回:
+    int: 本次重新计算的物品数量
+    """
+    basis_month = str(np.datetime64(datetime.now().strftime('%Y-%m'), 'M') - 1)
+    conn = database.get_connection()
+    c = conn.cursor()
+    stale = _select_stale_items(c, basis_month, full)
+    if not stale:
+        return 0
+
+    history = inventory_management.get_inventory_usage_history(months=PLANNING_WINDOW_MONTHS + 1)
+    # 去掉尚未结束的当前月份
+    month_axis = history['months'][:-1]
+    selected = np.isin(history['item_ids'], np.fromiter(stale, dtype=np.int64, count=len(stale)))
+    item_ids = history['item_ids'][selected]
+    if not len(item_ids):
+        return 0
+
+    # 历史从物品首次有使用记录的月份开始计算，窗口内首月之前的0不是需求
+    c.execute("SELECT item_id, MIN(month) FROM inventory_usage_monthly GROUP BY item_id")
+    first_used = dict(c.fetchall())
+    first_month = np.array([first_used.get(int(item_id), '9999-12') for item_id in item_ids], dtype='datetime64[M]')
+    start_index = np.clip((first_month - month_axis[0]).astype(np.int64), 0, len(month_axis))
+
+    lead_time_days = np.full(len(item_ids), DEFAULT_LEAD_TIME_DAYS, dtype=np.int64)
+    for chunk in range(0, len(item_ids), 500):
+        ids = item_ids[chunk:chunk + 500]
+        c.execute(f"SELECT id, lead_time_days FROM inventory_items WHERE id IN ({', '.join('?' * len(ids))}) AND lead_time_days IS NOT NULL",
+                  tuple(int(i) for i in ids))
+        for item_id, days in c.fetchall():
+            lead_time_days[np.searchsorted(item_ids, item_id)] = days
+
+    plan = compute_replenishment_parameters(history['usage'][selected, :-1], start_index, lead_time_days)
+    now = datetime.now()
+    rows = []
+    points = []
+    for i, item_id in enumerate(item_ids.tolist()):
+        reorder_point = int(plan['reorder_point'][i]) if plan['reorder_point'][i] >= 0 else None
+        rows.append((item_id, int(plan['history_months'][i]), float(plan['mean_monthly'][i]), float(plan['std_monthly'][i]),
+                     int(lead_time_days[i]), int(plan['safety_stock'][i]) if reorder_point is not None else None,
+                     reorder_point, int(plan['cycle_stock'][i]) if reorder_point is not None else None, basis_month, now))
+        points.append((item_id, reorder_point))
+
+    with database.write_lock:
+        try:
+            c.executemany("""
+                INSERT OR REPLACE INTO replenishment_plan
+                (item_id, history_months, mean_monthly, std_monthly, lead_time_days, safety_stock, reorder_point, cycle_stock, basis_month, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            inventory_management.apply_planned_reorder_points(c, points, now)
+            conn.commit()
+            return len(rows)
+        except:
+            conn.rollback()
+            return 0
+
+def set_lead_time(item_id, lead_time_days):
+    """
+    设置物品的交货期，并将其计划标记为待重算。
+
+    参数:
+    item_id (int): 项目ID
+    lead_time_days (int): 交货期（天），为None时恢复使用默认交货期
+
+    返回:
+    bool: 设置成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("UPDATE inventory_items SET lead_time_days = ? WHERE id = ?", (lead_time_days, item_id))
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            c.execute("DELETE FROM replenishment_plan WHERE item_id = ?", (item_id,))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def get_plan(item_id):
+    """
+    获取单个物品的补货计划。
+
+    参数:
+    item_id (int): 项目ID
+
+    返回:
+    dict: 计划信息，尚未计算时返回None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT history_months, mean_monthly, std_monthly, lead_time_days, safety_stock, reorder_point, cycle_stock, basis_month, computed_at
+        FROM replenishment_plan WHERE item_id = ?
+    """, (item_id,))
+    p = c.fetchone()
+    if not p:
+        return None
+    return {'history_months': p[0], 'mean_monthly': p[1], 'std_monthly': p[2], 'lead_time_days': p[3], 'safety_stock': p[4],
+            'reorder_point': p[5], 'cycle_stock': p[6], 'basis_month': p[7], 'computed_at': p[8]}
+
+def get_purchase_suggestions():
+    """
+    生成采购建议清单。
+
+    只读取低库存集合中的物品，建议采购量为补到 "再订货点 + 周转库存" 所需的数量；
+    没有计划的物品周转库存按再订货点估计。结果按可用天数升序排列，最紧急的在前。
+
+    返回:
+    list: 包含物品信息、再订货点、安全库存、建议采购量和可用天数的字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT i.id, i.name, i.category, i.quantity, i.unit, {inventory_management.EFFECTIVE_REORDER_POINT},
+               p.safety_stock, p.cycle_stock, p.mean_monthly, COALESCE(i.lead_time_days, ?)
+        FROM low_stock_items l
+        JOIN inventory_items i ON i.id = l.item_id
+        LEFT JOIN replenishment_plan p ON p.item_id = i.id
+    """, (inventory_management.DEFAULT_REORDER_POINT, DEFAULT_LEAD_TIME_DAYS))
+    suggestions = []
+    for item_id, name, category, quantity, unit, reorder_point, safety_stock, cycle_stock, mean_monthly, lead_time_days in c.fetchall():
+        daily_demand = mean_monthly / DAYS_PER_MONTH if mean_monthly else 0
+        order_up_to = reorder_point + (cycle_stock if cycle_stock is not None else reorder_point)
+        suggestions.append({
+            'id': item_id, 'name': name, 'category': category, 'quantity': quantity, 'unit': unit,
+            'reorder_point': reorder_point, 'safety_stock': safety_stock, 'lead_time_days': lead_time_days,
+            'suggested_quantity': max(order_up_to - quantity, 0),
+            'days_of_cover': math.floor(quantity / daily_demand) if daily_demand > 0 else None,
+        })
+    suggestions.sort(key=lambda s: (s['days_of_cover'] is None, s['days_of_cover'] or 0))
+    return suggestions
+
+def seconds_until_next_run(now=None):
+    """计算距离下一次每晚重算的秒数"""
+    now = now or datetime.now()
+    next_run = datetime.combine(now.date(), NIGHTLY_RECOMPUTE_TIME)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+async def run_nightly():
+    """
+    每晚在 NIGHTLY_RECOMPUTE_TIME 记录库存快照并增量重算补货计划，供长期运行的API服务作为后台任务启动。
+    """
+    while True:
+        await asyncio.sleep(seconds_until_next_run())
+        await asyncio.to_thread(inventory_management.take_stock_snapshots)
+        await asyncio.to_thread(recompute_plan)
+
+if __name__ == "__main__":
+    # 也可以由 cron 等外部调度器调用：python -m modules.replenishment_planning
+    print(f"已重新计算 {recompute_plan()} 个物品的补货计划")
@@ -4,10 +4,391 @@
 这个模块包含了日程管理系统的核心功能。
 它提供了添加、获取、删除事件以及管理团队事件的功能。
 所有的数据库操作都通过 utils.database 模块进行。
+
+时间范围查询统一使用半开区间 [start, end) 直接比较 start_time 列，
+避免在列上调用 DATE() 导致索引失效；参与者以 (event_id, user_id) 规范化存储。
+
+重复事件（如每周组会、仪器定期维护）以 RRULE 规则在 event_series 中只存一行，
+查询时由生成器按请求的时间窗口惰性展开，单次发生的取消或修改记录在 event_exceptions 中。
 """
 
+import calendar
+import heapq
 from utils import database
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 支持的重复频率及星期缩写（RFC 5545 子集）
+RECURRENCE_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# 单次查询中每个重复系列最多展开的发生次数，保证展开的时间和内存有界
+MAX_OCCURRENCES = 1000
+
+# 一个系列允许的最大重复次数（每天重复约二百七十年）
+MAX_SERIES_COUNT = 100000
+
+def _to_datetime(value):
+    """
+    将日期、时间或字符串统一转换为datetime对象。
+
+    参数:
+    value (datetime|date|str): 待转换的值，字符串格式为'YYYY-MM-DD'或'YYYY-MM-DD HH:MM:SS'
+
+    返回:
+    datetime: 转换后的datetime对象
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    return datetime.fromisoformat(str(value))
+
+def _format_timestamp(value):
+    """将时间值格式化为数据库中存储的统一文本格式"""
+    return _to_datetime(value).strftime(TIMESTAMP_FORMAT)
+
+def _day_bounds(start_date, end_date):
+    """
+    将闭区间的日期范围转换为半开区间的时间戳边界。
+
+    参数:
+    start_date (date|str): 开始日期
+    end_date (date|str): 结束日期（包含当天）
+
+    返回:
+    tuple: (起始时间戳, 结束时间戳)，结束时间戳为end_date次日零点
+    """
+    lower = _to_datetime(start_date).replace(hour=0, minute=0, second=0, microsecond=0)
+    upper = _to_datetime(end_date).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return lower.strftime(TIMESTAMP_FORMAT), upper.strftime(TIMESTAMP_FORMAT)
+
+def parse_rrule(rule):
+    """
+    解析RRULE字符串。
+
+    支持 FREQ=DAILY/WEEKLY/MONTHLY，以及 INTERVAL、COUNT、UNTIL 和 BYDAY（仅WEEKLY）。
+    UNTIL 按本地时间解释，与系统中其余时间字段一致。
+
+    参数:
+    rule (str): RRULE字符串，例如'FREQ=WEEKLY;BYDAY=MO,TH;COUNT=20'
+
+    返回:
+    dict: 包含freq、interval、count、until和byday的字典
+
+    异常:
+    ValueError: 规则无效或包含不支持的字段时抛出
+    """
+    parts = {}
+    for part in rule.upper().removeprefix('RRULE:').split(';'):
+        if part:
+            key, _, value = part.partition('=')
+            parts[key] = value
+    unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY', 'WKST'}
+    if unsupported:
+        raise ValueError(f"不支持的RRULE字段: {', '.join(sorted(unsupported))}")
+    freq = parts.get('FREQ')
+    if freq not in RECURRENCE_FREQUENCIES:
+        raise ValueError(f"不支持的重复频率: {freq}")
+    interval = int(parts.get('INTERVAL', 1))
+    if interval < 1:
+        raise ValueError("INTERVAL必须为正整数")
+    count = int(parts['COUNT']) if 'COUNT' in parts else None
+    if count is not None and count < 1:
+        raise ValueError("COUNT必须为正整数")
+    until = None
+    if 'UNTIL' in parts:
+        value = parts['UNTIL'].rstrip('Z')
+        until = datetime.strptime(value, '%Y%m%dT%H%M%S' if 'T' in value else '%Y%m%d')
+        if 'T' not in value:
+            until = until.replace(hour=23, minute=59, second=59)
+    byday = None
+    if 'BYDAY' in parts:
+        if freq != 'WEEKLY':
+            raise ValueError("BYDAY仅支持WEEKLY频率")
+        byday = sorted({WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')})
+    return {'freq': freq, 'interval': interval, 'count': count, 'until': until, 'byday': byday}
+
+def _iter_rule(rule, dtstart, lower):
+    """
+    按时间顺序生成不早于lower的发生时间。
+
+    对DAILY/WEEKLY直接按周期算出窗口所在的周期序号，对MONTHLY按月份差跳转，
+    因此无论系列已经持续多久，定位到窗口的开销都是常数级。
+
+    参数:
+    rule (dict): parse_rrule返回的规则
+    dtstart (datetime): 系列第一次发生的开始时间
+    lower (datetime): 窗口下界
+
+    返回:
+    generator: 依次生成(发生序号, 开始时间)
+    """
+    count, until, interval = rule['count'], rule['until'], rule['interval']
+    if rule['freq'] == 'MONTHLY':
+        # 月末日期不存在时（如31日）取当月最后一天，保证每个周期恰好发生一次
+        step = 0
+        if lower > dtstart:
+            months = (lower.year - dtstart.year) * 12 + lower.month - dtstart.month
+            step = max(0, months // interval - 1)
+        while True:
+            total = dtstart.month - 1 + step * interval
+            year, month = dtstart.year + total // 12, total % 12 + 1
+            occurrence = dtstart.replace(year=year, month=month, day=min(dtstart.day, calendar.monthrange(year, month)[1]))
+            if (count is not None and step >= count) or (until is not None and occurrence > until):
+                return
+            if occurrence >= lower:
+                yield step, occurrence
+            step += 1
+
+    if rule['freq'] == 'DAILY':
+        base = dtstart
+        period = timedelta(days=interval)
+        offsets = [timedelta(0)]
+    else:
+        base = dtstart - timedelta(days=dtstart.weekday())
+        period = timedelta(weeks=interval)
+        offsets = [timedelta(days=day) for day in (rule['byday'] or [dtstart.weekday()])]
+    # 第一个周期内早于dtstart的星期不计入发生次数
+    skipped = sum(1 for offset in offsets if base + offset < dtstart)
+    k = max(0, (lower - base) // period)
+    while True:
+        for j, offset in enumerate(offsets):
+            index = k * len(offsets) + j - skipped
+            if index < 0:
+                continue
+            occurrence = base + k * period + offset
+            if (count is not None and index >= count) or (until is not None and occurrence > until):
+                return
+            if occurrence >= lower:
+                yield index, occurrence
+        k += 1
+
+def _nth_occurrence(rule, dtstart, n):
+    """按规则直接算出第n次（从0开始计数）发生的开始时间，不逐次遍历"""
+    interval = rule['interval']
+    if rule['freq'] == 'MONTHLY':
+        total = dtstart.month - 1 + n * interval
+        year, month = dtstart.year + total // 12, total % 12 + 1
+        if year > datetime.max.year:
+            raise OverflowError("date value out of range")
+        return dtstart.replace(year=year, month=month, day=min(dtstart.day, calendar.monthrange(year, month)[1]))
+    if rule['freq'] == 'DAILY':
+        return dtstart + n * timedelta(days=interval)
+    base = dtstart - timedelta(days=dtstart.weekday())
+    offsets = [timedelta(days=day) for day in (rule['byday'] or [dtstart.weekday()])]
+    # 与 _iter_rule 相同：第一个周期内早于dtstart的星期不计入发生次数
+    k, j = divmod(n + sum(1 for offset in offsets if base + offset < dtstart), len(offsets))
+    return base + k * timedelta(weeks=interval) + offsets[j]
+
+def _series_until(rule, dtstart):
+    """
+    计算系列最后一次发生的开始时间，无限重复时返回None。
+
+    只在创建系列时调用一次，用于查询时按窗口筛选候选系列。COUNT 的最后一次发生直接按公式算出，
+    再从 COUNT 或 UNTIL 限定的边界前一个周期开始展开，因此开销与系列长度无关。
+
+    异常:
+    ValueError: COUNT 超过 MAX_SERIES_COUNT，或最后一次发生超出可表示的日期范围时抛出
+    """
+    count, bound = rule['count'], rule['until']
+    if count is None and bound is None:
+        return None
+    if count is not None and count > MAX_SERIES_COUNT:
+        raise ValueError(f"COUNT不能超过{MAX_SERIES_COUNT}")
+    try:
+        if count is not None:
+            last = _nth_occurrence(rule, dtstart, count - 1)
+            bound = last if bound is None else min(bound, last)
+        period = timedelta(days=31 * rule['interval']) if rule['freq'] == 'MONTHLY' else \
+            timedelta(days=rule['interval']) if rule['freq'] == 'DAILY' else timedelta(weeks=rule['interval'])
+        last = None
+        for _, occurrence in _iter_rule(rule, dtstart, max(dtstart, bound - period)):
+            last = occurrence
+    except OverflowError:
+        raise ValueError("重复规则超出支持的日期范围")
+    return last
+
+def _expand_series(series, skipped, participants, lower, upper):
+    """
+    惰性展开单个系列在 [lower, upper) 内的发生实例。
+
+    参数:
+    series (tuple): event_series行 (id, title, start_time, end_time, description, rrule, creator)
+    skipped (set): 窗口内已被取消或修改的原始开始时间（文本格式）
+    participants (list): 系列参与者用户名列表
+    lower (datetime): 窗口下界
+    upper (datetime): 窗口上界（不包含）
+
+    返回:
+    generator: 按开始时间排序的事件字典，最多生成MAX_OCCURRENCES个
+    """
+    series_id, title, start_time, end_time, description, rrule, creator = series
+    dtstart = _to_datetime(start_time)
+    duration = _to_datetime(end_time) - dtstart
+    produced = 0
+    for _, occurrence in _iter_rule(parse_rrule(rrule), dtstart, lower):
+        if occurrence >= upper or produced >= MAX_OCCURRENCES:
+            return
+        if occurrence.strftime(TIMESTAMP_FORMAT) in skipped:
+            continue
+        produced += 1
+        yield {'id': None, 'series_id': series_id, 'occurrence_start': occurrence, 'title': title, 'start_time': occurrence, 'end_time': occurrence + duration, 'description': description, 'participants': participants, 'creator': creator}
+
+def _query_series_occurrences(c, lower, upper, user_ids=None, participating=False):
+    """
+    查询并展开 [lower, upper) 内的重复事件发生实例。
+
+    参数:
+    c: 数据库游标对象
+    lower (str): 窗口下界时间戳
+    upper (str): 窗口上界时间戳（不包含）
+    user_ids (list): 创建者用户ID列表，为None时查询所有用户
+    participating (bool): 为True时同时包含这些用户作为参与者的系列
+
+    返回:
+    iterator: 按开始时间排序的事件字典
+    """
+    user_filter, user_params = "", ()
+    if user_ids is not None:
+        placeholders = ', '.join('?' * len(user_ids))
+        user_filter, user_params = f"s.user_id IN ({placeholders}) AND ", tuple(user_ids)
+        if participating:
+            user_filter = f"(s.user_id IN ({placeholders}) OR s.id IN (SELECT series_id FROM event_series_participants WHERE user_id IN ({placeholders}))) AND "
+            user_params = tuple(user_ids) * 2
+    c.execute(f"""
+        SELECT s.id, s.title, s.start_time, s.end_time, s.description, s.rrule, u.username
+        FROM event_series s
+        LEFT JOIN users u ON u.id = s.user_id
+        WHERE {user_filter}s.start_time < ? AND (s.until IS NULL OR s.until >= ?)
+    """, user_params + (upper, lower))
+    series_rows = c.fetchall()
+    if not series_rows:
+        return iter(())
+
+    # 所有候选系列的例外和参与者各用一次 IN 查询取回，不随系列数量增加查询次数
+    series_ids = [series[0] for series in series_rows]
+    skipped = {}
+    series_participants = {}
+    for start in range(0, len(series_ids), 500):
+        chunk = series_ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        c.execute(f"""
+            SELECT series_id, original_start FROM event_exceptions
+            WHERE series_id IN ({placeholders}) AND original_start >= ? AND original_start < ?
+        """, tuple(chunk) + (lower, upper))
+        for series_id, original_start in c.fetchall():
+            skipped.setdefault(series_id, set()).add(original_start)
+        c.execute(f"""
+            SELECT sp.series_id, u.username FROM event_series_participants sp
+            JOIN users u ON u.id = sp.user_id
+            WHERE sp.series_id IN ({placeholders})
+            ORDER BY sp.series_id, u.username
+        """, chunk)
+        for series_id, username in c.fetchall():
+            series_participants.setdefault(series_id, []).append(username)
+
+    streams = [_expand_series(series, skipped.get(series[0], set()), series_participants.get(series[0], []), _to_datetime(lower), _to_datetime(upper))
+               for series in series_rows]
+
+    # 被修改的发生实例按其新时间落入窗口，单独按 start_time 索引查询
+    c.execute(f"""
+        SELECT x.series_id, x.original_start, x.title, x.start_time, x.end_time, x.description, u.username
+        FROM event_exceptions x
+        JOIN event_series s ON s.id = x.series_id
+        LEFT JOIN users u ON u.id = s.user_id
+        WHERE {user_filter}x.cancelled = 0 AND x.start_time >= ? AND x.start_time < ?
+        ORDER BY x.start_time
+    """, user_params + (lower, upper))
+    streams.append([{'id': None, 'series_id': x[0], 'occurrence_start': _to_datetime(x[1]), 'title': x[2], 'start_time': _to_datetime(x[3]), 'end_time': _to_datetime(x[4]), 'description': x[5], 'participants': series_participants.get(x[0], []), 'creator': x[6]} for x in c.fetchall()])
+    return heapq.merge(*streams, key=lambda e: e['start_time'])
+
+def _mark_changed(c, event_id=None, series_id=None):
+    """
+    递增事件或系列的创建者及参与者的日程版本号。
+
+    在同一事务中调用，删除操作须在删除参与者之前调用。日历订阅根据版本号生成 ETag 和 Last-Modified。
+    """
+    if event_id is not None:
+        source = "SELECT user_id FROM events WHERE id = ? UNION SELECT user_id FROM event_participants WHERE event_id = ?"
+        params = (event_id, event_id)
+    else:
+        source = "SELECT user_id FROM event_series WHERE id = ? UNION SELECT user_id FROM event_series_participants WHERE series_id = ?"
+        params = (series_id, series_id)
+    c.execute(f"""
+        INSERT INTO schedule_changes (user_id, version, changed_at)
+        SELECT user_id, 1, ? FROM ({source}) WHERE user_id IS NOT NULL
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at
+    """, (_format_timestamp(datetime.now()),) + params)
+
+def _load_participants(c, user_id, lower, upper):
+    """
+    批量加载时间范围内事件的参与者。
+
+    使用与事件查询相同的索引条件进行连接，一次查询即可取回所有参与者，
+    不再依赖 GROUP_CONCAT 拼接后再拆分字符串。
+
+    返回:
+    dict: 事件ID到参与者用户名列表的映射
+    """
+    c.execute("""
+        SELECT ep.event_id, u.username
+        FROM events e
+        JOIN event_participants ep ON ep.event_id = e.id
+        JOIN users u ON u.id = ep.user_id
+        WHERE e.user_id = ? AND e.start_time >= ? AND e.start_time < ?
+        ORDER BY ep.event_id, u.username
+    """, (user_id, lower, upper))
+    participants = {}
+    for event_id, username in c.fetchall():
+        participants.setdefault(event_id, []).append(username)
+    return participants
+
+def _query_user_events(user_id, lower, upper):
+    """
+    查询用户在半开区间 [lower, upper) 内开始的事件，命中 (user_id, start_time) 索引，
+    并合并窗口内展开的重复事件发生实例。
+
+    返回:
+    list: 事件字典列表
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT id, title, start_time, end_time, description
+        FROM events
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        ORDER BY start_time
+    """, (user_id, lower, upper))
+    events = c.fetchall()
+    participants = _load_participants(c, user_id, lower, upper) if events else {}
+    singles = [{'id': e[0], 'series_id': None, 'title': e[1], 'start_time': _to_datetime(e[2]), 'end_time': _to_datetime(e[3]), 'description': e[4], 'participants': participants.get(e[0], [])} for e in events]
+    return list(heapq.merge(singles, _query_series_occurrences(c, lower, upper, [user_id]), key=lambda e: e['start_time']))
+
+def _resolve_participants(c, participants):
+    """
+    将参与者用户名解析为用户ID。
+
+    参数:
+    c: 数据库游标对象
+    participants (list): 参与者用户名列表
+
+    返回:
+    list: 用户ID列表
+
+    异常:
+    ValueError: 存在系统中没有的用户名时抛出，调用方据此放弃整个插入
+    """
+    names = list(dict.fromkeys(participants))
+    if not names:
+        return []
+    c.execute(f"SELECT username, id FROM users WHERE username IN ({', '.join('?' * len(names))})", names)
+    user_ids = dict(c.fetchall())
+    unknown = [name for name in names if name not in user_ids]
+    if unknown:
+        raise ValueError(f"未知的参与者: {', '.join(unknown)}")
+    return [user_ids[name] for name in names]
 
 def add_event(user_id, title, start_time, end_time, description, participants):
     """
@@ -19,26 +400,146 @@ def add_event(user_id, title, start_time, end_time, description, participants):
     start_time (datetime): 事件开始时间
     end_time (datetime): 事件结束时间
     description (str): 事件描述
-    participants (list): 参与者用户名列表
+    participants (list): 参与者用户名列表，其中有系统中不存在的用户名时不添加事件
     
     返回:
     bool: 添加成功返回True，失败返回False
     """
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO events (user_id, title, start_time, end_time, description)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, title, start_time, end_time, description))
-        event_id = c.lastrowid
-        for participant in participants:
-            c.execute("INSERT INTO event_participants (event_id, username) VALUES (?, ?)", (event_id, participant))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
+    with database.write_lock:
+        try:
+            participant_ids = _resolve_participants(c, participants)
+            c.execute("""
+                INSERT INTO events (user_id, title, start_time, end_time, description)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, title, _format_timestamp(start_time), _format_timestamp(end_time), description))
+            event_id = c.lastrowid
+            c.executemany("INSERT INTO event_participants (event_id, user_id) VALUES (?, ?)",
+                          [(event_id, participant_id) for participant_id in participant_ids])
+            _mark_changed(c, event_id=event_id)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def add_recurring_event(user_id, title, start_time, end_time, description, participants, rrule):
+    """
+    添加重复事件系列，整个系列只存储一行。
+    
+    参数:
+    user_id (int): 创建事件的用户ID
+    title (str): 事件标题
+    start_time (datetime): 第一次发生的开始时间
+    end_time (datetime): 第一次发生的结束时间
+    description (str): 事件描述
+    participants (list): 参与者用户名列表，其中有系统中不存在的用户名时不添加系列
+    rrule (str): RRULE重复规则，例如'FREQ=WEEKLY;COUNT=10'
+    
+    返回:
+    bool: 添加成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            participant_ids = _resolve_participants(c, participants)
+            until = _series_until(parse_rrule(rrule), _to_datetime(start_time))
+            c.execute("""
+                INSERT INTO event_series (user_id, title, start_time, end_time, description, rrule, until)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, title, _format_timestamp(start_time), _format_timestamp(end_time), description, rrule.upper().removeprefix('RRULE:'),
+                  _format_timestamp(until) if until else None))
+            series_id = c.lastrowid
+            c.executemany("INSERT INTO event_series_participants (series_id, user_id) VALUES (?, ?)",
+                          [(series_id, participant_id) for participant_id in participant_ids])
+            _mark_changed(c, series_id=series_id)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def cancel_occurrence(series_id, occurrence_start):
+    """
+    取消重复事件系列中的某一次发生。
+    
+    参数:
+    series_id (int): 系列ID
+    occurrence_start (datetime): 该次发生的原始开始时间
+    
+    返回:
+    bool: 取消成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("""
+                INSERT OR REPLACE INTO event_exceptions (series_id, original_start, cancelled)
+                VALUES (?, ?, 1)
+            """, (series_id, _format_timestamp(occurrence_start)))
+            _mark_changed(c, series_id=series_id)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def modify_occurrence(series_id, occurrence_start, title, start_time, end_time, description):
+    """
+    修改重复事件系列中的某一次发生（例如将某次组会改期）。
+    
+    参数:
+    series_id (int): 系列ID
+    occurrence_start (datetime): 该次发生的原始开始时间
+    title (str): 新标题
+    start_time (datetime): 新开始时间
+    end_time (datetime): 新结束时间
+    description (str): 新描述
+    
+    返回:
+    bool: 修改成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            c.execute("""
+                INSERT OR REPLACE INTO event_exceptions (series_id, original_start, cancelled, title, start_time, end_time, description)
+                VALUES (?, ?, 0, ?, ?, ?, ?)
+            """, (series_id, _format_timestamp(occurrence_start), title, _format_timestamp(start_time), _format_timestamp(end_time), description))
+            _mark_changed(c, series_id=series_id)
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
+
+def delete_series(series_id):
+    """
+    删除整个重复事件系列及其例外记录。
+    
+    参数:
+    series_id (int): 要删除的系列ID
+    
+    返回:
+    bool: 删除成功返回True，失败返回False
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    with database.write_lock:
+        try:
+            _mark_changed(c, series_id=series_id)
+            c.execute("DELETE FROM event_exceptions WHERE series_id = ?", (series_id,))
+            c.execute("DELETE FROM event_series_participants WHERE series_id = ?", (series_id,))
+            c.execute("DELETE FROM event_series WHERE id = ?", (series_id,))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
 def get_events_by_date(user_id, date):
     """
@@ -51,18 +552,7 @@ def get_events_by_date(user_id, date):
     返回:
     list: 事件字典列表
     """
-    conn = database.get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT e.id, e.title, e.start_time, e.end_time, e.description, GROUP_CONCAT(ep.username, ', ') as participants
-        FROM events e
-        LEFT JOIN event_participants ep ON e.id = ep.event_id
-        WHERE e.user_id = ? AND DATE(e.start_time) = ?
-        GROUP BY e.id
-        ORDER BY e.start_time
-    """, (user_id, date))
-    events = c.fetchall()
-    return [{'id': e[0], 'title': e[1], 'start_time': e[2], 'end_time': e[3], 'description': e[4], 'participants': e[5].split(', ') if e[5] else []} for e in events]
+    return _query_user_events(user_id, *_day_bounds(date, date))
 
 def get_events_by_range(user_id, start_date, end_date):
     """
@@ -76,18 +566,7 @@ def get_events_by_range(user_id, start_date, end_date):
     返回:
     list: 事件字典列表
     """
-    conn = database.get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT e.id, e.title, e.start_time, e.end_time, e.description, GROUP_CONCAT(ep.username, ', ') as participants
-        FROM events e
-        LEFT JOIN event_participants ep ON e.id = ep.event_id
-        WHERE e.user_id = ? AND DATE(e.start_time) BETWEEN ? AND ?
-        GROUP BY e.id
-        ORDER BY e.start_time
-    """, (user_id, start_date, end_date))
-    events = c.fetchall()
-    return [{'id': e[0], 'title': e[1], 'start_time': e[2], 'end_time': e[3], 'description': e[4], 'participants': e[5].split(', ') if e[5] else []} for e in events]
+    return _query_user_events(user_id, *_day_bounds(start_date, end_date))
 
 def delete_event(event_id):
     """
@@ -101,14 +580,16 @@ def delete_event(event_id):
     """
     conn = database.get_connection()
     c = conn.cursor()
-    try:
-        c.execute("DELETE FROM event_participants WHERE event_id = ?", (event_id,))
-        c.execute("DELETE FROM events WHERE id = ?", (event_id,))
-        conn.commit()
-        return True
-    except:
-        conn.rollback()
-        return False
+    with database.write_lock:
+        try:
+            _mark_changed(c, event_id=event_id)
+            c.execute("DELETE FROM event_participants WHERE event_id = ?", (event_id,))
+            c.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            conn.commit()
+            return True
+        except:
+            conn.rollback()
+            return False
 
 def get_team_events_by_date(date):
     """
@@ -120,17 +601,32 @@ def get_team_events_by_date(date):
     返回:
     list: 事件字典列表，包含创建者信息
     """
+    return get_team_events_by_range(date, date)
+
+def get_team_events_by_range(start_date, end_date):
+    """
+    获取指定日期范围内的所有团队事件（包括展开的重复事件），使用 start_time 索引做范围扫描。
+    
+    参数:
+    start_date (str): 开始日期，格式为'YYYY-MM-DD'
+    end_date (str): 结束日期，格式为'YYYY-MM-DD'
+    
+    返回:
+    list: 事件字典列表，包含创建者信息
+    """
+    lower, upper = _day_bounds(start_date, end_date)
     conn = database.get_connection()
     c = conn.cursor()
     c.execute("""
         SELECT e.id, e.title, e.start_time, e.end_time, e.description, u.username as creator
         FROM events e
         JOIN users u ON e.user_id = u.id
-        WHERE DATE(e.start_time) = ?
+        WHERE e.start_time >= ? AND e.start_time < ?
         ORDER BY e.start_time
-    """, (date,))
+    """, (lower, upper))
     events = c.fetchall()
-    return [{'id': e[0], 'title': e[1], 'start_time': e[2], 'end_time': e[3], 'description': e[4], 'creator': e[5]} for e in events]
+    singles = [{'id': e[0], 'series_id': None, 'title': e[1], 'start_time': _to_datetime(e[2]), 'end_time': _to_datetime(e[3]), 'description': e[4], 'creator': e[5]} for e in events]
+    return list(heapq.merge(singles, _query_series_occurrences(c, lower, upper), key=lambda e: e['start_time']))
 
 def get_upcoming_events(user_id, days=7):
     """
@@ -141,7 +637,7 @@ def get_upcoming_events(user_id, days=7):
     days (int): 未来的天数，默认为7天
     
     返回:
-    list: 事件字典列表，包含事件ID、标题和开始时间
+    list: 事件字典列表，包含事件ID、系列ID、标题和开始时间
     """
     conn = database.get_connection()
     c = conn.cursor()
@@ -150,8 +646,131 @@ def get_upcoming_events(user_id, days=7):
     c.execute("""
         SELECT id, title, start_time
         FROM events
-        WHERE user_id = ? AND start_time BETWEEN ? AND ?
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
         ORDER BY start_time
-    """, (user_id, now, future))
+    """, (user_id, _format_timestamp(now), _format_timestamp(future)))
     events = c.fetchall()
-    return [{'id': e[0], 'title': e[1], 'start_time': e[2]} for e in events]
\ No newline at end of file
+    singles = [{'id': e[0], 'series_id': None, 'title': e[1], 'start_time': _to_datetime(e[2])} for e in events]
+    occurrences = ({'id': None, 'series_id': o['series_id'], 'title': o['title'], 'start_time': o['start_time']}
+                   for o in _query_series_occurrences(c, _format_timestamp(now), _format_timestamp(future), [user_id]))
+    return list(heapq.merge(singles, occurrences, key=lambda e: e['start_time']))
+
+def get_busy_intervals(user_ids, start_time, end_time):
+    """
+    获取一组用户在指定时间段内的忙碌时间，供空闲/忙碌计算使用。
+
+    包括用户创建或参与的单次事件，以及展开后的重复事件发生实例。
+    
+    参数:
+    user_ids (list): 用户ID列表
+    start_time (datetime): 时间段开始
+    end_time (datetime): 时间段结束（不包含）
+    
+    返回:
+    list: (用户名, 开始时间, 结束时间) 元组列表，未排序
+    """
+    if not user_ids:
+        return []
+    lower, upper = _format_timestamp(start_time), _format_timestamp(end_time)
+    placeholders = ', '.join('?' * len(user_ids))
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT u.username, e.start_time, e.end_time
+        FROM events e
+        JOIN users u ON u.id = e.user_id
+        WHERE e.user_id IN ({placeholders}) AND e.start_time < ? AND e.end_time > ?
+        UNION ALL
+        SELECT u.username, e.start_time, e.end_time
+        FROM event_participants ep
+        JOIN events e ON e.id = ep.event_id
+        JOIN users u ON u.id = ep.user_id
+        WHERE ep.user_id IN ({placeholders}) AND e.start_time < ? AND e.end_time > ?
+    """, tuple(user_ids) + (upper, lower) + tuple(user_ids) + (upper, lower))
+    intervals = [(username, _to_datetime(start), _to_datetime(end)) for username, start, end in c.fetchall()]
+
+    c.execute(f"SELECT username FROM users WHERE id IN ({placeholders})", tuple(user_ids))
+    usernames = {row[0] for row in c.fetchall()}
+    # 重复事件按开始时间展开，窗口前移一天以覆盖跨越窗口起点的发生实例
+    series_lower = _format_timestamp(_to_datetime(start_time) - timedelta(days=1))
+    lower_bound = _to_datetime(start_time)
+    for occurrence in _query_series_occurrences(c, series_lower, upper, user_ids, participating=True):
+        if occurrence['end_time'] <= lower_bound:
+            continue
+        for username in usernames.intersection([occurrence['creator'], *occurrence['participants']]):
+            intervals.append((username, occurrence['start_time'], occurrence['end_time']))
+    return intervals
+
+def get_schedule_version(user_id=None):
+    """
+    获取日程版本信息，用于日历订阅的条件请求。
+    
+    参数:
+    user_id (int): 用户ID，为None时返回整个团队的版本
+    
+    返回:
+    tuple: (版本号, 最后修改时间)，没有任何变更时最后修改时间为None
+    """
+    conn = database.get_connection()
+    c = conn.cursor()
+    if user_id is None:
+        c.execute("SELECT COALESCE(SUM(version), 0), MAX(changed_at) FROM schedule_changes")
+    else:
+        c.execute("SELECT COALESCE(SUM(version), 0), MAX(changed_at) FROM schedule_changes WHERE user_id = ?", (user_id,))
+    version, changed_at = c.fetchone()
+    return version, _to_datetime(changed_at) if changed_at else None
+
+def iter_calendar_entries(start_time, end_time, user_id=None):
+    """
+    逐行遍历日历导出所需的事件，供 iCalendar 订阅流式输出。
+
+    单次事件按 start_time 索引范围扫描；重复事件不展开，按系列输出一次，
+    取消的发生实例作为 exdates，修改的发生实例以 recurrence_id 单独输出。
+    
+    参数:
+    start_time (datetime): 时间段开始
+    end_time (datetime): 时间段结束（不包含）
+    user_id (int): 用户ID（包括其参与的事件），为None时导出所有团队事件
+    
+    返回:
+    generator: 包含'uid'、'title'、'start_time'、'end_time'、'description'、'rrule'、
+    'exdates'和'recurrence_id'的字典
+    """
+    lower, upper = _format_timestamp(start_time), _format_timestamp(end_time)
+    conn = database.get_connection()
+    if user_id is None:
+        event_filter, series_filter, params = "", "", ()
+    else:
+        event_filter = "(e.user_id = ? OR e.id IN (SELECT event_id FROM event_participants WHERE user_id = ?)) AND "
+        series_filter = "(s.user_id = ? OR s.id IN (SELECT series_id FROM event_series_participants WHERE user_id = ?)) AND "
+        params = (user_id, user_id)
+
+    for event_id, title, start, end, description in conn.execute(f"""
+        SELECT e.id, e.title, e.start_time, e.end_time, e.description
+        FROM events e
+        WHERE {event_filter}e.start_time >= ? AND e.start_time < ?
+        ORDER BY e.start_time
+    """, params + (lower, upper)):
+        yield {'uid': f"event-{event_id}", 'title': title, 'start_time': _to_datetime(start), 'end_time': _to_datetime(end), 'description': description,
+               'rrule': None, 'exdates': [], 'recurrence_id': None}
+
+    exceptions = conn.cursor()
+    for series_id, title, start, end, description, rrule in conn.execute(f"""
+        SELECT s.id, s.title, s.start_time, s.end_time, s.description, s.rrule
+        FROM event_series s
+        WHERE {series_filter}s.start_time < ? AND (s.until IS NULL OR s.until >= ?)
+        ORDER BY s.start_time
+    """, params + (upper, lower)):
+        exceptions.execute("""
+            SELECT original_start, cancelled, title, start_time, end_time, description
+            FROM event_exceptions
+            WHERE series_id = ?
+            ORDER BY original_start
+        """, (series_id,))
+        overrides = exceptions.fetchall()
+        yield {'uid': f"series-{series_id}", 'title': title, 'start_time': _to_datetime(start), 'end_time': _to_datetime(end), 'description': description,
+               'rrule': rrule, 'exdates': [_to_datetime(x[0]) for x in overrides if x[1]], 'recurrence_id': None}
+        for original_start, cancelled, x_title, x_start, x_end, x_description in overrides:
+            if not cancelled:
+                yield {'uid': f"series-{series_id}", 'title': x_title, 'start_time': _to_datetime(x_start), 'end_time': _to_datetime(x_end), 'description': x_description,
+                       'rrule': None, 'exdates': [], 'recurrence_id': _to_datetime(original_start)}
@@ -33,6 +33,7 @@ PERMISSIONS = {
     'view_projects': '查看项目',
     'manage_schedule': '管理日程',
     'view_schedule': '查看日程',
+    'view_team_schedule': '查看团队日程',
     'manage_users': '管理用户',
     'view_data_visualization': '查看数据可视化',
     'export_data': '导出数据',
@@ -42,7 +43,7 @@ PERMISSIONS = {
 # 定义角色对应的权限
 ROLE_PERMISSIONS = {
     'admin': list(PERMISSIONS.keys()),
-    'lab_manager': ['manage_inventory', 'view_inventory', 'manage_finances', 'view_finances', 'manage_projects', 'view_projects', 'manage_schedule', 'view_schedule', 'view_data_visualization', 'export_data'],
+    'lab_manager': ['manage_inventory', 'view_inventory', 'manage_finances', 'view_finances', 'manage_projects', 'view_projects', 'manage_schedule', 'view_schedule', 'view_team_schedule', 'view_data_visualization', 'export_data'],
     'researcher': ['view_inventory', 'view_finances', 'manage_projects', 'view_projects', 'manage_schedule', 'view_schedule', 'view_data_visualization'],
     'student': ['view_inventory', 'view_projects', 'view_schedule'],
     'guest': ['view_schedule']
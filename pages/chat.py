@@ -1,19 +1,85 @@
 # pages/chat.py
 """
 这个文件实现了实验室聊天室的功能。
-它允许用户选择现有聊天室或创建新的聊天室，
-并在选定的聊天室中查看和发送消息。
+它允许用户选择自己所在的聊天室或创建新的聊天室，
+并在选定的聊天室中查看和发送消息；聊天室的创建者（以及用户管理员）可以添加和移出成员。
+已加载的消息保存在会话状态中，每次刷新只查询新消息，更早的消息按需分页加载。
+页面顶部可以按关键词、聊天室和日期范围搜索历史消息。
 """
 
 import streamlit as st
-from modules import communication
+from datetime import datetime, time, timedelta
+from modules import communication, user_management
+
+def render_search(chat_rooms):
+    """渲染聊天消息搜索区域，结果按相关度排序，每页 CHAT_PAGE_SIZE 条"""
+    with st.expander("搜索消息"):
+        query = st.text_input("关键词（多个关键词用空格分隔）", key="chat_search_query")
+        col1, col2 = st.columns(2)
+        with col1:
+            room = st.selectbox("聊天室", [None] + chat_rooms, key="chat_search_room",
+                                format_func=lambda r: "全部聊天室" if r is None else r['name'])
+        with col2:
+            dates = st.date_input("日期范围", value=(), key="chat_search_dates")
+        if not query.strip():
+            return
+        # 搜索条件变化时回到第一页
+        criteria = (query, room and room['id'], tuple(dates))
+        if st.session_state.get('chat_search_criteria') != criteria:
+            st.session_state.chat_search_criteria = criteria
+            st.session_state.chat_search_offset = 0
+        offset = st.session_state.chat_search_offset
+        start = datetime.combine(dates[0], time.min) if len(dates) > 0 else None
+        end = datetime.combine(dates[-1], time.min) + timedelta(days=1) if len(dates) > 0 else None
+        found = communication.search_messages(query, room_id=room and room['id'], start=start, end=end, offset=offset,
+                                              user_id=st.session_state.user['id'])
+        if not found['results']:
+            st.info("没有找到匹配的消息。")
+        if found['truncated']:
+            st.caption(f"匹配的消息超过 {communication.SEARCH_RANK_WINDOW} 条，只在最近的 "
+                       f"{communication.SEARCH_RANK_WINDOW} 条中排序，请增加关键词或限定聊天室、日期范围。")
+        room_names = {r['id']: r['name'] for r in chat_rooms}
+        for result in found['results']:
+            st.markdown(f"**{room_names.get(result['room_id'], '')}** · {result['username']} ({result['timestamp']})：{result['snippet']}")
+        col1, col2 = st.columns(2)
+        with col1:
+            if offset > 0 and st.button("上一页", key="chat_search_prev"):
+                st.session_state.chat_search_offset = max(0, offset - communication.CHAT_PAGE_SIZE)
+                st.rerun()
+        with col2:
+            if found['has_more'] and st.button("下一页", key="chat_search_next"):
+                st.session_state.chat_search_offset = offset + communication.CHAT_PAGE_SIZE
+                st.rerun()
+
+def render_members(room):
+    """聊天室创建者和用户管理员管理聊天室成员"""
+    with st.expander("聊天室成员"):
+        members = communication.get_room_members(room['id'])
+        member_ids = {member['id'] for member in members}
+        st.write("、".join(member['username'] for member in members))
+        others = [u for u in user_management.get_all_users() if u['id'] not in member_ids]
+        col1, col2 = st.columns(2)
+        with col1:
+            new_member = st.selectbox("添加成员", others, format_func=lambda u: u['username'], key="chat_add_member")
+            if new_member is not None and st.button("添加", key="chat_add_member_button"):
+                communication.add_room_member(room['id'], new_member['id'])
+                st.rerun()
+        with col2:
+            removable = [m for m in members if m['id'] != room['creator_id']]
+            old_member = st.selectbox("移出成员", removable, format_func=lambda u: u['username'], key="chat_remove_member")
+            if old_member is not None and st.button("移出", key="chat_remove_member_button"):
+                communication.remove_room_member(room['id'], old_member['id'])
+                st.rerun()
 
 def render():
     """渲染聊天室页面的主函数"""
     st.title("实验室聊天室")
 
-    # 获取所有聊天室
-    chat_rooms = communication.get_chat_rooms()
+    # 获取当前用户是成员的聊天室
+    user = st.session_state.user
+    chat_rooms = communication.get_chat_rooms(user['id'])
+
+    render_search(chat_rooms)
 
     # 选择或创建聊天室
     selected_room = st.selectbox("选择聊天室", [room['name'] for room in chat_rooms] + ["创建新聊天室"])
@@ -24,13 +90,38 @@ def render():
         if st.button("创建") and new_room_name:
             if communication.create_chat_room(new_room_name, st.session_state.user['id']):
                 st.success(f"聊天室 '{new_room_name}' 创建成功！")
-                st.experimental_rerun()
+                st.rerun()
             else:
                 st.error("创建聊天室失败，请重试。")
     else:
         # 显示选定聊天室的消息
-        room_id = next(room['id'] for room in chat_rooms if room['name'] == selected_room)
-        messages = communication.get_chat_messages(room_id)
+        room = next(room for room in chat_rooms if room['name'] == selected_room)
+        room_id = room['id']
+        if room['creator_id'] == user['id'] or user_management.has_permission(user['id'], 'manage_users'):
+            render_members(room)
+        history = st.session_state.setdefault('chat_history', {})
+        if room_id not in history:
+            latest = communication.get_chat_messages(room_id)
+            history[room_id] = {'messages': latest, 'has_more': len(latest) == communication.CHAT_PAGE_SIZE}
+        state = history[room_id]
+        if state['messages']:
+            # 只查询已加载的最大消息ID之后写入的新消息（实时聊天的消息可能晚于其时间戳写入）；
+            # 新消息超过一页时直接换成最新的一页
+            last_id = max(message['id'] for message in state['messages'])
+            newer = communication.get_chat_messages(room_id, after_id=last_id)
+            if len(newer) == communication.CHAT_PAGE_SIZE:
+                latest = communication.get_chat_messages(room_id)
+                state.update(messages=latest, has_more=True)
+            elif newer:
+                state['messages'] = sorted(state['messages'] + newer, key=lambda message: (message['timestamp'], message['id']))
+        else:
+            state['messages'] = communication.get_chat_messages(room_id)
+        messages = state['messages']
+
+        if state['has_more'] and messages and st.button("加载更早的消息"):
+            older = communication.get_older_messages(room_id, messages[0]['timestamp'], messages[0]['id'])
+            state.update(messages=older['messages'] + messages, has_more=older['has_more'])
+            st.rerun()
 
         # 遍历并显示聊天消息
         for msg in messages:
@@ -41,6 +132,6 @@ def render():
         if st.button("发送") and new_message:
             if communication.send_message(room_id, st.session_state.user['id'], new_message):
                 st.success("消息发送成功！")
-                st.experimental_rerun()
+                st.rerun()
             else:
                 st.error("发送消息失败，请重试。")
\ No newline at end of file
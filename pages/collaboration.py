@@ -1,12 +1,99 @@
 """
 这个文件实现了一个实时协作页面，包括实时聊天功能。
 它使用Streamlit创建用户界面，并通过WebSocket与服务器进行实时通信。
+每个会话保持一个在后台线程中运行的长连接客户端，页面定时取出收到的消息，不需要每条消息都重新连接。
+页面同时显示聊天室的在线用户和正在输入的用户。
+客户端在页面不再使用后（会话结束或离开页面）因闲置自动停止，再次打开页面时重新创建。
+Streamlit 的输入框只在回车或失去焦点时才把内容交给服务端，无法得知用户是否正在输入，
+因此"正在输入"状态由浏览器中的一小段脚本在按键时直接发送给聊天服务器。
+后台客户端用当前用户的 API 令牌向聊天服务器验证身份，浏览器中的脚本使用短期票据；只列出当前用户所在的聊天室。
 """
 
-import streamlit as st
-import websockets
-import asyncio
 import json
+import time
+import streamlit as st
+import streamlit.components.v1 as components
+import config
+from modules import auth, collaboration_client, communication, real_time_collaboration
+
+# 页面检查新消息的间隔（秒）
+REFRESH_INTERVAL = 1
+
+# 消息输入框的标签，浏览器中的脚本据此找到输入框
+MESSAGE_INPUT_LABEL = "输入消息"
+
+# 按键期间重复发送"正在输入"的最小间隔（毫秒），小于服务器的 TYPING_TIMEOUT
+TYPING_RESEND_MS = 2000
+
+# 在浏览器中运行的脚本：监听消息输入框的按键，通过单独的 WebSocket 连接把输入状态发给聊天服务器。
+# 组件的 iframe 与页面同源，可以访问页面的 document；组件被重新创建时先移除旧的监听器，组件被移除时关闭连接
+TYPING_SCRIPT = """
+<script>
+const config = %s;
+const host = window.parent;
+try { if (host.labTypingCleanup) host.labTypingCleanup(); } catch (e) {}
+const socket = new WebSocket(config.url);
+let lastSent = 0;
+const send = (data) => { if (socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify(data)); };
+socket.onopen = () => send({type: "join", room_id: config.room_id, ticket: config.ticket});
+const heartbeat = setInterval(() => send({type: "heartbeat"}), config.heartbeat_ms);
+const onInput = (event) => {
+  if (event.target.getAttribute("aria-label") !== config.label) return;
+  const typing = event.target.value.length > 0;
+  const now = Date.now();
+  if (!typing || now - lastSent >= config.resend_ms) {
+    lastSent = typing ? now : 0;
+    send({type: "typing", room_id: config.room_id, typing: typing});
+  }
+};
+host.document.addEventListener("input", onInput, true);
+const cleanup = () => {
+  host.document.removeEventListener("input", onInput, true);
+  clearInterval(heartbeat);
+  socket.close();
+};
+host.labTypingCleanup = cleanup;
+window.addEventListener("pagehide", cleanup);
+</script>
+"""
+
+def get_client():
+    """获取当前会话的协作客户端，第一次使用或之前的客户端已因闲置停止时创建并启动"""
+    client = st.session_state.get("collaboration_client")
+    if client is None or not client.running:
+        user = st.session_state.user
+        st.session_state.collaboration_client = collaboration_client.CollaborationClient(
+            config.COLLABORATION_WS_URL, auth.get_api_token(user["id"])).start()
+    return st.session_state.collaboration_client
+
+def get_ticket():
+    """
+    获取浏览器中的脚本连接聊天服务器使用的短期票据（不把长期有效的 API 令牌放进页面）。
+    票据保存在会话状态中，有效期过半时才更换，避免页面每次重新运行都重新创建脚本组件和连接
+    """
+    ticket, expires = st.session_state.get("collaboration_ticket", (None, 0))
+    if expires - time.time() < real_time_collaboration.TICKET_TTL / 2:
+        ticket = real_time_collaboration.sign_ticket(st.session_state.user["id"])
+        expires = time.time() + real_time_collaboration.TICKET_TTL
+        st.session_state.collaboration_ticket = (ticket, expires)
+    return ticket
+
+def apply_incoming(client):
+    """把客户端收到的消息合并到会话状态中的聊天记录"""
+    for data in client.drain():
+        if data["type"] == "history":
+            # 加入聊天室时服务器回放的最近消息，替换该聊天室已有的记录
+            st.session_state.chat_messages[data["room_id"]] = data["messages"]
+        elif data["type"] == "chat" and data.get("room_id") is not None:
+            st.session_state.chat_messages.setdefault(data["room_id"], []).append(data)
+        elif data["type"] == "presence":
+            # 完整的在线状态替换已有记录，差异消息只包含新上线和已离线的用户
+            room = {} if data["full"] else st.session_state.presence.get(data["room_id"], {})
+            room.update({member["user_id"]: member["user"] for member in data["online"]})
+            for user_id in data["offline"]:
+                room.pop(user_id, None)
+            st.session_state.presence[data["room_id"]] = room
+            st.session_state.typing[data["room_id"]] = data["typing"]
 
 def render():
     """渲染实时协作页面"""
@@ -14,44 +101,45 @@ def render():
 
     st.subheader("实时聊天")
 
-    # 显示聊天消息
     if "chat_messages" not in st.session_state:
-        st.session_state.chat_messages = []
+        st.session_state.chat_messages = {}
+        st.session_state.presence = {}
+        st.session_state.typing = {}
+    client = get_client()
 
-    for message in st.session_state.chat_messages:
-        st.text(f"{message['user']}: {message['message']}")
+    chat_rooms = communication.get_chat_rooms(st.session_state.user["id"])
+    if not chat_rooms:
+        st.info("你还不在任何聊天室中，请先在聊天室页面创建聊天室或请创建者添加你。")
+        return
+    room = st.selectbox("选择聊天室", [(r['id'], r['name']) for r in chat_rooms], format_func=lambda x: x[1])
+    room_id = room[0]
+    for joined in list(client.rooms - {room_id}):
+        client.leave(joined)
+    client.join(room_id)
 
-    # 发送消息
-    message = st.text_input("输入消息")
-    if st.button("发送"):
-        if message:
-            # 发送消息并刷新页面
-            asyncio.run(send_message(st.session_state.user["username"], message))
-            st.experimental_rerun()
+    @st.fragment(run_every=REFRESH_INTERVAL)
+    def show_messages():
+        # 只有这一部分定时重新运行，显示后台线程收到的新消息
+        apply_incoming(client)
+        if not client.connected.is_set():
+            st.caption("正在连接实时聊天服务器……")
+        online = st.session_state.presence.get(room_id, {})
+        st.caption(f"在线 ({len(online)}): " + "、".join(online.values()))
+        typing = [online[user_id] for user_id in st.session_state.typing.get(room_id, [])
+                  if user_id in online and user_id != st.session_state.user["id"]]
+        if typing:
+            st.caption("、".join(typing) + " 正在输入……")
+        for message in st.session_state.chat_messages.get(room_id, []):
+            st.text(f"{message['user']} ({message['timestamp']}): {message['message']}")
 
-async def send_message(user, message):
-    """
-    发送消息到WebSocket服务器
-    
-    参数:
-    user (str): 用户名
-    message (str): 消息内容
-    """
-    uri = "ws://localhost:8765"
-    async with websockets.connect(uri) as websocket:
-        # 发送消息
-        await websocket.send(json.dumps({"user": user, "message": message}))
-        # 接收响应
-        response = await websocket.recv()
-        data = json.loads(response)
-        # 添加消息到聊天记录
-        st.session_state.chat_messages.append({"user": data["user"], "message": data["message"]})
-
-# 在页面加载时连接到WebSocket服务器
-if "ws_connection" not in st.session_state:
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        st.session_state.ws_connection = loop.run_until_complete(websockets.connect("ws://localhost:8765"))
-    except Exception as e:
-        st.error(f"无法连接到WebSocket服务器：{str(e)}")
\ No newline at end of file
+    show_messages()
+
+    # 发送消息，只放入客户端的发送队列，服务器转发回来的消息会出现在上面的聊天记录中
+    # 输入状态由浏览器中的脚本在按键时发送，输入框清空或消息发出时结束
+    message = st.text_input(MESSAGE_INPUT_LABEL, key="collaboration_message")
+    components.html(TYPING_SCRIPT % json.dumps({
+        "url": config.COLLABORATION_WS_URL, "room_id": room_id, "label": MESSAGE_INPUT_LABEL,
+        "ticket": get_ticket(),
+        "heartbeat_ms": collaboration_client.HEARTBEAT_INTERVAL * 1000, "resend_ms": TYPING_RESEND_MS}), height=0)
+    if st.button("发送") and message:
+        client.send({"type": "chat", "room_id": room_id, "message": message})
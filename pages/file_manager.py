@@ -1,20 +1,49 @@
 # pages/file_manager.py
 """
 此文件包含文件管理页面的功能实现。
-主要功能包括：文件上传、文件列表显示、文件下载、文件删除和文件共享。
+主要功能包括：文件上传、文件列表显示、文件预览、文件下载、文件删除、文件共享（用户、用户组、项目成员）、
+分页显示共享给我的文件、存储用量、API 令牌，以及管理员可见的存储去重统计和用量报告。
 """
 
+import pandas as pd
 import streamlit as st
-from modules import cloud_storage
+import config
+from modules import auth, cloud_storage, file_previews, project_management, user_management
+
+def render_preview(file_id):
+    """显示文件预览，预览尚未生成时提示稍后查看"""
+    file = cloud_storage.get_accessible_file(file_id, st.session_state.user['id'])
+    if file is None:
+        return
+    preview = file_previews.get_preview(file['blob_hash'], file['path'], file['name'])
+    if preview['status'] == 'ready' and 'path' in preview:
+        st.image(preview['path'])
+    elif preview['status'] == 'ready':
+        st.caption("列: " + ", ".join(f"{column['name']} ({column['dtype']})" for column in preview['columns']))
+        st.dataframe(pd.DataFrame(preview['rows'], columns=[column['name'] for column in preview['columns']]))
+    elif preview['status'] == 'pending':
+        st.info("预览正在生成，请稍后刷新。")
+    elif preview['status'] == 'failed':
+        st.warning("无法生成该文件的预览。")
+    else:
+        st.caption("该文件类型不支持预览。")
 
 def render():
     """渲染文件管理页面的主要函数"""
     st.title("文件管理")
 
+    # 存储用量部分
+    usage = cloud_storage.get_storage_usage(st.session_state.user['id'])
+    st.progress(min(usage['bytes_used'] / usage['quota_bytes'], 1.0) if usage['quota_bytes'] else 1.0,
+                text=f"已用 {usage['bytes_used'] / 1024 ** 2:.1f} MB / {usage['quota_bytes'] / 1024 ** 3:.1f} GB（{usage['file_count']} 个文件）")
+
     # 文件上传部分
     uploaded_file = st.file_uploader("上传文件", type=["txt", "pdf", "doc", "docx", "xls", "xlsx"])
     if uploaded_file is not None:
-        if st.button("确认上传"):
+        if uploaded_file.size > usage['available_bytes']:
+            # 上传前先按文件大小检查配额，超出时不发起上传
+            st.error(f"存储空间不足：文件大小 {uploaded_file.size / 1024 ** 2:.1f} MB，剩余 {usage['available_bytes'] / 1024 ** 2:.1f} MB。")
+        elif st.button("确认上传"):
             # 调用云存储模块上传文件
             file_id = cloud_storage.upload_file(uploaded_file, st.session_state.user['id'])
             if file_id:
@@ -27,26 +56,103 @@ def render():
     # 获取用户的文件列表
     files = cloud_storage.list_user_files(st.session_state.user['id'])
     for file in files:
-        # 为每个文件创建三列布局：文件名、下载按钮和删除按钮
-        col1, col2, col3 = st.columns([3, 1, 1])
+        # 为每个文件创建四列布局：文件名、预览开关、下载按钮和删除按钮
+        col1, col0, col2, col3 = st.columns([3, 1, 1, 1])
         col1.write(file['name'])
-        if col2.button("下载", key=f"download_{file['id']}"):
-            # 调用云存储模块下载文件
-            cloud_storage.download_file(file['id'], st.session_state.user['id'])
+        show_preview = col0.toggle("预览", key=f"preview_{file['id']}")
+        # 下载由 API 服务直接从磁盘流式发送，支持断点续传，不经过 Streamlit 进程的内存；链接带有短期有效的签名
+        col2.link_button("下载", f"{config.API_BASE_URL}/files/{file['id']}/download?{cloud_storage.sign_file_url(file['id'], st.session_state.user['id'])}")
         if col3.button("删除", key=f"delete_{file['id']}"):
             # 调用云存储模块删除文件，成功后刷新页面
             if cloud_storage.delete_file(file['id'], st.session_state.user['id']):
-                st.experimental_rerun()
+                st.rerun()
+        if show_preview:
+            # 只有打开预览开关时才读取预览
+            render_preview(file['id'])
 
     # 文件共享部分
     st.subheader("文件共享")
-    # 选择要共享的文件
-    file_to_share = st.selectbox("选择要共享的文件", [f['name'] for f in files])
-    # 输入要共享的用户名
-    share_with = st.text_input("输入要共享的用户名")
-    if st.button("共享文件"):
+    # 选择要共享的文件，按文件ID共享，同名文件不会混淆
+    file_to_share = st.selectbox("选择要共享的文件", [(f['id'], f['name']) for f in files], format_func=lambda x: x[1])
+    share_target = st.radio("共享给", ["用户", "用户组", "项目成员"], horizontal=True)
+    if share_target == "用户":
+        share_with = st.text_input("输入要共享的用户名（多个用户名用逗号分隔）")
+    elif share_target == "用户组":
+        share_with = st.selectbox("选择用户组", list(user_management.ROLE_PERMISSIONS.keys()))
+    else:
+        projects = project_management.get_user_projects(st.session_state.user['id'])
+        share_with = st.selectbox("选择项目", [(p['id'], p['name']) for p in projects], format_func=lambda x: x[1])
+    if st.button("共享文件") and file_to_share and share_with:
         # 调用云存储模块共享文件
-        if cloud_storage.share_file(file_to_share, share_with, st.session_state.user['id']):
-            st.success(f"文件 '{file_to_share}' 已成功共享给 {share_with}")
+        if share_target == "用户":
+            count = cloud_storage.share_file_with_users(file_to_share[0], [name.strip() for name in share_with.split(',') if name.strip()], st.session_state.user['id'])
+        elif share_target == "用户组":
+            count = cloud_storage.share_file_with_group(file_to_share[0], share_with, st.session_state.user['id'])
         else:
-            st.error("文件共享失败，请检查用户名是否正确。")
\ No newline at end of file
+            count = cloud_storage.share_file_with_project(file_to_share[0], share_with[0], st.session_state.user['id'])
+        if count is None:
+            st.error("文件共享失败，请重试。")
+        elif count == 0:
+            st.warning("没有新增共享对象，请检查用户名是否正确或文件是否已共享。")
+        else:
+            st.success(f"文件 '{file_to_share[1]}' 已新共享给 {count} 位用户")
+
+    if file_to_share:
+        for share in cloud_storage.get_file_shares(file_to_share[0], st.session_state.user['id']):
+            col1, col2 = st.columns([4, 1])
+            col1.write(f"已共享给 {share['username']}（{share['shared_at']}）")
+            if col2.button("取消共享", key=f"unshare_{file_to_share[0]}_{share['user_id']}"):
+                cloud_storage.unshare_file(file_to_share[0], share['user_id'], st.session_state.user['id'])
+                st.rerun()
+
+    # 共享给我的文件部分，按游标分页，只查询当前页
+    st.subheader(f"共享给我的文件（{cloud_storage.count_shared_with_me(st.session_state.user['id'])}）")
+    if 'shared_page_cursors' not in st.session_state:
+        st.session_state.shared_page_cursors = [None]
+    page = cloud_storage.list_shared_with_me(st.session_state.user['id'], before_id=st.session_state.shared_page_cursors[-1])
+    for file in page['files']:
+        col1, col2 = st.columns([4, 1])
+        col1.write(f"{file['name']} — 来自 {file['shared_by']}（{file['shared_at']}）")
+        col2.link_button("下载", f"{config.API_BASE_URL}/files/{file['id']}/download?{cloud_storage.sign_file_url(file['id'], st.session_state.user['id'])}")
+    col1, col2 = st.columns(2)
+    if len(st.session_state.shared_page_cursors) > 1 and col1.button("上一页"):
+        st.session_state.shared_page_cursors.pop()
+        st.rerun()
+    if page['next_before_id'] is not None and col2.button("下一页"):
+        st.session_state.shared_page_cursors.append(page['next_before_id'])
+        st.rerun()
+
+    # API 令牌，用于通过 API 分块上传和查询文件
+    with st.expander("API 令牌"):
+        st.write("通过 API 上传大文件或查询文件时，在请求头中加入：")
+        st.code(f"Authorization: Bearer {auth.get_api_token(st.session_state.user['id'])}")
+
+    # 存储去重统计部分，仅管理员可见
+    if user_management.has_permission(st.session_state.user['id'], 'manage_users'):
+        with st.expander("存储去重统计"):
+            report = cloud_storage.get_dedup_report()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("文件数 / 实际存储数", f"{report['files']} / {report['blobs']}")
+            col2.metric("去重比", f"{report['dedup_ratio']:.2f}x")
+            col3.metric("节省空间", f"{report['saved_bytes'] / 1024 ** 2:.1f} MB")
+            st.caption(f"等待回收: {report['reclaimable_bytes'] / 1024 ** 2:.1f} MB")
+
+        with st.expander("存储用量报告"):
+            report = pd.DataFrame(cloud_storage.get_storage_report())
+            if not report.empty:
+                report['已用 (MB)'] = report['bytes_used'] / 1024 ** 2
+                report['配额 (GB)'] = report['quota_bytes'] / 1024 ** 3
+                st.dataframe(report[['username', '已用 (MB)', 'file_count', '配额 (GB)', 'usage_ratio']]
+                             .rename(columns={'username': '用户', 'file_count': '文件数', 'usage_ratio': '使用比例'}))
+                col1, col2 = st.columns(2)
+                quota_user = col1.selectbox("设置配额的用户", report[['user_id', 'username']].itertuples(index=False, name=None),
+                                            format_func=lambda x: x[1])
+                quota_gb = col2.number_input("配额 (GB)", min_value=0.0, value=cloud_storage.DEFAULT_QUOTA_BYTES / 1024 ** 3)
+                if st.button("保存配额"):
+                    cloud_storage.set_user_quota(quota_user[0], int(quota_gb * 1024 ** 3))
+                    st.rerun()
+            if st.button("立即对账"):
+                result = cloud_storage.reconcile_storage_usage()
+                st.write(f"检查 {result['checked_files']} 个文件：丢失 {len(result['missing_files'])} 个，"
+                         f"大小不一致 {len(result['size_mismatches'])} 个，计数器已修正 {len(result['counter_mismatches'])} 个用户，"
+                         f"孤立 blob {len(result['orphan_blobs'])} 个")
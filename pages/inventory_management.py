@@ -5,9 +5,11 @@
 主要功能包括：
 1. 添加新物品到库存
 2. 显示和更新现有库存
-3. 显示库存警报
+3. 显示库存警报及设置每个物品的再订货点
 4. 记录和显示库存使用情况
 5. 添加库存使用记录
+6. 批量扫码记录使用情况
+7. 显示采购建议及设置物品交货期
 
 作者: [您的名字]
 创建日期: [创建日期]
@@ -15,7 +17,7 @@
 """
 
 import streamlit as st
-from modules import inventory_management, user_management
+from modules import inventory_management, replenishment_planning, user_management
 
 def render():
     # 检查用户权限
@@ -34,10 +36,11 @@ def render():
     with col2:
         quantity = st.number_input("数量", min_value=0, step=1)
         unit = st.text_input("单位 (如: 个, 瓶, 盒)")
+    barcode = st.text_input("条形码 (可选)")
 
     # 处理添加物品的请求
     if st.button("添加物品"):
-        if inventory_management.add_item(name, category, quantity, unit):
+        if inventory_management.add_item(name, category, quantity, unit, barcode):
             st.success(f"成功添加 {quantity} {unit} {name}")
         else:
             st.error("添加物品失败，请重试。")
@@ -53,20 +56,70 @@ def render():
         
         # 处理更新物品数量的请求
         if col4.button("更新", key=f"update_{item['id']}"):
-            if inventory_management.update_item_quantity(item['id'], new_quantity):
+            if inventory_management.update_item_quantity(item['id'], new_quantity, expected_version=item['version'], user_id=st.session_state.user['id']):
                 st.success(f"已更新 {item['name']} 的数量为 {new_quantity} {item['unit']}")
             else:
-                st.error("更新数量失败，请重试。")
+                st.error("更新数量失败，库存可能已被他人修改，请刷新后重试。")
 
     # 显示库存警报
     st.subheader("库存警报")
     low_stock_items = inventory_management.get_low_stock_items()
     if low_stock_items:
         for item in low_stock_items:
-            st.warning(f"{item['name']} 库存不足，当前数量: {item['quantity']} {item['unit']}")
+            st.warning(f"{item['name']} 库存不足，当前数量: {item['quantity']} {item['unit']}（再订货点: {item['reorder_point']}）")
     else:
         st.info("目前没有库存不足的物品。")
 
+    # 设置再订货点
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        reorder_item = st.selectbox("设置再订货点的物品", [(item['id'], item['name']) for item in items], format_func=lambda x: x[1], key="reorder_item")
+    with col2:
+        reorder_point = st.number_input("再订货点", min_value=0, step=1, value=inventory_management.DEFAULT_REORDER_POINT)
+    with col3:
+        st.write("")
+        st.write("")
+        if st.button("保存再订货点") and reorder_item:
+            if inventory_management.set_reorder_point(reorder_item[0], reorder_point):
+                st.success("再订货点已更新")
+            else:
+                st.error("更新再订货点失败，请重试。")
+
+    with st.expander("最近的低库存通知"):
+        for alert in inventory_management.get_stock_alerts():
+            st.write(f"{alert['created_at']} - {alert['name']} 跌破再订货点 {alert['reorder_point']}，当时数量: {alert['quantity']} {alert['unit']}")
+
+    # 显示采购建议
+    st.subheader("采购建议")
+    suggestions = replenishment_planning.get_purchase_suggestions()
+    if suggestions:
+        st.dataframe([{
+            "物品": s['name'],
+            "当前数量": f"{s['quantity']} {s['unit']}",
+            "再订货点": s['reorder_point'],
+            "安全库存": s['safety_stock'] if s['safety_stock'] is not None else "-",
+            "交货期(天)": s['lead_time_days'],
+            "建议采购量": s['suggested_quantity'],
+            "可用天数": s['days_of_cover'] if s['days_of_cover'] is not None else "-",
+        } for s in suggestions])
+    else:
+        st.info("目前没有需要采购的物品。")
+
+    # 设置交货期，补货计划会在夜间按新的交货期重新计算
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        lead_time_item = st.selectbox("设置交货期的物品", [(item['id'], item['name']) for item in items], format_func=lambda x: x[1], key="lead_time_item")
+    with col2:
+        lead_time_days = st.number_input("交货期 (天)", min_value=1, step=1, value=replenishment_planning.DEFAULT_LEAD_TIME_DAYS)
+    with col3:
+        st.write("")
+        st.write("")
+        if st.button("保存交货期") and lead_time_item:
+            if replenishment_planning.set_lead_time(lead_time_item[0], lead_time_days):
+                st.success("交货期已更新，补货计划将在夜间重新计算")
+            else:
+                st.error("更新交货期失败，请重试。")
+
     # 显示库存使用记录
     st.subheader("库存使用记录")
     usage_records = inventory_management.get_usage_records()
@@ -88,4 +141,21 @@ def render():
             if inventory_management.add_usage_record(st.session_state.user['id'], item_id[0], used_quantity):
                 st.success("使用记录已添加")
             else:
-                st.error("添加使用记录失败，请重试。")
\ No newline at end of file
+                st.error("添加使用记录失败，请检查库存是否充足。")
+
+    # 批量扫码记录
+    st.subheader("批量扫码记录")
+    scanned = st.text_area("每行一个条形码，可用逗号附加数量（如: 6901234567890,2）")
+    if st.button("提交扫码记录") and scanned.strip():
+        lines = []
+        for row in scanned.strip().splitlines():
+            code, _, count = row.strip().partition(",")
+            lines.append({'barcode': code.strip(), 'quantity': int(count) if count.strip().isdigit() else 1})
+        result = inventory_management.add_usage_records_batch(st.session_state.user['id'], lines)
+        if result['success']:
+            st.success(f"已记录 {len(lines)} 条使用记录")
+        else:
+            st.error("扫码记录未提交，请修正以下问题后重试：")
+            for line, line_result in zip(lines, result['results']):
+                if line_result['status'] != 'ok':
+                    st.write(f"{line['barcode']}: {line_result['status']}")
@@ -5,17 +5,81 @@ pages/literature.py
 
 主要功能:
 1. 添加新文献
-2. 搜索现有文献
-3. 编辑文献信息
+2. 从 BibTeX / RIS 文件批量导入文献，并报告重复和冲突的题录
+3. 搜索现有文献（全文检索，按相关度排序并分页）
+4. 编辑文献信息
+5. 查看文献的引用网络：导入参考文献列表、邻域图、共被引和文献耦合的相似文献
 
 作者: [您的名字]
 创建日期: [创建日期]
 最后修改日期: [最后修改日期]
 """
 
+import io
 import streamlit as st
-from modules import literature_management
-import datetime
+from modules import citation_graph, literature_management
+from datetime import datetime
+
+# 引用网络图中最多显示的文献数量
+GRAPH_NODE_LIMIT = 60
+
+def _dot_label(text, width=30):
+    """截断标题并转义，用作 Graphviz 节点标签"""
+    text = text or ""
+    text = text if len(text) <= width else text[:width] + "…"
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+def render_citations(literature_id):
+    """渲染一篇文献的引用网络：导入参考文献、邻域图以及共被引和文献耦合的相似文献"""
+    literature = literature_management.get_literature(literature_id)
+    st.subheader(f"引用网络: {literature['title']}")
+
+    references = st.file_uploader("导入这篇文献的参考文献列表 (.bib / .ris，或每行一条、带 DOI 的 .txt)",
+                                  type=["bib", "ris", "txt"], key="references_file")
+    if references is not None and st.button("导入参考文献"):
+        fmt = {"bib": "bibtex", "ris": "ris", "txt": "text"}.get(references.name.rsplit(".", 1)[-1].lower())
+        report = citation_graph.import_references(
+            literature_id, io.TextIOWrapper(references, encoding="utf-8-sig", errors="replace"), fmt)
+        if report is None:
+            st.error("导入参考文献失败，请重试。")
+        else:
+            st.success(f"匹配到 {report['matched']} 篇参考文献，新增 {report['added']} 条引用关系。")
+            if report['unmatched']:
+                with st.expander(f"文献库中没有的参考文献 ({len(report['unmatched'])})"):
+                    st.dataframe(report['unmatched'])
+            for error in report['errors']:
+                st.error(f"第 {error['line']} 行: {error['reason']}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        hops = st.slider("跳数", 1, citation_graph.MAX_HOPS, 1)
+    with col2:
+        direction = st.radio("方向", ["both", "out", "in"], horizontal=True,
+                             format_func={"both": "全部", "out": "参考文献", "in": "施引文献"}.get)
+    neighbourhood = citation_graph.get_neighbourhood(literature_id, hops, direction, limit=GRAPH_NODE_LIMIT)
+    if len(neighbourhood['nodes']) <= 1:
+        st.info("这篇文献还没有引用关系。")
+    else:
+        lines = [f'  {node["id"]} [label="{_dot_label(node["title"])}"{", style=filled" if node["hops"] == 0 else ""}];'
+                 for node in neighbourhood['nodes']]
+        lines += [f"  {citing} -> {cited};" for citing, cited in neighbourhood['edges']]
+        st.graphviz_chart("digraph {\n  node [shape=box, fontsize=10];\n" + "\n".join(lines) + "\n}")
+        if neighbourhood['truncated']:
+            st.caption(f"邻域较大，只显示了最近、引用关系最多的 {GRAPH_NODE_LIMIT} 篇文献。")
+
+    col1, col2 = st.columns(2)
+    for column, label, similar in ((col1, "**共被引** (经常与它一起被引用)", citation_graph.get_co_cited(literature_id)),
+                                   (col2, "**文献耦合** (与它有共同的参考文献)", citation_graph.get_coupled(literature_id))):
+        with column:
+            st.write(label)
+            if similar:
+                st.dataframe(similar, hide_index=True)
+            else:
+                st.caption("暂无")
+
+    if st.button("关闭引用网络"):
+        del st.session_state.citation_literature_id
+        st.rerun()
 
 def render():
     """渲染学术文献管理页面的主函数"""
@@ -37,12 +101,44 @@ def render():
         else:
             st.error("添加文献失败，请重试。")
 
+    # 批量导入文献
+    st.subheader("批量导入 (BibTeX / RIS)")
+    uploaded = st.file_uploader("选择从 Zotero、EndNote 等导出的 .bib 或 .ris 文件", type=["bib", "ris", "txt"])
+    if uploaded is not None and st.button("导入"):
+        fmt = {"bib": "bibtex", "ris": "ris"}.get(uploaded.name.rsplit(".", 1)[-1].lower())
+        with st.spinner("正在导入……"):
+            report = literature_management.import_literature(
+                st.session_state.user['id'], io.TextIOWrapper(uploaded, encoding="utf-8-sig", errors="replace"), fmt)
+        if report['failed']:
+            st.error(f"导入中途失败，已导入 {report['imported']} 条文献。")
+        else:
+            st.success(f"导入了 {report['imported']} 条文献，跳过重复 {len(report['duplicates'])} 条、"
+                       f"冲突 {len(report['conflicts'])} 条。")
+        if report['conflicts']:
+            st.warning("以下题录与已有文献冲突，未导入，请核对：")
+            st.dataframe(report['conflicts'])
+        if report['duplicates']:
+            with st.expander(f"重复的题录 ({len(report['duplicates'])})"):
+                st.dataframe(report['duplicates'])
+        for error in report['errors']:
+            st.error(f"第 {error['line']} 行: {error['reason']}" if error['line'] else error['reason'])
+
     # 搜索文献
     st.subheader("搜索文献")
-    search_query = st.text_input("搜索 (标题、作者或关键词)")
+    search_query = st.text_input("搜索 (标题、作者或关键词，多个关键词用空格分隔，以 * 结尾按前缀匹配)")
     if search_query:
-        # 执行文献搜索
-        results = literature_management.search_literature(search_query)
+        # 搜索词变化时回到第一页
+        if st.session_state.get('literature_search_query') != search_query:
+            st.session_state.literature_search_query = search_query
+            st.session_state.literature_search_offset = 0
+        offset = st.session_state.literature_search_offset
+        page_size = literature_management.LITERATURE_PAGE_SIZE
+        # 执行文献搜索，多取一条用来判断是否还有下一页
+        results = literature_management.search_literature(search_query, limit=page_size + 1, offset=offset)
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if not results:
+            st.info("没有找到匹配的文献。")
         for result in results:
             st.write(f"**{result['title']}**")
             st.write(f"作者: {result['authors']}")
@@ -54,8 +150,20 @@ def render():
             if st.button("编辑", key=f"edit_{result['id']}"):
                 # 设置要编辑的文献ID
                 st.session_state.edit_literature_id = result['id']
-                st.experimental_rerun()
+                st.rerun()
+            if st.button("引用网络", key=f"citations_{result['id']}"):
+                st.session_state.citation_literature_id = result['id']
+                st.rerun()
             st.write("---")
+        col1, col2 = st.columns(2)
+        with col1:
+            if offset > 0 and st.button("上一页"):
+                st.session_state.literature_search_offset = max(0, offset - page_size)
+                st.rerun()
+        with col2:
+            if has_more and st.button("下一页"):
+                st.session_state.literature_search_offset = offset + page_size
+                st.rerun()
 
     # 编辑文献
     if 'edit_literature_id' in st.session_state:
@@ -74,11 +182,15 @@ def render():
             if literature_management.update_literature(st.session_state.edit_literature_id, new_title, new_authors, new_journal, new_year, new_doi, new_notes):
                 st.success("文献更新成功！")
                 del st.session_state.edit_literature_id
-                st.experimental_rerun()
+                st.rerun()
             else:
                 st.error("更新文献失败，请重试。")
 
         if st.button("取消编辑"):
             # 取消编辑，清除编辑状态
             del st.session_state.edit_literature_id
-            st.experimental_rerun()
\ No newline at end of file
+            st.rerun()
+
+    # 引用网络
+    if 'citation_literature_id' in st.session_state:
+        render_citations(st.session_state.citation_literature_id)
@@ -3,14 +3,17 @@
 """
 此文件包含日程管理页面的渲染逻辑。
 主要功能包括：
-1. 添加新事件
+1. 添加新事件（支持每天/每周/每月重复）
 2. 显示用户日程（日、周、月视图）
 3. 显示团队日程（如果用户有权限）
 4. 显示即将到来的事件提醒
+5. 为多位参与者寻找共同空闲的会议时间
+6. 提供 iCalendar 订阅链接
 """
 
 import streamlit as st
-from modules import schedule_management, user_management
+from modules import schedule_management, user_management, free_busy, calendar_export
+import config
 from datetime import datetime, timedelta
 
 def render():
@@ -27,13 +30,25 @@ def render():
         event_end_time = st.time_input("结束时间")
     event_description = st.text_area("事件描述")
     event_participants = st.multiselect("参与者", user_management.get_all_usernames())
+    recurrence_options = {"不重复": None, "每天": "DAILY", "每周": "WEEKLY", "每月": "MONTHLY"}
+    col3, col4 = st.columns(2)
+    with col3:
+        event_recurrence = st.selectbox("重复", list(recurrence_options.keys()))
+    with col4:
+        event_repeat_count = st.number_input("重复次数（0 表示不限）", min_value=0, max_value=schedule_management.MAX_SERIES_COUNT, value=0, disabled=recurrence_options[event_recurrence] is None)
 
     if st.button("添加事件"):
         # 将日期和时间合并为datetime对象
         start_datetime = datetime.combine(event_date, event_start_time)
         end_datetime = datetime.combine(event_date, event_end_time)
         # 尝试添加事件并显示结果
-        if schedule_management.add_event(st.session_state.user['id'], event_title, start_datetime, end_datetime, event_description, event_participants):
+        freq = recurrence_options[event_recurrence]
+        if freq is None:
+            added = schedule_management.add_event(st.session_state.user['id'], event_title, start_datetime, end_datetime, event_description, event_participants)
+        else:
+            rrule = f"FREQ={freq}" + (f";COUNT={event_repeat_count}" if event_repeat_count else "")
+            added = schedule_management.add_recurring_event(st.session_state.user['id'], event_title, start_datetime, end_datetime, event_description, event_participants, rrule)
+        if added:
             st.success("事件已添加到日程")
         else:
             st.error("添加事件失败，请重试")
@@ -62,13 +77,30 @@ def render():
         with st.expander(f"{event['start_time'].strftime('%H:%M')} - {event['end_time'].strftime('%H:%M')}: {event['title']}"):
             st.write(f"描述: {event['description']}")
             st.write(f"参与者: {', '.join(event['participants'])}")
-            if st.button("删除事件", key=f"delete_{event['id']}"):
-                # 尝试删除事件并显示结果
-                if schedule_management.delete_event(event['id']):
-                    st.success("事件已删除")
-                    st.experimental_rerun()
-                else:
-                    st.error("删除事件失败，请重试")
+            if event['series_id'] is None:
+                if st.button("删除事件", key=f"delete_{event['id']}"):
+                    # 尝试删除事件并显示结果
+                    if schedule_management.delete_event(event['id']):
+                        st.success("事件已删除")
+                        st.experimental_rerun()
+                    else:
+                        st.error("删除事件失败，请重试")
+            else:
+                # 重复事件：可只取消本次，或删除整个系列
+                occurrence_key = f"{event['series_id']}_{event['occurrence_start']:%Y%m%d%H%M}"
+                col_once, col_series = st.columns(2)
+                if col_once.button("取消本次", key=f"cancel_{occurrence_key}"):
+                    if schedule_management.cancel_occurrence(event['series_id'], event['occurrence_start']):
+                        st.success("本次事件已取消")
+                        st.experimental_rerun()
+                    else:
+                        st.error("取消事件失败，请重试")
+                if col_series.button("删除整个系列", key=f"delete_series_{occurrence_key}"):
+                    if schedule_management.delete_series(event['series_id']):
+                        st.success("重复事件已删除")
+                        st.experimental_rerun()
+                    else:
+                        st.error("删除事件失败，请重试")
 
     # 团队日程（仅对有权限的用户显示）
     if user_management.has_permission(st.session_state.user['id'], 'view_team_schedule'):
@@ -82,4 +114,33 @@ def render():
     st.subheader("即将到来的事件")
     upcoming_events = schedule_management.get_upcoming_events(st.session_state.user['id'])
     for event in upcoming_events:
-        st.info(f"提醒: {event['title']} 将在 {event['start_time'].strftime('%Y-%m-%d %H:%M')} 开始")
\ No newline at end of file
+        st.info(f"提醒: {event['title']} 将在 {event['start_time'].strftime('%Y-%m-%d %H:%M')} 开始")
+
+    # 寻找会议时间
+    st.subheader("寻找会议时间")
+    slot_participants = st.multiselect("参与者", user_management.get_all_usernames(), key="slot_participants")
+    col5, col6, col7 = st.columns(3)
+    with col5:
+        slot_start_date = st.date_input("开始日期", datetime.now(), key="slot_start_date")
+    with col6:
+        slot_end_date = st.date_input("结束日期", datetime.now() + timedelta(days=13), key="slot_end_date")
+    with col7:
+        slot_duration = st.number_input("会议时长（分钟）", min_value=15, max_value=480, value=60, step=15)
+    if st.button("查找空闲时间") and slot_participants:
+        slots = free_busy.find_meeting_slots(slot_participants, slot_start_date, slot_end_date, duration_minutes=slot_duration)
+        if not slots:
+            st.warning("所选日期范围内没有可用的时间段。")
+        for slot in slots:
+            text = f"{slot['start'].strftime('%Y-%m-%d %H:%M')} - {slot['end'].strftime('%H:%M')}"
+            if slot['unavailable']:
+                st.write(f"{text}（无法参加: {', '.join(slot['unavailable'])}）")
+            else:
+                st.success(f"{text}（所有人都有空）")
+
+    # 日历订阅
+    st.subheader("日历订阅")
+    feed_token = calendar_export.get_feed_token(st.session_state.user['id'])
+    st.write("在日历应用（如 Outlook、Apple 日历、Google 日历）中添加以下订阅地址：")
+    st.code(f"{config.API_BASE_URL}/schedule/feeds/{feed_token}/user.ics")
+    if user_management.has_permission(st.session_state.user['id'], 'view_team_schedule'):
+        st.code(f"{config.API_BASE_URL}/schedule/feeds/{feed_token}/team.ics")
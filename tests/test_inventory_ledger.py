@@ -0,0 +1,170 @@
+# tests/test_inventory_ledger.py
+"""
+库存流水测试
+设计思路:
+1. 多线程并发出库和入库，验证没有丢失更新、库存不会变为负数
+2. 分别验证共享连接（依赖写事务锁）和每线程独立连接（依赖条件UPDATE）两种情况
+3. 验证乐观版本检查会拒绝基于过期数据的数量修改
+4. 验证历史数量查询与流水完整重放的结果一致
+5. 验证每次跌破再订货点只产生一次低库存通知
+6. 从升级前的旧库存表开始，验证升级时补记的期初流水和快照使重放、历史数量与当前数量一致，
+   且已经低于再订货点的物品在启动时进入低库存集合
+"""
+
+import contextlib
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import database
+from modules import inventory_management
+
+
+@pytest.fixture(params=["shared", "per_thread"])
+def db(request, tmp_path, monkeypatch):
+    path = str(tmp_path / "lab_management.db")
+    if request.param == "shared":
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        monkeypatch.setattr(database, "get_connection", lambda: conn)
+    else:
+        local = threading.local()
+
+        def get_connection():
+            if not hasattr(local, "conn"):
+                local.conn = sqlite3.connect(path, timeout=30)
+            return local.conn
+
+        monkeypatch.setattr(database, "get_connection", get_connection)
+        # 独立连接模拟多进程部署，此时正确性只能依赖数据库层面的原子条件更新
+        monkeypatch.setattr(database, "write_lock", contextlib.nullcontext())
+    database.init_db()
+    return request.param
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """只有升级前的库存表和数据、尚未建立流水表的数据库"""
+    conn = sqlite3.connect(str(tmp_path / "lab_management.db"), check_same_thread=False)
+    conn.execute("CREATE TABLE inventory_items (id INTEGER PRIMARY KEY, name TEXT, category TEXT, quantity INTEGER, unit TEXT)")
+    conn.execute("INSERT INTO inventory_items (name, category, quantity, unit) VALUES ('离心管', '耗材', 5, '包')")
+    conn.commit()
+    monkeypatch.setattr(database, "get_connection", lambda: conn)
+    database.init_db()
+    return conn
+
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_usage_has_no_lost_updates(db):
+    inventory_management.add_item("移液枪头", "耗材", 1000, "盒")
+    item_id = inventory_management.get_all_items()[0]["id"]
+    successes = []
+    restocked = []
+
+    def worker(i):
+        for _ in range(60):
+            if inventory_management.add_usage_record(i + 1, item_id, 3):
+                successes.append(3)
+        if i % 4 == 0:
+            for _ in range(10):
+                if inventory_management.restock_item(i + 1, item_id, 5):
+                    restocked.append(5)
+
+    _run_threads(worker, 8)
+
+    item = inventory_management.get_all_items()[0]
+    expected = 1000 + sum(restocked) - sum(successes)
+    assert item["quantity"] == expected
+    assert item["quantity"] >= 0
+    assert inventory_management.replay_item_quantity(item_id) == expected
+
+    conn = database.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM inventory_usage WHERE item_id = ?", (item_id,)).fetchone()[0] == len(successes)
+    balance = 0
+    for (delta,) in conn.execute("SELECT delta FROM stock_movements WHERE item_id = ? ORDER BY id", (item_id,)):
+        balance += delta
+        assert balance >= 0
+
+
+def test_usage_rejected_when_stock_insufficient(db):
+    inventory_management.add_item("液氮", "试剂", 5, "升")
+    item_id = inventory_management.get_all_items()[0]["id"]
+    assert not inventory_management.add_usage_record(1, item_id, 6)
+    assert inventory_management.add_usage_record(1, item_id, 5)
+    assert inventory_management.get_all_items()[0]["quantity"] == 0
+
+
+def test_stale_version_update_is_rejected(db):
+    inventory_management.add_item("培养皿", "耗材", 50, "个")
+    item = inventory_management.get_all_items()[0]
+    assert inventory_management.add_usage_record(1, item["id"], 10)
+    assert not inventory_management.update_item_quantity(item["id"], 60, expected_version=item["version"])
+    assert inventory_management.get_all_items()[0]["quantity"] == 40
+
+    fresh = inventory_management.get_all_items()[0]
+    assert inventory_management.update_item_quantity(fresh["id"], 60, expected_version=fresh["version"])
+    assert inventory_management.replay_item_quantity(fresh["id"]) == 60
+
+
+def test_historical_quantity_matches_replay(db):
+    inventory_management.add_item("乙醇", "试剂", 10000, "毫升")
+    item_id = inventory_management.get_all_items()[0]["id"]
+    checkpoints = []
+    for i in range(inventory_management.SNAPSHOT_INTERVAL * 3):
+        inventory_management.add_usage_record(1, item_id, 7)
+        if i % 37 == 0:
+            checkpoints.append((datetime.now(), inventory_management.get_all_items()[0]["quantity"]))
+
+    conn = database.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM stock_snapshots WHERE item_id = ?", (item_id,)).fetchone()[0] >= 3
+    for moment, quantity in checkpoints:
+        assert inventory_management.get_item_quantity_at(item_id, moment) == quantity
+    assert inventory_management.get_item_quantity_at(item_id, datetime.now()) == 10000 - 7 * inventory_management.SNAPSHOT_INTERVAL * 3
+    assert inventory_management.get_item_quantity_at(item_id, datetime.now() - timedelta(days=1)) == 0
+
+
+def test_low_stock_alert_emitted_once_per_crossing(db):
+    inventory_management.add_item("手套", "耗材", 20, "盒")
+    item_id = inventory_management.get_all_items()[0]["id"]
+    assert inventory_management.set_reorder_point(item_id, 8)
+
+    for _ in range(5):
+        inventory_management.add_usage_record(1, item_id, 3)
+    assert [item["id"] for item in inventory_management.get_low_stock_items()] == [item_id]
+    assert len(inventory_management.get_stock_alerts()) == 1
+
+    assert inventory_management.restock_item(1, item_id, 50)
+    assert inventory_management.get_low_stock_items() == []
+    assert inventory_management.add_usage_records_batch(1, [{"item_id": item_id, "quantity": 50}])["success"]
+    assert len(inventory_management.get_low_stock_items()) == 1
+    assert len(inventory_management.get_stock_alerts()) == 2
+
+
+def test_existing_items_get_opening_balance(legacy_db):
+    item_id = inventory_management.get_all_items()[0]["id"]
+    assert inventory_management.replay_item_quantity(item_id) == 5
+    assert inventory_management.get_item_quantity_at(item_id, datetime.now()) == 5
+
+    assert inventory_management.add_usage_record(1, item_id, 2)
+    assert inventory_management.get_all_items()[0]["quantity"] == 3
+    assert inventory_management.replay_item_quantity(item_id) == 3
+    assert inventory_management.get_item_quantity_at(item_id, datetime.now()) == 3
+
+    # 再次启动时不会重复补记
+    database.init_db()
+    assert inventory_management.replay_item_quantity(item_id) == 3
+
+
+def test_existing_low_stock_items_found_at_startup(legacy_db):
+    item_id = inventory_management.get_all_items()[0]["id"]
+    assert [item["id"] for item in inventory_management.get_low_stock_items()] == [item_id]
+    # 启动时的校正不产生通知，通知只在之后跌破再订货点时产生
+    assert inventory_management.get_stock_alerts() == []
@@ -20,8 +20,14 @@
 """
 
 import sqlite3
+import threading
+from datetime import datetime
 import streamlit as st
 
+# 共享连接上的写事务锁：所有Streamlit会话线程共用同一个连接，
+# 多语句写事务必须串行执行，否则一个线程的commit/rollback会影响另一个线程未完成的事务
+write_lock = threading.RLock()
+
 @st.cache_resource
 def get_connection():
     """
@@ -33,6 +39,20 @@ def get_connection():
     """
     return sqlite3.connect('lab_management.db', check_same_thread=False)
 
+def _ensure_column(c, table, column, definition):
+    """
+    为已存在的旧表补充新增的列。
+
+    参数:
+        c: 数据库游标对象
+        table (str): 表名
+        column (str): 列名
+        definition (str): 列定义，例如 'INTEGER DEFAULT 0'
+    """
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 def init_db():
     """
     初始化数据库，创建必要的表结构
@@ -41,11 +61,28 @@ def init_db():
     - users: 用户信息表
     - inventory_items: 库存物品表
     - inventory_usage: 库存使用记录表
+    - stock_movements / stock_snapshots: 库存变动流水表及库存快照表
+    - inventory_usage_monthly / rollup_state: 按月汇总的库存使用量表及增量汇总进度表
+    - low_stock_items / stock_alerts: 当前低于再订货点的物品集合及低库存通知表
+    - replenishment_plan: 每个物品的需求统计、安全库存和计划再订货点
     - financial_transactions: 财务交易记录表
     - budgets: 预算表
     - equipment_bookings: 设备预约表
+    - resources / resource_bookings: 资源表及资源预约表
     - equipment_usage_logs: 设备使用日志表
     - experiments: 实验数据表
+    - events / event_participants: 日程事件表及参与者表
+    - event_series / event_series_participants / event_exceptions: 重复事件系列、参与者及单次例外表
+    - schedule_changes / calendar_feed_tokens: 日程变更版本表及日历订阅令牌表
+    - api_tokens: API 令牌表
+    - files / blobs / file_shares / upload_sessions: 文件表、内容寻址存储表、文件共享表及分块上传会话表
+    - file_previews: 文件预览生成状态表
+    - storage_usage: 每个用户的存储用量计数器及配额
+    - project_members: 项目成员表
+    - chat_rooms / chat_room_members / chat_messages: 聊天室表、聊天室成员表及聊天消息表
+    - chat_messages_fts / chat_messages_fts_bigram: 聊天消息按三字符片段和二字符片段切分的 FTS5 全文索引，由触发器同步
+    - literature / literature_fts / literature_fts_trigram: 文献表及其按词和按三字符片段切分的全文索引
+    - citations: 文献之间的引用关系表
     """
     conn = get_connection()
     c = conn.cursor()
@@ -66,7 +103,18 @@ def init_db():
                   name TEXT,
                   category TEXT,
                   quantity INTEGER,
-                  unit TEXT)''')
+                  unit TEXT,
+                  version INTEGER DEFAULT 0,
+                  barcode TEXT,
+                  reorder_point INTEGER,
+                  planned_reorder_point INTEGER,
+                  lead_time_days INTEGER)''')
+    _ensure_column(c, 'inventory_items', 'version', 'INTEGER DEFAULT 0')
+    _ensure_column(c, 'inventory_items', 'barcode', 'TEXT')
+    _ensure_column(c, 'inventory_items', 'reorder_point', 'INTEGER')
+    _ensure_column(c, 'inventory_items', 'planned_reorder_point', 'INTEGER')
+    _ensure_column(c, 'inventory_items', 'lead_time_days', 'INTEGER')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_items_barcode ON inventory_items (barcode) WHERE barcode IS NOT NULL')
     # 创建库存使用记录表
     c.execute('''CREATE TABLE IF NOT EXISTS inventory_usage
                  (id INTEGER PRIMARY KEY,
@@ -76,6 +124,79 @@ def init_db():
                   timestamp TIMESTAMP,
                   FOREIGN KEY (user_id) REFERENCES users (id),
                   FOREIGN KEY (item_id) REFERENCES inventory_items (id))''')
+    # 创建库存变动流水表（只追加），delta 为正表示入库，为负表示出库
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_movements
+                 (id INTEGER PRIMARY KEY,
+                  item_id INTEGER,
+                  user_id INTEGER,
+                  delta INTEGER,
+                  reason TEXT,
+                  timestamp TIMESTAMP,
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_item_time ON stock_movements (item_id, timestamp)')
+    # 创建库存快照表，记录某条流水之后物品的数量
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_snapshots
+                 (item_id INTEGER,
+                  movement_id INTEGER,
+                  quantity INTEGER,
+                  timestamp TIMESTAMP,
+                  PRIMARY KEY (item_id, movement_id),
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id),
+                  FOREIGN KEY (movement_id) REFERENCES stock_movements (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_stock_snapshots_item_time ON stock_snapshots (item_id, timestamp)')
+    # 升级前已存在的物品没有任何流水：以当前数量补记一条'opening'期初流水和对应的快照，
+    # 使流水重放和历史数量查询从升级时刻起与 inventory_items.quantity 一致
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements")
+    last_movement_id = c.fetchone()[0]
+    c.execute("""
+        INSERT INTO stock_movements (item_id, user_id, delta, reason, timestamp)
+        SELECT i.id, NULL, COALESCE(i.quantity, 0), 'opening', ?
+        FROM inventory_items i
+        WHERE NOT EXISTS (SELECT 1 FROM stock_movements m WHERE m.item_id = i.id)
+    """, (datetime.now(),))
+    c.execute("""
+        INSERT INTO stock_snapshots (item_id, movement_id, quantity, timestamp)
+        SELECT item_id, id, delta, timestamp FROM stock_movements WHERE id > ?
+    """, (last_movement_id,))
+    # 创建低库存物品集合表，库存变化时在同一事务中维护
+    c.execute('''CREATE TABLE IF NOT EXISTS low_stock_items
+                 (item_id INTEGER PRIMARY KEY,
+                  since TIMESTAMP,
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id))''')
+    # 创建低库存通知表，物品每次跌破再订货点时产生一条
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_alerts
+                 (id INTEGER PRIMARY KEY,
+                  item_id INTEGER,
+                  quantity INTEGER,
+                  reorder_point INTEGER,
+                  created_at TIMESTAMP,
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id))''')
+    # 创建按月汇总的库存使用量表（month 格式为 'YYYY-MM'），由 inventory_usage 增量汇总得到
+    c.execute('''CREATE TABLE IF NOT EXISTS inventory_usage_monthly
+                 (item_id INTEGER,
+                  month TEXT,
+                  quantity INTEGER,
+                  PRIMARY KEY (item_id, month),
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_inventory_usage_monthly_month ON inventory_usage_monthly (month)')
+    # 创建补货计划表，保存每晚根据月使用量统计算出的安全库存和再订货点（basis_month 为统计截止的月份）
+    c.execute('''CREATE TABLE IF NOT EXISTS replenishment_plan
+                 (item_id INTEGER PRIMARY KEY,
+                  history_months INTEGER,
+                  mean_monthly REAL,
+                  std_monthly REAL,
+                  lead_time_days INTEGER,
+                  safety_stock INTEGER,
+                  reorder_point INTEGER,
+                  cycle_stock INTEGER,
+                  basis_month TEXT,
+                  computed_at TIMESTAMP,
+                  FOREIGN KEY (item_id) REFERENCES inventory_items (id))''')
+    # 创建增量汇总进度表，记录每个汇总任务已处理到的源表最大ID
+    c.execute('''CREATE TABLE IF NOT EXISTS rollup_state
+                 (name TEXT PRIMARY KEY,
+                  last_id INTEGER)''')
     # 创建财务交易记录表
     c.execute('''CREATE TABLE IF NOT EXISTS financial_transactions
                  (id INTEGER PRIMARY KEY,
@@ -99,6 +220,21 @@ def init_db():
                   end_time TIMESTAMP,
                   FOREIGN KEY (user_id) REFERENCES users (id),
                   FOREIGN KEY (equipment_id) REFERENCES inventory_items (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_equipment_bookings_user_start ON equipment_bookings (user_id, start_time)')
+    # 创建资源表及资源预约表（time_slot 格式为 'HH:MM-HH:MM'）
+    c.execute('''CREATE TABLE IF NOT EXISTS resources
+                 (id INTEGER PRIMARY KEY,
+                  name TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS resource_bookings
+                 (id INTEGER PRIMARY KEY,
+                  resource_id INTEGER,
+                  user_id INTEGER,
+                  date DATE,
+                  time_slot TEXT,
+                  reason TEXT,
+                  FOREIGN KEY (resource_id) REFERENCES resources (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_resource_bookings_user_date ON resource_bookings (user_id, date)')
     # 创建设备使用日志表
     c.execute('''CREATE TABLE IF NOT EXISTS equipment_usage_logs
                  (id INTEGER PRIMARY KEY,
@@ -117,8 +253,283 @@ def init_db():
                   data TEXT,
                   timestamp TIMESTAMP,
                   FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # 创建日程事件表
+    # start_time/end_time 统一存储为 'YYYY-MM-DD HH:MM:SS' 文本，范围查询直接比较列值，
+    # 从而可以命中 (user_id, start_time) 与 start_time 两个索引
+    c.execute('''CREATE TABLE IF NOT EXISTS events
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  title TEXT,
+                  start_time TIMESTAMP,
+                  end_time TIMESTAMP,
+                  description TEXT,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_events_user_start ON events (user_id, start_time)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_events_start ON events (start_time)')
+    # 创建事件参与者表（规范化存储，每个参与者一行）
+    c.execute('''CREATE TABLE IF NOT EXISTS event_participants
+                 (event_id INTEGER,
+                  user_id INTEGER,
+                  PRIMARY KEY (event_id, user_id),
+                  FOREIGN KEY (event_id) REFERENCES events (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_event_participants_user ON event_participants (user_id, event_id)')
+    # 创建重复事件系列表（每个系列只存一行，发生次数在查询时按窗口展开）
+    # until 为最后一次发生的开始时间，无限重复时为NULL
+    c.execute('''CREATE TABLE IF NOT EXISTS event_series
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  title TEXT,
+                  start_time TIMESTAMP,
+                  end_time TIMESTAMP,
+                  description TEXT,
+                  rrule TEXT,
+                  until TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_event_series_user_start ON event_series (user_id, start_time)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_event_series_start ON event_series (start_time)')
+    c.execute('''CREATE TABLE IF NOT EXISTS event_series_participants
+                 (series_id INTEGER,
+                  user_id INTEGER,
+                  PRIMARY KEY (series_id, user_id),
+                  FOREIGN KEY (series_id) REFERENCES event_series (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_event_series_participants_user ON event_series_participants (user_id, series_id)')
+    # 创建重复事件例外表，按原始发生时间标识某一次发生的取消或修改
+    c.execute('''CREATE TABLE IF NOT EXISTS event_exceptions
+                 (series_id INTEGER,
+                  original_start TIMESTAMP,
+                  cancelled INTEGER DEFAULT 0,
+                  title TEXT,
+                  start_time TIMESTAMP,
+                  end_time TIMESTAMP,
+                  description TEXT,
+                  PRIMARY KEY (series_id, original_start),
+                  FOREIGN KEY (series_id) REFERENCES event_series (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_event_exceptions_start ON event_exceptions (start_time)')
+    # 创建日程变更版本表，每次日程写入时递增相关用户的版本号，用于日历订阅的 ETag/Last-Modified
+    c.execute('''CREATE TABLE IF NOT EXISTS schedule_changes
+                 (user_id INTEGER PRIMARY KEY,
+                  version INTEGER DEFAULT 0,
+                  changed_at TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # 创建日历订阅令牌表
+    c.execute('''CREATE TABLE IF NOT EXISTS calendar_feed_tokens
+                 (token TEXT PRIMARY KEY,
+                  user_id INTEGER UNIQUE,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # 创建 API 令牌表，API 服务根据请求头中的令牌识别调用者
+    c.execute('''CREATE TABLE IF NOT EXISTS api_tokens
+                 (token TEXT PRIMARY KEY,
+                  user_id INTEGER UNIQUE,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # 创建文件表，path 为文件在服务器上的存储路径，name 为用户上传时的原始文件名
+    c.execute('''CREATE TABLE IF NOT EXISTS files
+                 (id INTEGER PRIMARY KEY,
+                  name TEXT,
+                  path TEXT,
+                  user_id INTEGER,
+                  size INTEGER,
+                  uploaded_at TIMESTAMP,
+                  blob_hash TEXT,
+                  FOREIGN KEY (user_id) REFERENCES users (id),
+                  FOREIGN KEY (blob_hash) REFERENCES blobs (hash))''')
+    _ensure_column(c, 'files', 'size', 'INTEGER')
+    _ensure_column(c, 'files', 'uploaded_at', 'TIMESTAMP')
+    _ensure_column(c, 'files', 'blob_hash', 'TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_files_user ON files (user_id)')
+    # 创建内容寻址存储表，hash 为文件内容的SHA-256，ref_count 为指向该 blob 的文件记录数
+    c.execute('''CREATE TABLE IF NOT EXISTS blobs
+                 (hash TEXT PRIMARY KEY,
+                  size INTEGER,
+                  ref_count INTEGER DEFAULT 0,
+                  created_at TIMESTAMP,
+                  unreferenced_at TIMESTAMP)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (unreferenced_at) WHERE ref_count = 0')
+    # 创建文件预览表，按 blob 记录预览类型和生成状态（pending / ready / failed）
+    c.execute('''CREATE TABLE IF NOT EXISTS file_previews
+                 (blob_hash TEXT PRIMARY KEY,
+                  kind TEXT,
+                  status TEXT,
+                  error TEXT,
+                  updated_at TIMESTAMP,
+                  FOREIGN KEY (blob_hash) REFERENCES blobs (hash))''')
+    # 创建文件共享表，每个文件对每个被共享者只有一条记录
+    c.execute('''CREATE TABLE IF NOT EXISTS file_shares
+                 (id INTEGER PRIMARY KEY,
+                  file_id INTEGER,
+                  shared_by INTEGER,
+                  shared_with INTEGER,
+                  created_at TIMESTAMP,
+                  FOREIGN KEY (file_id) REFERENCES files (id),
+                  FOREIGN KEY (shared_by) REFERENCES users (id),
+                  FOREIGN KEY (shared_with) REFERENCES users (id))''')
+    _ensure_column(c, 'file_shares', 'created_at', 'TIMESTAMP')
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_file_shares_file_grantee_unique'")
+    if c.fetchone() is None:
+        # 旧数据库中可能有重复的共享记录，建立唯一索引前只保留最早的一条
+        c.execute('DELETE FROM file_shares WHERE id NOT IN (SELECT MIN(id) FROM file_shares GROUP BY file_id, shared_with)')
+        c.execute('DROP INDEX IF EXISTS idx_file_shares_file_grantee')
+        c.execute('CREATE UNIQUE INDEX idx_file_shares_file_grantee_unique ON file_shares (file_id, shared_with)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_file_shares_grantee ON file_shares (shared_with, id)')
+    # 创建项目成员表
+    c.execute('''CREATE TABLE IF NOT EXISTS project_members
+                 (project_id INTEGER,
+                  user_id INTEGER,
+                  PRIMARY KEY (project_id, user_id),
+                  FOREIGN KEY (project_id) REFERENCES projects (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_project_members_user ON project_members (user_id, project_id)')
+    # 创建聊天室表
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_rooms
+                 (id INTEGER PRIMARY KEY,
+                  name TEXT,
+                  creator_id INTEGER,
+                  FOREIGN KEY (creator_id) REFERENCES users (id))''')
+    # 创建聊天室成员表，只有成员可以查看和发送聊天室的消息
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_room_members'")
+    backfill_room_members = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_room_members
+                 (room_id INTEGER,
+                  user_id INTEGER,
+                  PRIMARY KEY (room_id, user_id),
+                  FOREIGN KEY (room_id) REFERENCES chat_rooms (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_chat_room_members_user ON chat_room_members (user_id, room_id)')
+    if backfill_room_members:
+        # 在此之前所有用户都能访问所有聊天室，已有的聊天室保持这一点，之后由创建者调整成员
+        c.execute("INSERT OR IGNORE INTO chat_room_members (room_id, user_id) SELECT r.id, u.id FROM chat_rooms r, users u")
+    # 创建聊天消息表，按 (room_id, timestamp, id) 建索引，分页查询只扫描一页的消息
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_messages
+                 (id INTEGER PRIMARY KEY,
+                  room_id INTEGER,
+                  user_id INTEGER,
+                  content TEXT,
+                  timestamp TIMESTAMP,
+                  FOREIGN KEY (room_id) REFERENCES chat_rooms (id),
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_room_time ON chat_messages (room_id, timestamp, id)')
+    # 按时间范围搜索时用来确定该范围内消息的ID区间
+    c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_time ON chat_messages (timestamp, id)')
+    # 创建聊天消息全文索引，外部内容表只存索引不存正文，由触发器与 chat_messages 保持同步；
+    # trigram 分词把文本切成连续的三字符片段，中文不需要分词也能按子串检索
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages_fts'")
+    if c.fetchone() is None:
+        c.execute('''CREATE VIRTUAL TABLE chat_messages_fts USING fts5
+                     (content, content='chat_messages', content_rowid='id', tokenize='trigram')''')
+        # 为已有的消息建立索引
+        c.execute("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+                     INSERT INTO chat_messages_fts (rowid, content) VALUES (new.id, new.content);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+                     INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE OF content ON chat_messages BEGIN
+                     INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                     INSERT INTO chat_messages_fts (rowid, content) VALUES (new.id, new.content);
+                 END''')
+    # trigram 索引不能检索少于3个字符的关键词（如两个汉字的词），为它们另建一个二字符片段索引：
+    # 把消息切成所有相邻的两个字符（最后一个字符单独成一段），以空格连接后用 unicode61 分词，
+    # 两个字符的关键词查找同名的词，一个字符的关键词按前缀查找。切分在 SQL 中完成（用 json_each 生成序号），
+    # 不依赖在连接上注册的函数；索引不存正文（contentless），删除时用同样的表达式重新切分旧内容
+    bigrams = ("(SELECT group_concat(substr({0}, key + 1, 2), ' ') FROM json_each("
+               "'[' || substr(replace(hex(zeroblob(length({0}))), '00', ',0'), 2) || ']'))")
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages_fts_bigram'")
+    if c.fetchone() is None:
+        c.execute('''CREATE VIRTUAL TABLE chat_messages_fts_bigram USING fts5
+                     (content, content='', tokenize='unicode61 remove_diacritics 0', prefix='1')''')
+        # 为已有的消息建立索引
+        c.execute(f"INSERT INTO chat_messages_fts_bigram (rowid, content) SELECT id, {bigrams.format('content')} FROM chat_messages")
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_bigram_insert AFTER INSERT ON chat_messages BEGIN
+                      INSERT INTO chat_messages_fts_bigram (rowid, content) VALUES (new.id, {bigrams.format('new.content')});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_bigram_delete AFTER DELETE ON chat_messages BEGIN
+                      INSERT INTO chat_messages_fts_bigram (chat_messages_fts_bigram, rowid, content)
+                      VALUES ('delete', old.id, {bigrams.format('old.content')});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS chat_messages_fts_bigram_update AFTER UPDATE OF content ON chat_messages BEGIN
+                      INSERT INTO chat_messages_fts_bigram (chat_messages_fts_bigram, rowid, content)
+                      VALUES ('delete', old.id, {bigrams.format('old.content')});
+                      INSERT INTO chat_messages_fts_bigram (rowid, content) VALUES (new.id, {bigrams.format('new.content')});
+                  END''')
+    # 创建文献表
+    c.execute('''CREATE TABLE IF NOT EXISTS literature
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  title TEXT,
+                  authors TEXT,
+                  journal TEXT,
+                  year INTEGER,
+                  doi TEXT,
+                  notes TEXT,
+                  doi_norm TEXT,
+                  title_hash TEXT,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # 去重用的规范化 DOI（同一 DOI 只能有一条文献）和标题指纹
+    _ensure_column(c, 'literature', 'doi_norm', 'TEXT')
+    _ensure_column(c, 'literature', 'title_hash', 'TEXT')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_literature_doi_norm ON literature (doi_norm) WHERE doi_norm IS NOT NULL')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_literature_title_hash ON literature (title_hash)')
+    # 创建文献引用关系表，主键 (citing_id, cited_id) 即引用方向的邻接索引，另建被引方向的索引
+    c.execute('''CREATE TABLE IF NOT EXISTS citations
+                 (citing_id INTEGER,
+                  cited_id INTEGER,
+                  PRIMARY KEY (citing_id, cited_id),
+                  FOREIGN KEY (citing_id) REFERENCES literature (id),
+                  FOREIGN KEY (cited_id) REFERENCES literature (id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_citations_cited ON citations (cited_id, citing_id)')
+    # 创建文献全文索引（标题、作者、笔记），由触发器与 literature 保持同步：
+    # literature_fts 按词切分（unicode61）并建立前缀索引，用于英文检索和前缀查询；
+    # literature_fts_trigram 按三字符片段切分，用于中文标题等没有空格分隔的文本
+    for fts, tokenize in (('literature_fts', "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"),
+                          ('literature_fts_trigram', "tokenize='trigram'")):
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        if c.fetchone() is None:
+            c.execute(f'''CREATE VIRTUAL TABLE {fts} USING fts5
+                          (title, authors, notes, content='literature', content_rowid='id', {tokenize})''')
+            c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON literature BEGIN
+                          INSERT INTO {fts} (rowid, title, authors, notes) VALUES (new.id, new.title, new.authors, new.notes);
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON literature BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, title, authors, notes) VALUES ('delete', old.id, old.title, old.authors, old.notes);
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF title, authors, notes ON literature BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, title, authors, notes) VALUES ('delete', old.id, old.title, old.authors, old.notes);
+                          INSERT INTO {fts} (rowid, title, authors, notes) VALUES (new.id, new.title, new.authors, new.notes);
+                      END''')
+    # 创建分块上传会话表，received 为已确认写入临时文件的字节数
+    c.execute('''CREATE TABLE IF NOT EXISTS upload_sessions
+                 (id TEXT PRIMARY KEY,
+                  user_id INTEGER,
+                  name TEXT,
+                  total_size INTEGER,
+                  received INTEGER DEFAULT 0,
+                  created_at TIMESTAMP,
+                  updated_at TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions (updated_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_user ON upload_sessions (user_id)')
+    # 创建存储用量表，bytes_used / file_count 在上传和删除文件时于同一事务中更新，quota_bytes 为空时使用默认配额
+    c.execute('''CREATE TABLE IF NOT EXISTS storage_usage
+                 (user_id INTEGER PRIMARY KEY,
+                  bytes_used INTEGER DEFAULT 0,
+                  file_count INTEGER DEFAULT 0,
+                  quota_bytes INTEGER,
+                  updated_at TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
     conn.commit()
 
+    # 低库存集合在库存写入时增量维护，升级前已有的物品在启动时按当前数量全量校正一次
+    # （在函数内导入，避免与依赖本模块的 inventory_management、cloud_storage 循环导入）
+    # 同理，存储用量计数器按 files 表和磁盘上的实际文件对账一次，升级前上传的文件由此计入配额
+    from modules import cloud_storage, inventory_management
+    inventory_management.rebuild_low_stock_items()
+    cloud_storage.reconcile_storage_usage(fix=True)
+
 def get_user(username):
     """
     根据用户名获取用户信息
@@ -12,6 +12,8 @@
 # utils/security.py
 
 import bcrypt
+import hashlib
+import hmac
 import secrets
 
 def hash_password(password):
@@ -23,6 +25,12 @@ def verify_password(password, hashed_password):
 def generate_token():
     return secrets.token_urlsafe(32)
 
+def sign_message(message, key):
+    return hmac.new(key.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def verify_signature(message, key, signature):
+    return hmac.compare_digest(sign_message(message, key), signature)
+
 def encrypt_data(data, key):
     # 这里应该实现实际的加密逻辑
     # 为了简单起见,我们只返回原始数据